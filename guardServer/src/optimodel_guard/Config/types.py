@@ -0,0 +1,51 @@
+import os
+
+"""
+Max number of texts we run through a model guard in a single forward pass, and how long
+(in milliseconds) we wait to fill up a batch before running whatever we have
+"""
+GUARD_BATCH_MAX_SIZE = int(os.environ.get("OPTIMODEL_GUARD_BATCH_MAX_SIZE", "32"))
+GUARD_BATCH_MAX_WAIT_MS = float(
+    os.environ.get("OPTIMODEL_GUARD_BATCH_MAX_WAIT_MS", "5")
+)
+
+"""
+Max number of (session, message) scores we remember for guards that only score messages
+they haven't seen before in a session
+"""
+GUARD_SEEN_MESSAGES_MAX_SIZE = int(
+    os.environ.get("OPTIMODEL_GUARD_SEEN_MESSAGES_MAX_SIZE", "100000")
+)
+
+"""
+Comma separated list of guard names to load at startup (or "all"), every other guard is
+loaded the first time it is used. Usually set via `optimodel-guard --guards`
+"""
+GUARDS_TO_LOAD = [
+    guardName.strip()
+    for guardName in os.environ.get("OPTIMODEL_GUARDS", "").split(",")
+    if guardName.strip()
+]
+
+"""
+Max number of compiled regex patterns (single and combined) the regex guard keeps around
+"""
+GUARD_REGEX_CACHE_SIZE = int(os.environ.get("OPTIMODEL_GUARD_REGEX_CACHE_SIZE", "1024"))
+
+"""
+Number of worker processes the presidio guard analyzes text in. Each worker loads its own
+copy of the spaCy/Presidio NER models (hundreds of MB each), so raise this with care.
+0 analyzes in the server process
+"""
+PRESIDIO_WORKERS = int(os.environ.get("OPTIMODEL_PRESIDIO_WORKERS", "2"))
+
+"""
+Max memory (in bytes) used to cache guard verdicts by content hash, and how long (in
+seconds) to keep each one. Set the size to 0 to disable the cache
+"""
+GUARD_VERDICT_CACHE_MAX_BYTES = int(
+    os.environ.get("OPTIMODEL_GUARD_VERDICT_CACHE_MAX_BYTES", str(64 * 1024 * 1024))
+)
+GUARD_VERDICT_CACHE_TTL_SECONDS = float(
+    os.environ.get("OPTIMODEL_GUARD_VERDICT_CACHE_TTL_SECONDS", "3600")
+)
@@ -1,4 +1,5 @@
-from typing import Dict, Any
+from typing import Dict, Any, List, Literal
+from optimodel_types import ModelMessage
 from optimodel_types.providerTypes import QueryParams, QueryResponse
 from pydantic import BaseModel
 
@@ -13,6 +14,26 @@ class GuardBaseClass:
     Common interface for all guards to implement
     """
 
+    """
+    If verdicts for this guard can be cached by content hash (see VerdictCache). Only
+    worth it for guards that cost more than hashing the text
+    """
+    verdictCacheable: bool = True
+
+    def load(self):
+        """
+        Load any models or other heavy resources the guard needs. Called once, the first
+        time the guard is used (or at startup if it's in the OPTIMODEL_GUARDS list)
+        """
+        pass
+
+    def warmup(self):
+        """
+        Run the guard once on dummy input after loading, so the first real request
+        doesn't pay for lazy initialization
+        """
+        pass
+
     def handlePreQuery(self, query: QueryParams) -> GuardEvalResponse:
         """
         Handle a pre-query event.
@@ -34,3 +55,73 @@ class GuardBaseClass:
         @NOTE This is only called for postQuery guards
         """
         pass
+
+    def evaluate(
+        self,
+        messagesRaw: List[str],
+        config: Any,
+        role: Literal["user", "assistant"],
+        sessionId: str | None = None,
+    ) -> GuardEvalResponse:
+        """
+        Evaluate the guard against text that has already been extracted for the role.
+        Used by the batch endpoint so we only extract text from the messages once
+
+        @param sessionId: The session the messages belong to, if the caller passed one
+
+        @NOTE This is called for both preQuery (role=user) and postQuery (role=assistant)
+        """
+        raise NotImplementedError()
+
+    async def evaluateAsync(
+        self,
+        messagesRaw: List[str],
+        config: Any,
+        role: Literal["user", "assistant"],
+        sessionId: str | None = None,
+    ) -> GuardEvalResponse:
+        """
+        Async version of evaluate, this is what the endpoints call. Guards that run a model
+        should override this (e.g. to batch inference across requests), cheap guards can
+        rely on the default that just calls evaluate
+        """
+        return self.evaluate(messagesRaw, config, role, sessionId)
+
+    def perMessageVerdicts(self, config: Any) -> bool:
+        """
+        If the verdict for a list of messages can be built from the verdict for each
+        message on its own (see combineVerdicts). Lets the verdict cache only check the
+        new turns of a conversation
+        """
+        return False
+
+    def combineVerdicts(self, verdicts: List[GuardEvalResponse]) -> GuardEvalResponse:
+        """
+        Merge per message verdicts into one, by default the first failure wins
+        """
+        for verdict in verdicts:
+            if verdict.failure:
+                return verdict
+        return GuardEvalResponse(failure=False, metadata={})
+
+    @staticmethod
+    def extractMessagesRaw(
+        messages: List[ModelMessage], role: Literal["user", "assistant"]
+    ) -> List[str]:
+        """
+        Extract all the text content for messages with the given role
+        """
+        relatedMessages = [message for message in messages if message.role == role]
+        messagesRaw = []
+
+        for message in relatedMessages:
+            if isinstance(message.content, str):
+                messagesRaw.append(message.content)
+            else:
+                for entry in message.content:
+                    if isinstance(entry, str):
+                        messagesRaw.append(entry)
+                    elif entry.type == "text":
+                        messagesRaw.append(entry.text)
+
+        return messagesRaw
@@ -0,0 +1,115 @@
+import asyncio
+import importlib
+import logging
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from optimodel_guard.Guards.GuardBaseClass import GuardBaseClass
+from optimodel_guard.Utils.Memory import getTotalRSSBytes
+
+
+logger = logging.getLogger(__name__)
+
+
+class GuardRegistry:
+    """
+    Maps guard names to guard instances, importing and loading each guard (and its
+    models) the first time it is used instead of at import time. That way a deployment
+    that only uses e.g. the regex guard never pays for torch or spaCy.
+
+    Loads are serialized behind a single lock, which also keeps the per guard memory
+    numbers we report meaningful. These include any worker processes a guard starts
+    """
+
+    def __init__(self, guardClasses: Dict[str, Tuple[str, str]]):
+        """
+        @param guardClasses: Map of guard name to (module path, class name)
+        """
+        self.guardClasses = guardClasses
+        self.guards: Dict[str, GuardBaseClass] = {}
+        self.loadStats: Dict[str, dict] = {}
+        self.lock = threading.Lock()
+
+    def __getitem__(self, guardName: str) -> GuardBaseClass:
+        guard = self.guards.get(guardName)
+        if guard is not None:
+            return guard
+        return self.load(guardName)
+
+    def __contains__(self, guardName: str) -> bool:
+        return guardName in self.guardClasses
+
+    async def getAsync(self, guardName: str) -> GuardBaseClass:
+        """
+        Same as [guardName], but loads off the event loop so a guard that is loading
+        doesn't stall requests for guards that are already loaded
+        """
+        guard = self.guards.get(guardName)
+        if guard is not None:
+            return guard
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.load, guardName
+        )
+
+    def load(self, guardName: str) -> GuardBaseClass:
+        """
+        Import, instantiate and load a guard if we haven't already
+        """
+        if guardName not in self.guardClasses:
+            raise KeyError(guardName)
+
+        with self.lock:
+            guard = self.guards.get(guardName)
+            if guard is not None:
+                return guard
+
+            logger.info(f"Loading guard {guardName}...")
+            rssBefore = getTotalRSSBytes()
+            startTime = time.perf_counter()
+            try:
+                modulePath, className = self.guardClasses[guardName]
+                guard = getattr(importlib.import_module(modulePath), className)()
+                guard.load()
+            except Exception as e:
+                logger.error(f"Error loading guard {guardName}: {e}")
+                self.loadStats[guardName] = {"error": str(e)}
+                raise
+
+            self.loadStats[guardName] = {
+                "loadTimeSeconds": time.perf_counter() - startTime,
+                "rssBytes": getTotalRSSBytes() - rssBefore,
+            }
+            self.guards[guardName] = guard
+            logger.info(
+                f"Loaded guard {guardName} in {self.loadStats[guardName]['loadTimeSeconds']:.2f}s"
+            )
+            return guard
+
+    def loadAll(self, guardNames: List[str] | None = None):
+        """
+        Eagerly load the given guards, or all of them if none are passed (or "all" is)
+        """
+        if not guardNames or "all" in guardNames:
+            guardNames = list(self.guardClasses.keys())
+        for guardName in guardNames:
+            self.load(guardName)
+
+    def warmup(self, guardName: str):
+        """
+        Load the guard and run it once so the first real request doesn't pay for any
+        lazy initialization inside the model libraries
+        """
+        guard = self.load(guardName)
+        startTime = time.perf_counter()
+        guard.warmup()
+        self.loadStats[guardName]["warmupTimeSeconds"] = time.perf_counter() - startTime
+
+    def status(self) -> Dict[str, dict]:
+        return {
+            guardName: {
+                "loaded": guardName in self.guards,
+                **self.loadStats.get(guardName, {}),
+            }
+            for guardName in self.guardClasses
+        }
@@ -1,18 +1,73 @@
+import hashlib
 import logging
-from typing import List, Literal
+from typing import Dict, List, Literal, Tuple
 
+from optimodel_guard.Config.types import (
+    GUARD_BATCH_MAX_SIZE,
+    GUARD_BATCH_MAX_WAIT_MS,
+    GUARD_SEEN_MESSAGES_MAX_SIZE,
+)
 from optimodel_guard.Guards.GuardBaseClass import GuardBaseClass, GuardEvalResponse
+from optimodel_guard.Utils.LRUCache import LRUCache
+from optimodel_guard.Utils.MicroBatcher import MicroBatcher
 from optimodel_types import LLamaPromptGuardConfig, ModelMessage
 from optimodel_types.providerTypes import QueryParams, QueryResponse
 
+import torch
 from transformers import pipeline
 
 
 logger = logging.getLogger(__name__)
 
+"""
+Number of tokens consecutive windows share when chunking, so an injection that straddles
+a window boundary is still seen whole by one of them
+"""
+DEFAULT_CHUNK_OVERLAP = 64
+
 
 class LLamaPromptGuard(GuardBaseClass):
-    classifier = pipeline("text-classification", model="meta-llama/Prompt-Guard-86M")
+    classifier = None
+
+    def __init__(self):
+        """
+        Concurrent requests are collected and run through the classifier together
+        """
+        self.batcher = MicroBatcher(
+            self._classifyBatch,
+            maxBatchSize=GUARD_BATCH_MAX_SIZE,
+            maxWaitMs=GUARD_BATCH_MAX_WAIT_MS,
+            name="llama-prompt-guard",
+        )
+        self.chunkBatcher = MicroBatcher(
+            self._scoreMessagesBatch,
+            maxBatchSize=GUARD_BATCH_MAX_SIZE,
+            maxWaitMs=GUARD_BATCH_MAX_WAIT_MS,
+            name="llama-prompt-guard-chunks",
+        )
+
+        """
+        Scores of messages we've already seen per session, for onlyNewMessages
+        """
+        self.seenMessages = LRUCache(maxSize=GUARD_SEEN_MESSAGES_MAX_SIZE)
+
+    def load(self):
+        self.classifier = pipeline(
+            "text-classification", model="meta-llama/Prompt-Guard-86M"
+        )
+
+        """
+        Max tokens the model accepts in one pass, some tokenizers report a huge sentinel
+        value for model_max_length so we also cap by the model's position embeddings
+        """
+        self.maxLength = min(
+            self.classifier.tokenizer.model_max_length,
+            getattr(self.classifier.model.config, "max_position_embeddings", 512),
+        )
+
+    def warmup(self):
+        self._classifyBatch(["Hello world"])
+        self._scoreMessagesBatch([(["Hello world"], DEFAULT_CHUNK_OVERLAP)])
 
     def handlePreQuery(
         self, messages: List[ModelMessage], config: LLamaPromptGuardConfig
@@ -35,22 +90,243 @@ class LLamaPromptGuard(GuardBaseClass):
         """
         Extract any instructions from the query that the user has given.
         """
-        relatedMessages = [message for message in messages if message.role == role]
-        messagesRaw = []
+        return self.evaluate(self.extractMessagesRaw(messages, role), config, role)
 
-        for message in relatedMessages:
-            if isinstance(message.content, str):
-                messagesRaw.append(message.content)
-            else:
-                for entry in message.content:
-                    if isinstance(entry, str):
-                        messagesRaw.append(entry)
-                    elif entry.type == "text":
-                        messagesRaw.append(entry.text)
+    def evaluate(
+        self,
+        messagesRaw: List[str],
+        config: LLamaPromptGuardConfig,
+        role: Literal["user", "assistant"],
+        sessionId: str | None = None,
+    ) -> GuardEvalResponse:
+        if self._useChunking(config):
+            knownScores, newMessages = self._lookupSeenMessages(
+                messagesRaw, config, role, sessionId
+            )
+            newScores = []
+            if newMessages:
+                newScores = self._scoreMessagesBatch(
+                    [(newMessages, self._chunkOverlap(config))]
+                )[0]
+                self._rememberScores(newMessages, newScores, config, role, sessionId)
+            return self._checkMessageScores([*knownScores, *newScores], config, role)
 
         messages = ",".join(messagesRaw)
         results = self.classifier(messages)
+        return self._checkResults(results, config, role)
+
+    async def evaluateAsync(
+        self,
+        messagesRaw: List[str],
+        config: LLamaPromptGuardConfig,
+        role: Literal["user", "assistant"],
+        sessionId: str | None = None,
+    ) -> GuardEvalResponse:
+        if self._useChunking(config):
+            knownScores, newMessages = self._lookupSeenMessages(
+                messagesRaw, config, role, sessionId
+            )
+            newScores = []
+            if newMessages:
+                newScores = await self.chunkBatcher.submit(
+                    (newMessages, self._chunkOverlap(config))
+                )
+                self._rememberScores(newMessages, newScores, config, role, sessionId)
+            return self._checkMessageScores([*knownScores, *newScores], config, role)
+
+        messages = ",".join(messagesRaw)
+        results = await self.batcher.submit(messages)
+        return self._checkResults(results, config, role)
+
+    def _classifyBatch(self, texts: List[str]) -> List[List[dict]]:
+        """
+        Run a single forward pass over all the texts. The pipeline returns one top label
+        per text for a list input, wrap each so it matches the single text output
+        """
+        outputs = self.classifier(texts, batch_size=len(texts))
+        return [output if isinstance(output, list) else [output] for output in outputs]
+
+    def perMessageVerdicts(self, config: LLamaPromptGuardConfig) -> bool:
+        """
+        In chunking mode every message is scored on its own, and the thresholds are
+        checked against the max score across messages
+        """
+        return self._useChunking(config)
+
+    def combineVerdicts(self, verdicts: List[GuardEvalResponse]) -> GuardEvalResponse:
+        """
+        Same precedence as _checkResults, injection before jailbreak, highest score wins
+        """
+        for scoreKey in ["injectionScore", "jailbreakScore"]:
+            failures = [
+                verdict
+                for verdict in verdicts
+                if verdict.failure and scoreKey in (verdict.metadata or {})
+            ]
+            if failures:
+                return max(failures, key=lambda verdict: verdict.metadata[scoreKey])
+        return GuardEvalResponse(failure=False, metadata={})
+
+    @staticmethod
+    def _useChunking(config: LLamaPromptGuardConfig) -> bool:
+        return config.chunking is True or config.onlyNewMessages is True
+
+    @staticmethod
+    def _chunkOverlap(config: LLamaPromptGuardConfig) -> int:
+        if config.chunkOverlap is None:
+            return DEFAULT_CHUNK_OVERLAP
+        return max(0, config.chunkOverlap)
+
+    def _buildWindows(self, text: str, overlap: int) -> List[List[int]]:
+        """
+        Tokenize the text once and split it into overlapping windows that each fit in the
+        model (including its special tokens)
+        """
+        tokenizer = self.classifier.tokenizer
+        tokenIds = tokenizer(text, add_special_tokens=False, verbose=False)[
+            "input_ids"
+        ]
+        if len(tokenIds) == 0:
+            return []
+
+        windowSize = self.maxLength - tokenizer.num_special_tokens_to_add()
+        stride = max(1, windowSize - min(overlap, windowSize - 1))
+
+        windows = []
+        start = 0
+        while True:
+            windows.append(
+                tokenizer.build_inputs_with_special_tokens(
+                    tokenIds[start : start + windowSize]
+                )
+            )
+            if start + windowSize >= len(tokenIds):
+                break
+            start += stride
+        return windows
+
+    def _scoreMessagesBatch(
+        self, items: List[Tuple[List[str], int]]
+    ) -> List[List[Dict[str, float]]]:
+        """
+        Score every message of every item, where an item is (messages, overlap). All the
+        windows are run through the model together (in batches of GUARD_BATCH_MAX_SIZE)
+        and each message gets the max score per label across its windows
+        """
+        tokenizer = self.classifier.tokenizer
+        model = self.classifier.model
+        id2label = model.config.id2label
+
+        windows = []
+        owners = []
+        results = []
+        for itemIndex, (messages, overlap) in enumerate(items):
+            results.append([{} for _ in messages])
+            for messageIndex, message in enumerate(messages):
+                for window in self._buildWindows(message, overlap):
+                    windows.append(window)
+                    owners.append((itemIndex, messageIndex))
+
+        for start in range(0, len(windows), GUARD_BATCH_MAX_SIZE):
+            encoded = tokenizer.pad(
+                {"input_ids": windows[start : start + GUARD_BATCH_MAX_SIZE]},
+                return_tensors="pt",
+            )
+            encoded = {key: value.to(model.device) for key, value in encoded.items()}
+            with torch.no_grad():
+                probabilities = torch.softmax(model(**encoded).logits, dim=-1).tolist()
+
+            for (itemIndex, messageIndex), scores in zip(
+                owners[start : start + GUARD_BATCH_MAX_SIZE], probabilities
+            ):
+                messageScores = results[itemIndex][messageIndex]
+                for labelIndex, score in enumerate(scores):
+                    label = id2label[labelIndex]
+                    messageScores[label] = max(score, messageScores.get(label, 0))
+
+        return results
+
+    @staticmethod
+    def _seenMessageKey(
+        message: str, role: Literal["user", "assistant"], sessionId: str, overlap: int
+    ) -> Tuple[str, str, int, str]:
+        return (
+            sessionId,
+            role,
+            overlap,
+            hashlib.sha256(message.encode("utf-8")).hexdigest(),
+        )
+
+    def _lookupSeenMessages(
+        self,
+        messagesRaw: List[str],
+        config: LLamaPromptGuardConfig,
+        role: Literal["user", "assistant"],
+        sessionId: str | None,
+    ) -> Tuple[List[Dict[str, float]], List[str]]:
+        """
+        Split messages into scores we already have for this session, and messages we
+        still need to score
+        """
+        if not config.onlyNewMessages or sessionId is None:
+            return [], messagesRaw
 
+        overlap = self._chunkOverlap(config)
+        knownScores = []
+        newMessages = []
+        for message in messagesRaw:
+            scores = self.seenMessages.get(
+                self._seenMessageKey(message, role, sessionId, overlap)
+            )
+            if scores is None:
+                newMessages.append(message)
+            else:
+                knownScores.append(scores)
+        return knownScores, newMessages
+
+    def _rememberScores(
+        self,
+        messages: List[str],
+        scores: List[Dict[str, float]],
+        config: LLamaPromptGuardConfig,
+        role: Literal["user", "assistant"],
+        sessionId: str | None,
+    ):
+        if not config.onlyNewMessages or sessionId is None:
+            return
+
+        overlap = self._chunkOverlap(config)
+        for message, messageScores in zip(messages, scores):
+            self.seenMessages.set(
+                self._seenMessageKey(message, role, sessionId, overlap), messageScores
+            )
+
+    def _checkMessageScores(
+        self,
+        scores: List[Dict[str, float]],
+        config: LLamaPromptGuardConfig,
+        role: Literal["user", "assistant"],
+    ) -> GuardEvalResponse:
+        """
+        Take the max score per label across all messages and check it like a regular
+        classifier result
+        """
+        maxScores: Dict[str, float] = {}
+        for messageScores in scores:
+            for label, score in messageScores.items():
+                maxScores[label] = max(score, maxScores.get(label, 0))
+        return self._checkResults(
+            [{"label": label, "score": score} for label, score in maxScores.items()],
+            config,
+            role,
+        )
+
+    def _checkResults(
+        self,
+        results: List[dict],
+        config: LLamaPromptGuardConfig,
+        role: Literal["user", "assistant"],
+    ) -> GuardEvalResponse:
         # Pull out `INJECTION` and/or `JAILBREAK` from the response
         injectionList = [
             result["score"] for result in results if result["label"] == "INJECTION"
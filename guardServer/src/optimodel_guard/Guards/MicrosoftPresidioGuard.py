@@ -1,11 +1,13 @@
+import asyncio
 import logging
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from typing import List, Literal
 
+from optimodel_guard.Config.types import PRESIDIO_WORKERS
+from optimodel_guard.Guards import PresidioWorker
 from optimodel_guard.Guards.GuardBaseClass import GuardBaseClass, GuardEvalResponse
 from optimodel_types import MicrosoftPresidioConfig, ModelMessage
-from presidio_analyzer import AnalyzerEngine
-from presidio_analyzer.nlp_engine import TransformersNlpEngine
-from presidio_anonymizer import AnonymizerEngine
 
 
 logger = logging.getLogger(__name__)
@@ -22,9 +24,44 @@ class MicrosoftPresidioGuard(GuardBaseClass):
             },
         }
     ]
-    presidioNLPEngine = TransformersNlpEngine(models=model_config)
-    presidioAnalyzer = AnalyzerEngine(nlp_engine=presidioNLPEngine)
-    presidioAnonymizer = AnonymizerEngine()
+    executor: Executor | None = None
+
+    def load(self):
+        """
+        Analysis runs in a pool of worker processes (spawned, so they don't inherit the
+        server's event loop or torch state), each with its own copy of the models. With
+        PRESIDIO_WORKERS=0 we load them here and analyze on a single thread instead.
+
+        The models are downloaded here first, then every worker is started (and loads
+        them) before we return, so --init and OPTIMODEL_GUARDS preload them like any
+        other guard and the first request doesn't pay for it
+        """
+        if PRESIDIO_WORKERS > 0:
+            PresidioWorker.downloadModels(self.model_config)
+            self.executor = ProcessPoolExecutor(
+                max_workers=PRESIDIO_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=PresidioWorker.initWorker,
+                initargs=(self.model_config,),
+            )
+            self.warmup()
+        else:
+            PresidioWorker.initWorker(self.model_config)
+            self.executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="optimodel-presidio"
+            )
+
+    def warmup(self):
+        """
+        Run a job per worker. Submitting them all at once to an idle pool starts (and
+        loads the models in) every worker process
+        """
+        futures = [
+            self.executor.submit(PresidioWorker.analyzeText, "Hello world", ())
+            for _ in range(max(1, PRESIDIO_WORKERS))
+        ]
+        for future in futures:
+            future.result()
 
     def handlePreQuery(
         self, messages: List[ModelMessage], config: MicrosoftPresidioConfig
@@ -47,31 +84,58 @@ class MicrosoftPresidioGuard(GuardBaseClass):
         """
         Extract any instructions from the query that the user has given.
         """
-        relatedMessages = [message for message in messages if message.role == role]
-        messagesRaw = []
-
-        for message in relatedMessages:
-            if isinstance(message.content, str):
-                messagesRaw.append(message.content)
-            else:
-                for entry in message.content:
-                    if isinstance(entry, str):
-                        messagesRaw.append(entry)
-                    elif entry.type == "text":
-                        messagesRaw.append(entry.text)
+        return self.evaluate(self.extractMessagesRaw(messages, role), config, role)
 
+    def evaluate(
+        self,
+        messagesRaw: List[str],
+        config: MicrosoftPresidioConfig,
+        role: Literal["user", "assistant"],
+        sessionId: str | None = None,
+    ) -> GuardEvalResponse:
         messages = ",".join(messagesRaw)
+        entitiesFound = self.executor.submit(
+            PresidioWorker.analyzeText, messages, self._entities(config)
+        ).result()
+        return self._checkEntities(entitiesFound)
 
-        # Now analyze with presidio
-        results = self.presidioAnalyzer.analyze(
-            text=messages, language="en", entities=config.entitiesToCheck
+    async def evaluateAsync(
+        self,
+        messagesRaw: List[str],
+        config: MicrosoftPresidioConfig,
+        role: Literal["user", "assistant"],
+        sessionId: str | None = None,
+    ) -> GuardEvalResponse:
+        messages = ",".join(messagesRaw)
+        entitiesFound = await asyncio.get_running_loop().run_in_executor(
+            self.executor, PresidioWorker.analyzeText, messages, self._entities(config)
         )
+        return self._checkEntities(entitiesFound)
+
+    def perMessageVerdicts(self, config: MicrosoftPresidioConfig) -> bool:
+        return True
+
+    def combineVerdicts(self, verdicts: List[GuardEvalResponse]) -> GuardEvalResponse:
+        entitiesFound = [
+            entity
+            for verdict in verdicts
+            for entity in (verdict.metadata or {}).get("entitiesFound", [])
+        ]
+        return self._checkEntities(entitiesFound)
+
+    @staticmethod
+    def _entities(config: MicrosoftPresidioConfig) -> tuple:
+        """
+        Sorted so the same set of entities always maps to the same cached analyzer
+        """
+        return tuple(sorted(set(config.entitiesToCheck)))
 
-        if len(results) > 0:
-            logger.info(f"Found entities in microsoft presidio: {results}")
+    def _checkEntities(self, entitiesFound: List[str]) -> GuardEvalResponse:
+        if len(entitiesFound) > 0:
+            logger.info(f"Found entities in microsoft presidio: {entitiesFound}")
             return GuardEvalResponse(
                 failure=True,
-                metadata={"entitiesFound": [x.entity_type for x in results]},
+                metadata={"entitiesFound": entitiesFound},
             )
 
         return GuardEvalResponse(failure=False, metadata={})
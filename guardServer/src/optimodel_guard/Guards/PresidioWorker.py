@@ -0,0 +1,113 @@
+import logging
+from typing import List, Tuple
+
+import spacy
+from huggingface_hub import snapshot_download
+from presidio_analyzer import AnalyzerEngine, RecognizerRegistry
+from presidio_analyzer.nlp_engine import NlpArtifacts, TransformersNlpEngine
+from presidio_analyzer.predefined_recognizers import SpacyRecognizer
+
+from optimodel_guard.Utils.LRUCache import LRUCache
+
+
+logger = logging.getLogger(__name__)
+
+"""
+Everything presidio needs, loaded once per worker process by initWorker. These are
+module level so the functions we send to the process pool stay picklable
+"""
+nlpEngine: TransformersNlpEngine | None = None
+predefinedRegistry: RecognizerRegistry | None = None
+fullAnalyzer: AnalyzerEngine | None = None
+blankTokenizer = None
+
+"""
+Map of sorted entity tuple to (analyzer, whether it needs the NER model)
+"""
+entityAnalyzers = LRUCache(maxSize=128)
+
+
+def downloadModels(modelConfig: List[dict]):
+    """
+    Download (without loading) the spaCy and transformers models, so the worker
+    processes don't all race to download them the first time they start
+    """
+    for model in modelConfig:
+        spacyModel = model["model_name"]["spacy"]
+        if not spacy.util.is_package(spacyModel):
+            spacy.cli.download(spacyModel)
+        snapshot_download(model["model_name"]["transformers"])
+
+
+def initWorker(modelConfig: List[dict]):
+    """
+    Load the NLP engine and recognizers for this process
+    """
+    global nlpEngine, predefinedRegistry, fullAnalyzer, blankTokenizer
+
+    nlpEngine = TransformersNlpEngine(models=modelConfig)
+    fullAnalyzer = AnalyzerEngine(nlp_engine=nlpEngine)
+
+    predefinedRegistry = RecognizerRegistry(supported_languages=["en"])
+    predefinedRegistry.load_predefined_recognizers(nlp_engine=nlpEngine, languages=["en"])
+
+    """
+    Pattern based recognizers only need tokens (for context words), not NER
+    """
+    blankTokenizer = spacy.blank("en")
+
+
+def getAnalyzer(entities: Tuple[str, ...]) -> Tuple[AnalyzerEngine, bool]:
+    """
+    Get an analyzer whose registry only has the recognizers for the given entities,
+    and whether any of those recognizers needs the NER model
+    """
+    if len(entities) == 0:
+        return fullAnalyzer, True
+
+    cached = entityAnalyzers.get(entities)
+    if cached is not None:
+        return cached
+
+    recognizers = predefinedRegistry.get_recognizers(
+        language="en", entities=list(entities)
+    )
+    analyzer = AnalyzerEngine(
+        registry=RecognizerRegistry(recognizers=recognizers, supported_languages=["en"]),
+        nlp_engine=nlpEngine,
+    )
+    needsNER = any(isinstance(x, SpacyRecognizer) for x in recognizers)
+    entityAnalyzers.set(entities, (analyzer, needsNER))
+    return analyzer, needsNER
+
+
+def buildPatternOnlyArtifacts(text: str) -> NlpArtifacts:
+    """
+    NLP artifacts from just tokenizing the text, passing these to the analyzer skips
+    running the NER model. Lower cased tokens stand in for lemmas for context words
+    """
+    tokens = blankTokenizer(text)
+    return NlpArtifacts(
+        entities=[],
+        tokens=tokens,
+        tokens_indices=[token.idx for token in tokens],
+        lemmas=[token.lower_ for token in tokens],
+        nlp_engine=nlpEngine,
+        language="en",
+    )
+
+
+def analyzeText(text: str, entities: Tuple[str, ...]) -> List[str]:
+    """
+    Analyze the text for the given entities (or all of them if empty)
+
+    @return The entity type of every result found
+    """
+    analyzer, needsNER = getAnalyzer(entities)
+    results = analyzer.analyze(
+        text=text,
+        language="en",
+        entities=list(entities) if entities else None,
+        nlp_artifacts=None if needsNER else buildPatternOnlyArtifacts(text),
+    )
+    return [result.entity_type for result in results]
@@ -1,8 +1,9 @@
 import logging
 import re
-from typing import List, Literal
-
+from functools import lru_cache
+from typing import Dict, List, Literal, Tuple
 
+from optimodel_guard.Config.types import GUARD_REGEX_CACHE_SIZE
 from optimodel_guard.Guards.GuardBaseClass import GuardBaseClass, GuardEvalResponse
 from optimodel_types import (
     LytixRegexConfig,
@@ -14,6 +15,12 @@ logger = logging.getLogger(__name__)
 
 
 class LytixRegexGuard(GuardBaseClass):
+    """
+    Running the (cached) compiled patterns is about as cheap as hashing the text
+    """
+
+    verdictCacheable = False
+
     def handlePreQuery(
         self, messages: List[ModelMessage], config: LytixRegexConfig
     ) -> bool:
@@ -35,32 +42,115 @@ class LytixRegexGuard(GuardBaseClass):
         """
         Extract any instructions from the query that the user has given.
         """
-        relatedMessages = [message for message in messages if message.role == role]
-        messagesRaw = []
-
-        for message in relatedMessages:
-            if isinstance(message.content, str):
-                messagesRaw.append(message.content)
-            else:
-                for entry in message.content:
-                    if isinstance(entry, str):
-                        messagesRaw.append(entry)
-                    elif entry.type == "text":
-                        messagesRaw.append(entry.text)
+        return self.evaluate(self.extractMessagesRaw(messages, role), config, role)
 
+    def evaluate(
+        self,
+        messagesRaw: List[str],
+        config: LytixRegexConfig,
+        role: Literal["user", "assistant"],
+        sessionId: str | None = None,
+    ) -> GuardEvalResponse:
         messages = ",".join(messagesRaw)
 
-        try:
-            pattern = re.compile(config.regex)
-            match = pattern.search(messages)
-        except re.error as e:
-            logger.error(f"Error compiling regex pattern: {e}")
-            return GuardEvalResponse(failure=False, metadata={})
+        """
+        The original single regex is treated as just another (unnamed) pattern
+        """
+        patterns: List[Tuple[str, str, bool]] = []
+        if config.regex:
+            patterns.append((config.regex, config.regex, False))
+        for pattern in config.patterns or []:
+            patterns.append((pattern.name, pattern.regex, pattern.ignoreCase))
 
-        if match:
-            logger.info(f"Regex pattern matched: {match.group()}")
-            return GuardEvalResponse(failure=True, metadata={"matched": match.group()})
+        matches = self._findMatches(messages, patterns)
+        if matches:
+            logger.info(f"Regex patterns matched: {[x['name'] for x in matches]}")
+            return GuardEvalResponse(
+                failure=True,
+                metadata={"matched": matches[0]["match"], "matches": matches},
+            )
         else:
             logger.info("No match found for the regex pattern.")
 
         return GuardEvalResponse(failure=False, metadata={})
+
+    def _findMatches(
+        self, text: str, patterns: List[Tuple[str, str, bool]]
+    ) -> List[Dict[str, str]]:
+        """
+        Find the first match of every pattern in the text.
+
+        We first run one combined alternation of every pattern over the text, which finds
+        nothing iff no pattern matches, so clean text (the common case) only takes a
+        single pass. If something did match, the patterns the combined pass didn't
+        report (e.g. shadowed by an overlapping match) are checked one by one
+        """
+        validPatterns = []
+        for name, regex, ignoreCase in patterns:
+            try:
+                compilePattern(regex, re.IGNORECASE if ignoreCase else 0)
+                validPatterns.append((name, regex, ignoreCase))
+            except re.error as e:
+                logger.error(f"Error compiling regex pattern {name}: {e}")
+
+        if len(validPatterns) == 0:
+            return []
+
+        firstMatches: Dict[int, str] = {}
+        combined = compileCombinedPattern(
+            tuple((regex, ignoreCase) for _, regex, ignoreCase in validPatterns)
+        )
+        if combined is not None:
+            for match in combined.finditer(text):
+                patternIndex = int(match.lastgroup[len(GROUP_PREFIX) :])
+                firstMatches.setdefault(patternIndex, match.group())
+            if len(firstMatches) == 0:
+                return []
+
+        for patternIndex, (_, regex, ignoreCase) in enumerate(validPatterns):
+            if patternIndex in firstMatches:
+                continue
+            match = compilePattern(
+                regex, re.IGNORECASE if ignoreCase else 0
+            ).search(text)
+            if match:
+                firstMatches[patternIndex] = match.group()
+
+        return [
+            {"name": validPatterns[patternIndex][0], "match": firstMatches[patternIndex]}
+            for patternIndex in sorted(firstMatches)
+        ]
+
+
+GROUP_PREFIX = "lytix_pattern_"
+
+
+@lru_cache(maxsize=GUARD_REGEX_CACHE_SIZE)
+def compilePattern(regex: str, flags: int) -> re.Pattern:
+    return re.compile(regex, flags)
+
+
+@lru_cache(maxsize=GUARD_REGEX_CACHE_SIZE)
+def compileCombinedPattern(patterns: Tuple[Tuple[str, bool], ...]) -> re.Pattern | None:
+    """
+    Combine (regex, ignoreCase) patterns into one alternation, with a named group per
+    pattern so we know which one matched. Case insensitivity is scoped to each pattern.
+
+    @return None if the patterns can't be combined (e.g. they reuse group names, use
+        numbered backreferences or global inline flags), callers check them one by one
+    """
+    """
+    Numbered groups inside a pattern shift once it's nested in the combined pattern, so
+    backreferences like \\1 would silently change meaning
+    """
+    if any(re.search(r"\\[1-9]", regex) for regex, _ in patterns):
+        return None
+
+    alternatives = [
+        f"(?P<{GROUP_PREFIX}{index}>{'(?i:' + regex + ')' if ignoreCase else regex})"
+        for index, (regex, ignoreCase) in enumerate(patterns)
+    ]
+    try:
+        return re.compile("|".join(alternatives))
+    except re.error:
+        return None
@@ -1,9 +1,19 @@
-from .LLamaPromptGuard import LLamaPromptGuard
-from .RegexGuard import LytixRegexGuard
-from .MicrosoftPresidioGuard import MicrosoftPresidioGuard
+from .GuardBaseClass import GuardBaseClass, GuardEvalResponse
+from .GuardRegistry import GuardRegistry
 
-GuardMapping = {
-    "META_LLAMA_PROMPT_GUARD_86M": LLamaPromptGuard(),
-    "LYTIX_REGEX_GUARD": LytixRegexGuard(),
-    "MICROSOFT_PRESIDIO_GUARD": MicrosoftPresidioGuard(),
-}
+"""
+Guards are imported and loaded the first time they're used, see GuardRegistry
+"""
+GuardMapping = GuardRegistry(
+    {
+        "META_LLAMA_PROMPT_GUARD_86M": (
+            "optimodel_guard.Guards.LLamaPromptGuard",
+            "LLamaPromptGuard",
+        ),
+        "LYTIX_REGEX_GUARD": ("optimodel_guard.Guards.RegexGuard", "LytixRegexGuard"),
+        "MICROSOFT_PRESIDIO_GUARD": (
+            "optimodel_guard.Guards.MicrosoftPresidioGuard",
+            "MicrosoftPresidioGuard",
+        ),
+    }
+)
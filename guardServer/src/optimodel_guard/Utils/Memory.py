@@ -0,0 +1,55 @@
+import os
+import resource
+import sys
+
+
+def getRSSBytes() -> int:
+    """
+    Current resident memory of this process in bytes. Read from /proc on linux, otherwise
+    fall back to the peak RSS from getrusage (which can only go up)
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            residentPages = int(statm.read().split()[1])
+        return residentPages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        maxRSS = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and kilobytes everywhere else
+        return maxRSS if sys.platform == "darwin" else maxRSS * 1024
+
+
+def getChildrenRSSBytes() -> int:
+    """
+    Current resident memory of our direct child processes in bytes, e.g. the presidio
+    worker processes. Only available on linux (0 elsewhere)
+    """
+    pid = os.getpid()
+    pageSize = os.sysconf("SC_PAGE_SIZE")
+    total = 0
+    try:
+        procEntries = os.listdir("/proc")
+    except OSError:
+        return 0
+    for entry in procEntries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as stat:
+                """
+                The process name can contain spaces, the fields we want come after it
+                """
+                fields = stat.read().rsplit(")", 1)[1].split()
+            if int(fields[1]) != pid:
+                continue
+            with open(f"/proc/{entry}/statm") as statm:
+                total += int(statm.read().split()[1]) * pageSize
+        except (OSError, ValueError, IndexError):
+            continue
+    return total
+
+
+def getTotalRSSBytes() -> int:
+    """
+    Resident memory of this process and its workers
+    """
+    return getRSSBytes() + getChildrenRSSBytes()
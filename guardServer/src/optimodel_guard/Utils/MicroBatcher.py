@@ -0,0 +1,114 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Generic, List, Tuple, TypeVar
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class MicroBatcher(Generic[T, R]):
+    """
+    Collects items submitted by concurrent requests for up to maxWaitMs (or until we have
+    maxBatchSize of them), then runs batchFn once over the whole batch in a worker thread
+    and hands each caller back its own result.
+
+    There is a single worker thread per batcher, so while one batch is running the next
+    one is filling up. That keeps the model busy with large batches under load, while a
+    lone request only pays maxWaitMs of extra latency
+    """
+
+    def __init__(
+        self,
+        batchFn: Callable[[List[T]], List[R]],
+        maxBatchSize: int,
+        maxWaitMs: float,
+        name: str = "batcher",
+    ):
+        """
+        @param batchFn: Blocking function that takes a list of items and returns a list
+            of results in the same order
+        @param maxBatchSize: Max number of items passed to batchFn at once
+        @param maxWaitMs: Max time to wait for more items once we have the first one
+        """
+        self.batchFn = batchFn
+        self.maxBatchSize = max(1, maxBatchSize)
+        self.maxWaitSeconds = max(0, maxWaitMs) / 1000
+        self.name = name
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix=f"optimodel-{name}"
+        )
+
+        """
+        Created lazily so they're bound to the loop we're actually running in
+        """
+        self.queue: asyncio.Queue | None = None
+        self.worker: asyncio.Task | None = None
+
+    async def submit(self, item: T) -> R:
+        """
+        Queue an item and wait for its result
+        """
+        loop = asyncio.get_running_loop()
+        if self.worker is None or self.worker.done():
+            self.queue = asyncio.Queue()
+            self.worker = loop.create_task(self._run())
+
+        future = loop.create_future()
+        self.queue.put_nowait((item, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+
+            """
+            Fill up the batch until we hit the max size or run out of time
+            """
+            deadline = loop.time() + self.maxWaitSeconds
+            while len(batch) < self.maxBatchSize:
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            """
+            Callers that went away (e.g. client disconnected) don't need a result
+            """
+            batch = [entry for entry in batch if not entry[1].done()]
+            if len(batch) == 0:
+                continue
+
+            await self._runBatch(loop, batch)
+
+    async def _runBatch(
+        self, loop: asyncio.AbstractEventLoop, batch: List[Tuple[T, asyncio.Future]]
+    ):
+        try:
+            results = await loop.run_in_executor(
+                self.executor, self.batchFn, [item for item, _ in batch]
+            )
+            if len(results) != len(batch):
+                raise ValueError(
+                    f"{self.name} returned {len(results)} results for {len(batch)} items"
+                )
+        except Exception as e:
+            logger.error(f"Error running {self.name} batch of {len(batch)}: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
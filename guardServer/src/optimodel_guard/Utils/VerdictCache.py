@@ -0,0 +1,172 @@
+import asyncio
+import copy
+import hashlib
+import json
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, List, Literal
+
+from optimodel_guard.Config.types import (
+    GUARD_VERDICT_CACHE_MAX_BYTES,
+    GUARD_VERDICT_CACHE_TTL_SECONDS,
+)
+from optimodel_guard.Guards.GuardBaseClass import GuardBaseClass, GuardEvalResponse
+
+
+"""
+Rough per entry overhead (key, tuple, dict slots) on top of the metadata itself
+"""
+ENTRY_OVERHEAD_BYTES = 256
+
+"""
+Config fields that only change what we do with a verdict, not the verdict itself
+"""
+NON_VERDICT_FIELDS = {"blockRequest", "blockRequestMessage", "guardType"}
+
+
+class VerdictCache:
+    """
+    Caches guard verdicts keyed by a hash of (guard name, guard config, role, text), so
+    the same system prompts and conversation prefixes aren't re-run through the models.
+
+    Guards that can be checked per message (see GuardBaseClass.perMessageVerdicts) are
+    cached per message, so only the new turns of a conversation are checked.
+
+    Bounded by an estimate of the memory used (LRU eviction) and a TTL per entry
+    """
+
+    def __init__(self, maxBytes: int, ttlSeconds: float | None):
+        self.maxBytes = maxBytes
+        self.ttlSeconds = ttlSeconds
+        self.currentBytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[str, tuple] = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def evaluate(
+        self,
+        guard: GuardBaseClass,
+        messagesRaw: List[str],
+        config: Any,
+        role: Literal["user", "assistant"],
+        sessionId: str | None = None,
+    ) -> GuardEvalResponse:
+        """
+        Same as guard.evaluateAsync, but served from the cache where possible
+        """
+        if self.maxBytes <= 0 or not guard.verdictCacheable:
+            return await guard.evaluateAsync(
+                messagesRaw, config, role, sessionId=sessionId
+            )
+
+        if not guard.perMessageVerdicts(config):
+            key = self.buildKey(config, role, messagesRaw)
+            verdict = self.get(key)
+            if verdict is None:
+                verdict = await guard.evaluateAsync(
+                    messagesRaw, config, role, sessionId=sessionId
+                )
+                self.set(key, verdict)
+            return verdict
+
+        keys = [self.buildKey(config, role, [message]) for message in messagesRaw]
+        verdicts = [self.get(key) for key in keys]
+        missing = [index for index, verdict in enumerate(verdicts) if verdict is None]
+        newVerdicts = await asyncio.gather(
+            *[
+                guard.evaluateAsync(
+                    [messagesRaw[index]], config, role, sessionId=sessionId
+                )
+                for index in missing
+            ]
+        )
+        for index, verdict in zip(missing, newVerdicts):
+            verdicts[index] = verdict
+            self.set(keys[index], verdict)
+        return guard.combineVerdicts(verdicts)
+
+    @staticmethod
+    def buildKey(
+        config: Any, role: Literal["user", "assistant"], messagesRaw: List[str]
+    ) -> str:
+        return hashlib.sha256(
+            json.dumps(
+                [
+                    config.dict(exclude=NON_VERDICT_FIELDS),
+                    role,
+                    [
+                        unicodedata.normalize("NFC", message).strip()
+                        for message in messagesRaw
+                    ],
+                ],
+                sort_keys=True,
+                default=str,
+            ).encode("utf-8")
+        ).hexdigest()
+
+    def get(self, key: str) -> GuardEvalResponse | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            failure, metadata, sizeBytes, expiresAt = entry
+            if expiresAt is not None and expiresAt <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        """
+        Copy so callers can't modify the cached metadata
+        """
+        return GuardEvalResponse(failure=failure, metadata=copy.deepcopy(metadata))
+
+    def set(self, key: str, verdict: GuardEvalResponse):
+        metadata = copy.deepcopy(verdict.metadata)
+        sizeBytes = (
+            len(key)
+            + len(json.dumps(metadata, default=str))
+            + ENTRY_OVERHEAD_BYTES
+        )
+        if sizeBytes > self.maxBytes:
+            return
+        expiresAt = (
+            time.monotonic() + self.ttlSeconds if self.ttlSeconds is not None else None
+        )
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (verdict.failure, metadata, sizeBytes, expiresAt)
+            self.currentBytes += sizeBytes
+            while self.currentBytes > self.maxBytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: str):
+        """
+        @NOTE Must be called with the lock held
+        """
+        entry = self._entries.pop(key)
+        self.currentBytes -= entry[2]
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "bytes": self.currentBytes,
+            "maxBytes": self.maxBytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+verdictCache = VerdictCache(
+    maxBytes=GUARD_VERDICT_CACHE_MAX_BYTES, ttlSeconds=GUARD_VERDICT_CACHE_TTL_SECONDS
+)
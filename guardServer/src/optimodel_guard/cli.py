@@ -17,13 +17,21 @@ def main():
     parser.add_argument(
         "--init", action="store_true", help="Initialize the model guards"
     )
+    parser.add_argument(
+        "--guards",
+        type=str,
+        help="Comma separated list of guards to load at startup (or 'all'), any other guard is loaded on first use",
+    )
     args = parser.parse_args()
 
     if args.config:
         os.environ["OPTIMODEL_CONFIG_PATH"] = args.config
+    if args.guards:
+        os.environ["OPTIMODEL_GUARDS"] = args.guards
     if args.init:
         """
-        Import our guards to ensure they are initialized
+        Load our guards to ensure their models are downloaded, either the ones passed
+        with --guards or all of them
         """
         from optimodel_guard.Guards import GuardMapping
         from huggingface_hub import login
@@ -32,6 +40,8 @@ def main():
         if HF_TOKEN:
             login(HF_TOKEN)
 
+        GuardMapping.loadAll(args.guards.split(",") if args.guards else None)
+
         print("Done init model guards ✅")
         return
 
@@ -3,9 +3,20 @@ from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
 from huggingface_hub import login
 
+from optimodel_guard.Config.types import GUARDS_TO_LOAD
 from optimodel_guard.Guards import GuardBaseClass, GuardMapping
-from optimodel_types import GuardBody, GuardResponse
-
+from optimodel_guard.Utils.Memory import getChildrenRSSBytes, getRSSBytes
+from optimodel_guard.Utils.VerdictCache import verdictCache
+from optimodel_types import (
+    GuardBatchBody,
+    GuardBatchResponse,
+    GuardBody,
+    GuardResponse,
+    GuardWarmupBody,
+    ModelMessage,
+)
+
+import asyncio
 import logging
 import sys
 import os
@@ -31,6 +42,15 @@ baseURL = "/optimodel-guard/api/v1"
 async def startup_event():
     logger.info(f"🔐 Starting Optimodel Guard Server...")
 
+    """
+    Load any guards we were asked to up front, everything else is loaded the first time
+    it's used
+    """
+    if GUARDS_TO_LOAD:
+        await asyncio.get_running_loop().run_in_executor(
+            None, GuardMapping.loadAll, GUARDS_TO_LOAD
+        )
+
 
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
@@ -47,15 +67,19 @@ async def query(data: GuardBody):
     """
     Get an instance of the guard passed
     """
-    guard: GuardBaseClass = GuardMapping[data.guard.guardName]
+    guard: GuardBaseClass = await GuardMapping.getAsync(data.guard.guardName)
 
     """
     Then check the guard
     """
-    if data.guard.guardType == "preQuery":
-        guardResponse = guard.handlePreQuery(messages=data.messages, config=data.guard)
-    elif data.guard.guardType == "postQuery":
-        guardResponse = guard.handlePostQuery(messages=data.messages, config=data.guard)
+    role = "user" if data.guard.guardType == "preQuery" else "assistant"
+    guardResponse = await verdictCache.evaluate(
+        guard,
+        GuardBaseClass.extractMessagesRaw(data.messages, role),
+        data.guard,
+        role,
+        sessionId=data.sessionId,
+    )
 
     toReturn = GuardResponse(
         failure=guardResponse.failure, metadata=guardResponse.metadata
@@ -63,6 +87,70 @@ async def query(data: GuardBody):
     return toReturn
 
 
+@app.post(f"{baseURL}/guard/batch")
+async def queryBatch(data: GuardBatchBody):
+    logger.info(f"New request to check {len(data.guards)} guards...")
+
+    messages = data.messages
+    if data.modelOutput:
+        messages = [*messages, ModelMessage(role="assistant", content=data.modelOutput)]
+
+    """
+    Extract the text for each role once, and share it across all guards
+    """
+    messagesRawByRole = {}
+    results = []
+    for guardConfig in data.guards:
+        role = "user" if guardConfig.guardType == "preQuery" else "assistant"
+        if role not in messagesRawByRole:
+            messagesRawByRole[role] = GuardBaseClass.extractMessagesRaw(messages, role)
+
+        guard: GuardBaseClass = await GuardMapping.getAsync(guardConfig.guardName)
+        guardResponse = await verdictCache.evaluate(
+            guard, messagesRawByRole[role], guardConfig, role, sessionId=data.sessionId
+        )
+        results.append(
+            GuardResponse(failure=guardResponse.failure, metadata=guardResponse.metadata)
+        )
+
+        """
+        No need to check anything else if this guard is going to block the request
+        """
+        if guardResponse.failure and guardConfig.blockRequest:
+            break
+
+    return GuardBatchResponse(results=results)
+
+
+@app.post(f"{baseURL}/warmup")
+async def warmup(data: GuardWarmupBody | None = None):
+    """
+    Load and run the requested guards (or all of them) so they're ready before traffic
+    """
+    guardNames = data.guards if data and data.guards else list(GuardMapping.guardClasses)
+    unknownGuards = [x for x in guardNames if x not in GuardMapping]
+    if unknownGuards:
+        return JSONResponse(
+            status_code=400, content={"error": f"Unknown guards: {unknownGuards}"}
+        )
+
+    loop = asyncio.get_running_loop()
+    for guardName in guardNames:
+        await loop.run_in_executor(None, GuardMapping.warmup, guardName)
+
+    return {"status": "ok", "guards": GuardMapping.status()}
+
+
 @app.get(f"{baseURL}/health")
 async def getHealth():
-    return {"status": "ok"}
+    """
+    rssBytes includes our worker processes (e.g. presidio's), workerRssBytes is just them
+    """
+    workerRSSBytes = getChildrenRSSBytes()
+    return {
+        "status": "ok",
+        "rssBytes": getRSSBytes() + workerRSSBytes,
+        "workerRssBytes": workerRSSBytes,
+        "guards": GuardMapping.status(),
+        "verdictCache": verdictCache.stats(),
+    }
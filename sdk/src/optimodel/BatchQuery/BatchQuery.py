@@ -0,0 +1,78 @@
+import json
+import logging
+from typing import Any, AsyncIterator, Callable, Iterable
+
+import aiohttp
+
+from optimodel.envVars import LytixCreds
+from optimodel.QueryModel.QueryModel import ObjectEncoder
+from optimodel_types import QueryBody
+
+logger = logging.getLogger(__name__)
+
+
+async def batchQuery(
+    queries: Iterable[QueryBody | dict],
+    concurrency: int | None = None,
+    jobId: str | None = None,
+    onJobId: Callable[[str], None] | None = None,
+    timeout: int | None = None,
+) -> AsyncIterator[dict[str, Any]]:
+    """
+    Run many queries in one request to the batch endpoint, yielding results as they finish
+    (not in order), e.g.
+        async for result in batchQuery(queries):
+            print(result["index"], result.get("response") or result["error"])
+
+    @param queries: QueryBody objects, or dicts with the same fields (e.g. modelToUse, messages)
+    @param concurrency: How many queries the server runs at once
+    @param jobId: Resume a previous job (pass the same queries), queries that already
+        succeeded are replayed instead of queried again
+    @param onJobId: Called with the job id as soon as the server assigns it, save it to resume later
+    @param timeout: The timeout in seconds for the whole batch
+    """
+
+    async def body():
+        for query in queries:
+            if isinstance(query, QueryBody):
+                line = query.json(exclude_none=True)
+            else:
+                line = json.dumps(query, cls=ObjectEncoder)
+            yield (line + "\n").encode("utf-8")
+
+    params = {}
+    if jobId:
+        params["jobId"] = jobId
+    if concurrency:
+        params["concurrency"] = str(concurrency)
+
+    async with aiohttp.ClientSession(
+        timeout=aiohttp.ClientTimeout(total=timeout) if timeout else None,
+    ) as session:
+        async with session.post(
+            url=f"{LytixCreds.LX_BASE_URL.rstrip('/')}/optimodel/api/v1/batch",
+            params=params,
+            data=body(),
+            headers={
+                "Authorization": f"Bearer {LytixCreds.LX_API_KEY}",
+                "Content-Type": "application/x-ndjson",
+            },
+        ) as response:
+            if response.status != 200:
+                raise Exception(f"Bad request: {await response.text()}")
+            if onJobId is not None:
+                onJobId(response.headers.get("x-optimodel-batch-job-id"))
+
+            """
+            Split lines ourselves, a long model response can be longer than aiohttp's
+            line limit
+            """
+            buffer = b""
+            async for chunk in response.content.iter_any():
+                buffer += chunk
+                *lines, buffer = buffer.split(b"\n")
+                for line in lines:
+                    if line.strip():
+                        yield json.loads(line)
+            if buffer.strip():
+                yield json.loads(buffer)
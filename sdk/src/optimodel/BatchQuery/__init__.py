@@ -0,0 +1 @@
+from .BatchQuery import batchQuery
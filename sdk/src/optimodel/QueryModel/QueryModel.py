@@ -10,6 +10,7 @@ from optimodel_types import (
     Guards,
     ModelMessage,
     SpeedPriority,
+    RoutingObjective,
     ModelTypes,
     Providers,
 )
@@ -28,6 +29,10 @@ async def queryModel(
     temperature: float = None,
     jsonMode: bool = None,
     provider: Providers | None = None,
+    routingObjective: RoutingObjective | None = None,
+    latencySLOMs: int | None = None,
+    hedge: bool | None = None,
+    hedgeDelayMs: int | None = None,
     guards: list[Guards] | None = None,
     retries: int | None = None,
     timeout: int | None = None,
@@ -35,6 +40,7 @@ async def queryModel(
     # Lytix Specific
     workflowName: str | None = None,
     cacheTTL: int | None = None,
+    semanticCache: bool | None = None,
     userId: str | None = None,
     sessionId: str | None = None,
     metadata: dict | None = None,
@@ -47,6 +53,10 @@ async def queryModel(
     @param validator: A function that takes in the model output and returns a boolean if it passed/failed validation
     @param fallbackModels: A list of models to use if the first model fails.
     @param jsonMode: Whether to return the response in JSON mode
+    @param routingObjective: How to order providers, e.g. by observed latency instead of our static config
+    @param latencySLOMs: Latency SLO (in ms) used by the costUnderSLO routing objective
+    @param hedge: Also send the request to the next provider if the first is slow, first to answer wins
+    @param hedgeDelayMs: How long to wait before hedging, defaults to the provider's observed p95 latency
     @param userId: [Lytix Specific] The user id to use for the query
     @param sessionId: [Lytix Specific] The session id to use for the query
     @param guard: A list of guards to use for the query
@@ -54,7 +64,8 @@ async def queryModel(
     @param timeout: The timeout in seconds to wait for the model to respond.
     @param workflowName: [Lytix Specific] The workflow name to use for the query
     @param credentials: Explicitly pass in credentials to use for the query (used in SAAS_MODE)
-    @param cacheTTL: [Lytix Specific] The time to cache the response for if cache is enabled in Lytix
+    @param cacheTTL: The time (in seconds) to cache the response for, identical requests in that window are served from the cache
+    @param semanticCache: Set to False to skip the server's semantic cache (similar, not just identical, prompts)
     @param metadata: [Lytix Specific] Metadata to pass to the query
     """
     # Either 0 retries or whatevers passed
@@ -84,12 +95,19 @@ async def queryModel(
                                 "temperature": temperature,
                                 "jsonMode": jsonMode,
                                 "provider": provider.name if provider else None,
+                                "routingObjective": (
+                                    routingObjective.value if routingObjective else None
+                                ),
+                                "latencySLOMs": latencySLOMs,
+                                "hedge": hedge,
+                                "hedgeDelayMs": hedgeDelayMs,
                                 "userId": userId if userId else None,
                                 "sessionId": sessionId if sessionId else None,
                                 "guards": guards,
                                 "workflowName": workflowName if workflowName else None,
                                 "credentials": credentials,
                                 "cacheTTL": cacheTTL,
+                                "semanticCache": semanticCache,
                                 "metadata": metadata,
                             }
                             if maxGenLen:
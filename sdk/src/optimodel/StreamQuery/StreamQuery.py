@@ -0,0 +1,60 @@
+import json
+import logging
+from typing import Any, AsyncIterator
+
+import aiohttp
+
+from optimodel.envVars import LytixCreds
+from optimodel.QueryModel.QueryModel import ObjectEncoder
+from optimodel_types import QueryBody
+
+logger = logging.getLogger(__name__)
+
+
+async def streamQuery(
+    query: QueryBody | dict,
+    timeout: int | None = None,
+) -> AsyncIterator[dict[str, Any]]:
+    """
+    Query a model and stream the output back as it's generated, e.g.
+        async for event in streamQuery(query):
+            if event["type"] == "delta":
+                print(event["delta"], end="")
+            elif event["type"] == "done":
+                print(event["cost"], event["guardErrors"])
+
+    Events are {"type": "delta", "delta"} for each piece of output, then either
+    {"type": "done", ...} (same fields as queryModel's response, plus finishReason) or
+    {"type": "error", "error"} if the provider failed mid stream
+
+    @param query: A QueryBody, or a dict with the same fields (e.g. modelToUse, messages)
+    @param timeout: The timeout in seconds for the whole stream
+    """
+    if isinstance(query, QueryBody):
+        body = json.loads(query.json(exclude_none=True))
+    else:
+        body = json.loads(json.dumps(query, cls=ObjectEncoder))
+    body["stream"] = True
+
+    async with aiohttp.ClientSession(
+        timeout=aiohttp.ClientTimeout(total=timeout) if timeout else None,
+    ) as session:
+        async with session.post(
+            url=f"{LytixCreds.LX_BASE_URL.rstrip('/')}/optimodel/api/v1/query",
+            json=body,
+            headers={
+                "Authorization": f"Bearer {LytixCreds.LX_API_KEY}",
+                "Content-Type": "application/json",
+                "Accept": "text/event-stream",
+            },
+        ) as response:
+            if response.status != 200:
+                raise Exception(f"Bad request: {await response.text()}")
+
+            buffer = b""
+            async for chunk in response.content.iter_any():
+                buffer += chunk
+                *events, buffer = buffer.split(b"\n\n")
+                for event in events:
+                    if event.startswith(b"data: "):
+                        yield json.loads(event[len(b"data: ") :])
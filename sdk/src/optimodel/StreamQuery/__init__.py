@@ -0,0 +1 @@
+from .StreamQuery import streamQuery
@@ -1,4 +1,6 @@
 from .QueryModel import queryModel
+from .BatchQuery import batchQuery
+from .StreamQuery import streamQuery
 from .ListModels import listModels
 from .envVars import LytixCreds
 
@@ -6,6 +8,7 @@ from optimodel_types import (
     ModelTypes,
     Providers,
     SpeedPriority,
+    RoutingObjective,
     ModelImageMessageSource,
     ModelMessageContentEntry,
     ModelMessage,
@@ -22,9 +25,12 @@ from optimodel_types import (
     GuardQueryBase,
     LLamaPromptGuardConfig,
     LytixRegexConfig,
+    LytixRegexPattern,
     MicrosoftPresidioConfig,
     Guards,
     QueryBody,
     GuardBody,
     GuardResponse,
+    GuardBatchBody,
+    GuardBatchResponse,
 )
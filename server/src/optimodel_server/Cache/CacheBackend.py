@@ -0,0 +1,13 @@
+class CacheBackend:
+    """
+    Interface for response cache storage, values are opaque bytes
+    """
+
+    async def get(self, key: str) -> bytes | None:
+        raise NotImplementedError()
+
+    async def set(self, key: str, value: bytes, ttlSeconds: float):
+        raise NotImplementedError()
+
+    def stats(self) -> dict:
+        return {}
@@ -0,0 +1,72 @@
+import threading
+import time
+from collections import OrderedDict
+
+from optimodel_server.Cache.CacheBackend import CacheBackend
+
+
+"""
+Rough per entry overhead (key, tuple, dict slots) on top of the value itself
+"""
+ENTRY_OVERHEAD_BYTES = 256
+
+
+class MemoryBackend(CacheBackend):
+    """
+    In process LRU bounded by the (approximate) bytes it holds, with a TTL per entry
+    """
+
+    def __init__(self, maxBytes: int):
+        self.maxBytes = maxBytes
+        self.currentBytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[str, tuple[bytes, int, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def get(self, key: str) -> bytes | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, _, expiresAt = entry
+            if expiresAt <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    async def set(self, key: str, value: bytes, ttlSeconds: float):
+        sizeBytes = len(key) + len(value) + ENTRY_OVERHEAD_BYTES
+        if sizeBytes > self.maxBytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, sizeBytes, time.monotonic() + ttlSeconds)
+            self.currentBytes += sizeBytes
+            while self.currentBytes > self.maxBytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: str):
+        """
+        @NOTE Must be called with the lock held
+        """
+        entry = self._entries.pop(key)
+        self.currentBytes -= entry[1]
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "size": len(self._entries),
+            "bytes": self.currentBytes,
+            "maxBytes": self.maxBytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,38 @@
+from optimodel_server.Cache.CacheBackend import CacheBackend
+
+
+class RedisBackend(CacheBackend):
+    """
+    Shared cache in anything that speaks the Redis protocol (Redis, Valkey, KeyDB...), so
+    every server replica sees the same responses. Needs the redis extra
+    (pip install optimodel-server[redis])
+    """
+
+    def __init__(self, url: str, keyPrefix: str = "optimodel:response:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise ImportError(
+                "The redis response cache needs the redis package, install it with pip install optimodel-server[redis]"
+            )
+
+        self.client = redis.from_url(url)
+        self.keyPrefix = keyPrefix
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> bytes | None:
+        value = await self.client.get(self.keyPrefix + key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: str, value: bytes, ttlSeconds: float):
+        await self.client.set(
+            self.keyPrefix + key, value, px=max(1, int(ttlSeconds * 1000))
+        )
+
+    def stats(self) -> dict:
+        return {"backend": "redis", "hits": self.hits, "misses": self.misses}
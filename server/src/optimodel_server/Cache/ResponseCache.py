@@ -0,0 +1,138 @@
+import hashlib
+import json
+import logging
+
+from optimodel_server.Cache.CacheBackend import CacheBackend
+from optimodel_server.Cache.MemoryBackend import MemoryBackend
+from optimodel_server.Config.types import (
+    RESPONSE_CACHE_BACKEND,
+    RESPONSE_CACHE_DEFAULT_TTL_SECONDS,
+    RESPONSE_CACHE_MAX_BYTES,
+    RESPONSE_CACHE_REDIS_URL,
+    SAAS_MODE,
+)
+from optimodel_types import QueryBody
+from optimodel_types.providerTypes import QueryResponse
+
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """
+    Exact match cache of model responses, keyed by a canonical hash of everything that
+    changes what the model would say (model, messages, temperature, maxGenLen, jsonMode and
+    a pinned provider). In SAAS mode the credentials are part of the key so tenants never
+    see each others responses.
+
+    A request is cached if it sets cacheTTL, or if it's deterministic (temperature 0) and
+    we have a default TTL. Guards are not part of the key, we store the raw provider
+    response and guards are checked again on every hit
+    """
+
+    def __init__(self, backend: CacheBackend | None, defaultTTLSeconds: float):
+        self.backend = backend
+        self.defaultTTLSeconds = defaultTTLSeconds
+        self.errors = 0
+
+    def ttlSeconds(self, data: QueryBody) -> float | None:
+        """
+        How long to cache the response for this request, None if we shouldn't
+        """
+        if self.backend is None:
+            return None
+        if data.cacheTTL is not None:
+            return data.cacheTTL if data.cacheTTL > 0 else None
+        if data.temperature == 0 and self.defaultTTLSeconds > 0:
+            return self.defaultTTLSeconds
+        return None
+
+    @staticmethod
+    def buildKey(data: QueryBody) -> str:
+        return hashlib.sha256(
+            json.dumps(
+                [
+                    data.modelToUse,
+                    [message.dict(exclude_none=True) for message in data.messages],
+                    data.temperature,
+                    data.maxGenLen,
+                    bool(data.jsonMode),
+                    data.provider.value if data.provider is not None else None,
+                    (
+                        [credential.dict() for credential in data.credentials or []]
+                        if SAAS_MODE is not None
+                        else None
+                    ),
+                ],
+                sort_keys=True,
+                separators=(",", ":"),
+                default=str,
+            ).encode("utf-8")
+        ).hexdigest()
+
+    async def get(self, key: str) -> tuple[str, QueryResponse] | None:
+        """
+        @return (provider, response) on a hit
+        """
+        try:
+            value = await self.backend.get(key)
+        except Exception as e:
+            """
+            A broken cache shouldn't take queries down with it
+            """
+            logger.error(f"Error reading response cache: {e}")
+            self.errors += 1
+            return None
+        if value is None:
+            return None
+        entry = json.loads(value)
+        return entry["provider"], QueryResponse(
+            modelOutput=entry["modelOutput"],
+            promptTokens=entry["promptTokens"],
+            generationTokens=entry["generationTokens"],
+        )
+
+    async def set(
+        self, key: str, provider: str, response: QueryResponse, ttlSeconds: float
+    ):
+        value = json.dumps(
+            {
+                "provider": provider,
+                "modelOutput": response.modelOutput,
+                "promptTokens": response.promptTokens,
+                "generationTokens": response.generationTokens,
+            },
+            separators=(",", ":"),
+        ).encode("utf-8")
+        try:
+            await self.backend.set(key, value, ttlSeconds)
+        except Exception as e:
+            logger.error(f"Error writing response cache: {e}")
+            self.errors += 1
+
+    def stats(self) -> dict | None:
+        if self.backend is None:
+            return None
+        return {**self.backend.stats(), "errors": self.errors}
+
+
+def buildBackend() -> CacheBackend | None:
+    match RESPONSE_CACHE_BACKEND:
+        case "memory":
+            return MemoryBackend(maxBytes=RESPONSE_CACHE_MAX_BYTES)
+        case "redis":
+            from optimodel_server.Cache.RedisBackend import RedisBackend
+
+            return RedisBackend(url=RESPONSE_CACHE_REDIS_URL)
+        case "off" | "none" | "":
+            return None
+        case _:
+            logger.warning(
+                f"Unknown response cache backend {RESPONSE_CACHE_BACKEND}, caching is off"
+            )
+            return None
+
+
+responseCache = ResponseCache(
+    backend=buildBackend(), defaultTTLSeconds=RESPONSE_CACHE_DEFAULT_TTL_SECONDS
+)
@@ -0,0 +1,434 @@
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple
+
+from optimodel_server.Config.types import (
+    SAAS_MODE,
+    SEMANTIC_CACHE_ENABLED,
+    SEMANTIC_CACHE_HNSW_MIN_ENTRIES,
+    SEMANTIC_CACHE_MAX_BYTES,
+    SEMANTIC_CACHE_MODEL,
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_TTL_SECONDS,
+)
+from optimodel_types import ModelMessage, QueryBody
+from optimodel_types.providerTypes import QueryResponse
+
+"""
+Optional dependencies, see the semantic-cache extra (pip install optimodel-server[semantic-cache])
+"""
+try:
+    import numpy as np
+except ImportError:
+    np = None
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+
+logger = logging.getLogger(__name__)
+
+"""
+Rough per entry overhead (entry tuple, label maps) on top of the vector and value. The
+vector arrays and HNSW graphs are counted separately, see SemanticIndex.nbytes
+"""
+ENTRY_OVERHEAD_BYTES = 512
+
+HNSW_M = 16
+
+"""
+How many neighbours we look at per lookup, so an expired nearest neighbour doesn't hide
+a live one just behind it
+"""
+SEARCH_K = 4
+
+
+class SemanticIndex:
+    """
+    Vectors for one namespace. Searched with a flat (NumPy) dot product while small, and
+    with an HNSW graph once it has hnswMinEntries entries (if hnswlib is installed).
+    Vectors are normalized, so the dot product is the cosine similarity.
+
+    Removed entries free their HNSW slot for the next add (replace_deleted), and both
+    the flat array and the graph are shrunk once they're mostly empty, so a namespace
+    under churn only ever holds about twice its live entries
+    """
+
+    MIN_ROWS = 16
+
+    def __init__(self, dim: int, hnswMinEntries: int):
+        self.dim = dim
+        self.hnswMinEntries = hnswMinEntries
+        self.vectors = np.zeros((self.MIN_ROWS, dim), dtype=np.float32)
+        self.labels: List[int] = []
+        self.rows: Dict[int, int] = {}
+        self.hnsw = None
+        self.hnswCapacity = 0
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def nbytes(self) -> int:
+        """
+        Memory held by the flat vectors and the HNSW graph (every slot stores the
+        vector, its level 0 links and its label)
+        """
+        hnswBytes = self.hnswCapacity * (self.dim * 4 + (2 * HNSW_M + 1) * 4 + 8)
+        return self.vectors.nbytes + hnswBytes
+
+    def add(self, label: int, vector):
+        if len(self.labels) == self.vectors.shape[0]:
+            self.vectors = np.concatenate([self.vectors, np.zeros_like(self.vectors)])
+        self.rows[label] = len(self.labels)
+        self.vectors[len(self.labels)] = vector
+        self.labels.append(label)
+
+        if self.hnsw is not None:
+            """
+            With replace_deleted a deleted slot is reused, so we only need room for the
+            live entries
+            """
+            if len(self.labels) > self.hnswCapacity:
+                self.hnswCapacity = 2 * len(self.labels)
+                self.hnsw.resize_index(self.hnswCapacity)
+            self.hnsw.add_items(vector[np.newaxis, :], [label], replace_deleted=True)
+        elif hnswlib is not None and len(self.labels) >= self.hnswMinEntries:
+            self._buildHNSW()
+
+    def _buildHNSW(self):
+        self.hnsw = hnswlib.Index(space="ip", dim=self.dim)
+        self.hnswCapacity = 2 * len(self.labels)
+        self.hnsw.init_index(
+            max_elements=self.hnswCapacity,
+            ef_construction=200,
+            M=HNSW_M,
+            allow_replace_deleted=True,
+        )
+        self.hnsw.set_ef(64)
+        self.hnsw.add_items(self.vectors[: len(self.labels)], self.labels)
+
+    def remove(self, label: int):
+        """
+        Swap the last row into the removed one so the flat vectors stay dense
+        """
+        row = self.rows.pop(label)
+        lastLabel = self.labels.pop()
+        if lastLabel != label:
+            self.vectors[row] = self.vectors[len(self.labels)]
+            self.labels[row] = lastLabel
+            self.rows[lastLabel] = row
+
+        if len(self.labels) < self.vectors.shape[0] // 4:
+            self.vectors = self.vectors[
+                : max(self.MIN_ROWS, self.vectors.shape[0] // 2)
+            ].copy()
+
+        if self.hnsw is not None:
+            self.hnsw.mark_deleted(label)
+            """
+            Rebuild a mostly deleted graph (or go back to the flat search), deleted
+            slots still cost memory and slow the search down
+            """
+            if len(self.labels) < self.hnswMinEntries // 2:
+                self.hnsw = None
+                self.hnswCapacity = 0
+            elif len(self.labels) < self.hnswCapacity // 4:
+                self._buildHNSW()
+
+    def search(self, vector, k: int = 1) -> List[tuple[int, float]]:
+        """
+        @return (label, similarity) of the k closest vectors, closest first
+        """
+        k = min(k, len(self.labels))
+        if k == 0:
+            return []
+        if self.hnsw is not None:
+            try:
+                labels, distances = self.hnsw.knn_query(vector, k=k)
+                return [
+                    (int(label), 1 - float(distance))
+                    for label, distance in zip(labels[0], distances[0])
+                ]
+            except RuntimeError:
+                """
+                HNSW couldn't find enough neighbours (e.g. too much of the graph is
+                deleted), fall back to the flat search
+                """
+                pass
+        scores = self.vectors[: len(self.labels)] @ vector
+        rows = np.argpartition(-scores, k - 1)[:k]
+        rows = rows[np.argsort(-scores[rows])]
+        return [(self.labels[row], float(scores[row])) for row in rows]
+
+
+class SemanticKey(NamedTuple):
+    namespace: str
+    vector: object
+
+
+class SemanticCache:
+    """
+    Serves a cached answer for prompts that are close enough (cosine similarity of their
+    embeddings above threshold) to one we've already answered.
+
+    We embed the final user turn with a small local CPU model. Everything else that
+    changes the answer (model, system prompt, generation params, SAAS credentials) goes
+    into the namespace, and only vectors in the same namespace are compared. Multi turn
+    conversations are never served from here, earlier turns change the answer too much.
+
+    Bounded by an estimate of the memory used (LRU eviction across all namespaces) and
+    the TTL of each entry
+    """
+
+    def __init__(
+        self,
+        enabled: bool,
+        modelName: str,
+        threshold: float,
+        maxBytes: int,
+        ttlSeconds: float,
+        hnswMinEntries: int,
+    ):
+        self.enabled = enabled and np is not None
+        if enabled and np is None:
+            logger.warning(
+                "Semantic cache needs numpy and sentence-transformers, install them with pip install optimodel-server[semantic-cache]"
+            )
+        self.modelName = modelName
+        self.threshold = threshold
+        self.maxBytes = maxBytes
+        self.defaultTTLSeconds = ttlSeconds
+        self.hnswMinEntries = hnswMinEntries
+        self.model = None
+        self.loadLock = threading.Lock()
+        self.namespaces: Dict[str, SemanticIndex] = {}
+        """
+        label -> (namespace, value, sizeBytes, expiresAt), in LRU order
+        """
+        self._entries: OrderedDict[int, tuple] = OrderedDict()
+        self.nextLabel = 0
+        """
+        Entries, and separately the vector arrays and HNSW graphs of every namespace.
+        Together they're kept under maxBytes
+        """
+        self.currentBytes = 0
+        self.indexBytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.hitSimilarityTotal = 0.0
+
+    def isCacheable(self, data: QueryBody) -> bool:
+        if not self.enabled or data.semanticCache is False:
+            return False
+        return self._finalUserText(data.messages) is not None
+
+    def ttlSeconds(self, data: QueryBody) -> float | None:
+        """
+        How long to cache the response for this request, None if we shouldn't. Unlike
+        the response cache this doesn't depend on temperature, only on the server
+        setting, cacheTTL and the semanticCache opt out
+        """
+        if not self.isCacheable(data):
+            return None
+        if data.cacheTTL is not None:
+            return data.cacheTTL if data.cacheTTL > 0 else None
+        return self.defaultTTLSeconds if self.defaultTTLSeconds > 0 else None
+
+    async def lookup(
+        self, data: QueryBody
+    ) -> tuple[tuple[str, QueryResponse, float] | None, SemanticKey]:
+        """
+        @return ((provider, response, similarity) on a hit, the key to set the response
+            with on a miss)
+        """
+        vector = await self._embed(self._finalUserText(data.messages))
+        key = SemanticKey(namespace=self.buildNamespace(data), vector=vector)
+
+        """
+        Expired neighbours are dropped and we keep looking, a live entry can be just
+        behind them. Matches come closest first, so the first live one decides
+        """
+        while True:
+            index = self.namespaces.get(key.namespace)
+            if index is None:
+                break
+            removedExpired = False
+            for label, similarity in index.search(vector, k=SEARCH_K):
+                entry = self._entries.get(label)
+                if entry is None:
+                    continue
+                if entry[3] <= time.monotonic():
+                    self._remove(label)
+                    removedExpired = True
+                    continue
+                if similarity >= self.threshold:
+                    self._entries.move_to_end(label)
+                    self.hits += 1
+                    self.hitSimilarityTotal += similarity
+                    cached = json.loads(entry[1])
+                    return (
+                        cached["provider"],
+                        QueryResponse(
+                            modelOutput=cached["modelOutput"],
+                            promptTokens=cached["promptTokens"],
+                            generationTokens=cached["generationTokens"],
+                        ),
+                        similarity,
+                    ), key
+                removedExpired = False
+                break
+            if not removedExpired:
+                break
+
+        self.misses += 1
+        return None, key
+
+    def set(
+        self,
+        key: SemanticKey,
+        provider: str,
+        response: QueryResponse,
+        ttlSeconds: float,
+    ):
+        value = json.dumps(
+            {
+                "provider": provider,
+                "modelOutput": response.modelOutput,
+                "promptTokens": response.promptTokens,
+                "generationTokens": response.generationTokens,
+            },
+            separators=(",", ":"),
+        ).encode("utf-8")
+        sizeBytes = len(value) + key.vector.nbytes + ENTRY_OVERHEAD_BYTES
+        if sizeBytes > self.maxBytes:
+            return
+
+        index = self.namespaces.get(key.namespace)
+        if index is None:
+            index = self.namespaces[key.namespace] = SemanticIndex(
+                dim=key.vector.shape[0], hnswMinEntries=self.hnswMinEntries
+            )
+        label = self.nextLabel
+        self.nextLabel += 1
+        indexBytes = index.nbytes()
+        index.add(label, key.vector)
+        self.indexBytes += index.nbytes() - indexBytes
+        self._entries[label] = (
+            key.namespace,
+            value,
+            sizeBytes,
+            time.monotonic() + ttlSeconds,
+        )
+        self.currentBytes += sizeBytes
+        while self.currentBytes + self.indexBytes > self.maxBytes and self._entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, label: int):
+        namespace, _, sizeBytes, _ = self._entries.pop(label)
+        self.currentBytes -= sizeBytes
+        index = self.namespaces[namespace]
+        indexBytes = index.nbytes()
+        index.remove(label)
+        if len(index) == 0:
+            del self.namespaces[namespace]
+            self.indexBytes -= indexBytes
+        else:
+            self.indexBytes += index.nbytes() - indexBytes
+
+    @staticmethod
+    def buildNamespace(data: QueryBody) -> str:
+        return hashlib.sha256(
+            json.dumps(
+                [
+                    data.modelToUse,
+                    [
+                        message.dict(exclude_none=True)
+                        for message in data.messages
+                        if message.role == "system"
+                    ],
+                    data.temperature,
+                    data.maxGenLen,
+                    bool(data.jsonMode),
+                    data.provider.value if data.provider is not None else None,
+                    (
+                        [credential.dict() for credential in data.credentials or []]
+                        if SAAS_MODE is not None
+                        else None
+                    ),
+                ],
+                sort_keys=True,
+                separators=(",", ":"),
+                default=str,
+            ).encode("utf-8")
+        ).hexdigest()
+
+    @staticmethod
+    def _finalUserText(messages: List[ModelMessage]) -> str | None:
+        """
+        Text of the only non system message, if it's a plain text user turn
+        """
+        turns = [message for message in messages if message.role != "system"]
+        if len(turns) != 1 or turns[0].role != "user":
+            return None
+        content = turns[0].content
+        if isinstance(content, str):
+            return content
+        if any(entry.type != "text" for entry in content):
+            return None
+        return "\n".join(entry.text or "" for entry in content)
+
+    async def _embed(self, text: str):
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self._embedSync, text
+        )
+
+    def _embedSync(self, text: str):
+        if self.model is None:
+            with self.loadLock:
+                if self.model is None:
+                    from sentence_transformers import SentenceTransformer
+
+                    self.model = SentenceTransformer(self.modelName, device="cpu")
+        return self.model.encode(
+            text, normalize_embeddings=True, convert_to_numpy=True
+        ).astype(np.float32)
+
+    def stats(self) -> dict | None:
+        if not self.enabled:
+            return None
+        return {
+            "size": len(self._entries),
+            "namespaces": len(self.namespaces),
+            "bytes": self.currentBytes + self.indexBytes,
+            "indexBytes": self.indexBytes,
+            "maxBytes": self.maxBytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": (
+                self.hits / (self.hits + self.misses)
+                if self.hits + self.misses > 0
+                else None
+            ),
+            "averageHitSimilarity": (
+                self.hitSimilarityTotal / self.hits if self.hits > 0 else None
+            ),
+            "evictions": self.evictions,
+        }
+
+
+semanticCache = SemanticCache(
+    enabled=SEMANTIC_CACHE_ENABLED,
+    modelName=SEMANTIC_CACHE_MODEL,
+    threshold=SEMANTIC_CACHE_THRESHOLD,
+    maxBytes=SEMANTIC_CACHE_MAX_BYTES,
+    ttlSeconds=SEMANTIC_CACHE_TTL_SECONDS,
+    hnswMinEntries=SEMANTIC_CACHE_HNSW_MIN_ENTRIES,
+)
@@ -0,0 +1,4 @@
+from optimodel_server.Cache.CacheBackend import CacheBackend
+from optimodel_server.Cache.MemoryBackend import MemoryBackend
+from optimodel_server.Cache.ResponseCache import ResponseCache, responseCache
+from optimodel_server.Cache.SemanticCache import SemanticCache, semanticCache
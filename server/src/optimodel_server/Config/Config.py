@@ -93,7 +93,10 @@ class Config:
         """
         Validate the config
         """
-        validatedConfig = {"availableModels": {}}
+        validatedConfig = {
+            "availableModels": {},
+            "providerLimits": config.get("providerLimits", {}),
+        }
         for provider, models in config["availableModels"].items():
             """
             Make sure the model is valid
@@ -5,3 +5,235 @@ import os
 If we are running in a mode where each request should provide their own credentials
 """
 SAAS_MODE = os.environ.get("OPTIMODEL_SAAS_MODE", None)
+
+"""
+Max number of threads used to run providers that don't have a native async client
+"""
+PROVIDER_THREAD_POOL_SIZE = int(
+    os.environ.get("OPTIMODEL_PROVIDER_THREAD_POOL_SIZE", "64")
+)
+
+"""
+In SAAS mode we cache SDK clients per credential so we can reuse their connection pools.
+Max number of clients to keep around, and how long (in seconds) to keep each one
+"""
+CLIENT_CACHE_MAX_SIZE = int(os.environ.get("OPTIMODEL_CLIENT_CACHE_MAX_SIZE", "256"))
+CLIENT_CACHE_TTL_SECONDS = float(
+    os.environ.get("OPTIMODEL_CLIENT_CACHE_TTL_SECONDS", "3600")
+)
+
+"""
+Connection pool size and request timeout (in seconds) for the shared guard server session
+"""
+GUARD_CLIENT_POOL_SIZE = int(os.environ.get("OPTIMODEL_GUARD_CLIENT_POOL_SIZE", "100"))
+GUARD_CLIENT_TIMEOUT_SECONDS = float(
+    os.environ.get("OPTIMODEL_GUARD_CLIENT_TIMEOUT_SECONDS", "30")
+)
+
+"""
+If set, all preQuery (and all postQuery) guards are checked concurrently instead of one
+after another. The first blocking failure cancels the rest
+"""
+GUARD_CONCURRENT = os.environ.get("OPTIMODEL_GUARD_CONCURRENT", "true").lower() in [
+    "1",
+    "true",
+    "yes",
+]
+
+"""
+If set, send all guards for a request to the guard server in one batch request
+"""
+GUARD_BATCH = os.environ.get("OPTIMODEL_GUARD_BATCH", "true").lower() in [
+    "1",
+    "true",
+    "yes",
+]
+
+"""
+Optionally cache guard responses in the server, keyed by a hash of the guard and the
+messages. Max number of responses to keep (0 disables it) and how long to keep each one
+"""
+GUARD_CLIENT_CACHE_SIZE = int(os.environ.get("OPTIMODEL_GUARD_CLIENT_CACHE_SIZE", "0"))
+GUARD_CLIENT_CACHE_TTL_SECONDS = float(
+    os.environ.get("OPTIMODEL_GUARD_CLIENT_CACHE_TTL_SECONDS", "300")
+)
+
+"""
+Default routing objective (see RoutingObjective) when a request doesn't pass one, and
+the default latency SLO (in ms) for the costUnderSLO objective
+"""
+ROUTING_OBJECTIVE = os.environ.get("OPTIMODEL_ROUTING_OBJECTIVE", "static")
+ROUTING_LATENCY_SLO_MS = float(os.environ.get("OPTIMODEL_ROUTING_LATENCY_SLO_MS", "5000"))
+
+"""
+Weight of the newest sample in our per (model, provider) moving averages, how many recent
+latencies we keep for percentiles, and how many samples we need before we trust the
+stats over our static config
+"""
+ROUTING_EWMA_ALPHA = float(os.environ.get("OPTIMODEL_ROUTING_EWMA_ALPHA", "0.2"))
+ROUTING_WINDOW_SIZE = int(os.environ.get("OPTIMODEL_ROUTING_WINDOW_SIZE", "100"))
+ROUTING_MIN_SAMPLES = int(os.environ.get("OPTIMODEL_ROUTING_MIN_SAMPLES", "5"))
+
+"""
+Circuit breakers per provider and per provider + model (per credential in SAAS mode).
+After this many consecutive failures we stop sending traffic for the cool down (in
+seconds), then let a few probe requests through to see if it has recovered. Only
+outages (5xx, connection errors, timeouts) count against the provider breaker
+"""
+CIRCUIT_FAILURE_THRESHOLD = int(
+    os.environ.get("OPTIMODEL_CIRCUIT_FAILURE_THRESHOLD", "5")
+)
+CIRCUIT_COOLDOWN_SECONDS = float(
+    os.environ.get("OPTIMODEL_CIRCUIT_COOLDOWN_SECONDS", "30")
+)
+CIRCUIT_HALF_OPEN_PROBES = int(os.environ.get("OPTIMODEL_CIRCUIT_HALF_OPEN_PROBES", "1"))
+
+"""
+Hedged requests: the default percentile of a provider's observed latency we wait before
+also trying the next provider, the delay (in ms) to use when we don't have stats for it
+yet, and the max number of providers we race at once
+"""
+HEDGE_PERCENTILE = float(os.environ.get("OPTIMODEL_HEDGE_PERCENTILE", "95"))
+HEDGE_DEFAULT_DELAY_MS = float(os.environ.get("OPTIMODEL_HEDGE_DEFAULT_DELAY_MS", "2000"))
+HEDGE_MAX_IN_FLIGHT = int(os.environ.get("OPTIMODEL_HEDGE_MAX_IN_FLIGHT", "2"))
+
+"""
+Admission control (see providerLimits and limits in the config): how long (in ms) a
+request may wait for a provider to have room when no other provider does, and how many
+generation tokens we assume when a request doesn't set maxGenLen
+"""
+ADMISSION_MAX_WAIT_MS = float(os.environ.get("OPTIMODEL_ADMISSION_MAX_WAIT_MS", "1000"))
+ADMISSION_DEFAULT_GENERATION_TOKENS = int(
+    os.environ.get("OPTIMODEL_ADMISSION_DEFAULT_GENERATION_TOKENS", "512")
+)
+
+"""
+Response cache: where to keep responses (memory, redis or off), the memory budget (in
+bytes) for the memory backend, the URL for the redis backend, and how long (in seconds)
+to cache deterministic (temperature 0) requests that don't set cacheTTL, 0 only caches
+requests that ask for it
+"""
+RESPONSE_CACHE_BACKEND = os.environ.get("OPTIMODEL_RESPONSE_CACHE", "memory").lower()
+RESPONSE_CACHE_MAX_BYTES = int(
+    os.environ.get("OPTIMODEL_RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024))
+)
+RESPONSE_CACHE_REDIS_URL = os.environ.get(
+    "OPTIMODEL_RESPONSE_CACHE_REDIS_URL", "redis://localhost:6379/0"
+)
+RESPONSE_CACHE_DEFAULT_TTL_SECONDS = float(
+    os.environ.get("OPTIMODEL_RESPONSE_CACHE_DEFAULT_TTL_SECONDS", "0")
+)
+
+"""
+Semantic cache (needs the semantic-cache extra): serve a cached answer when a request's
+final user turn is similar enough (cosine similarity of the embeddings, 0-1) to one
+we've answered. The local embedding model, the memory budget (in bytes), how long
+entries live (requests can override it with cacheTTL) and the number of entries in a
+namespace before we switch from a flat search to HNSW
+"""
+SEMANTIC_CACHE_ENABLED = os.environ.get(
+    "OPTIMODEL_SEMANTIC_CACHE", "false"
+).lower() in ["1", "true", "yes"]
+SEMANTIC_CACHE_MODEL = os.environ.get(
+    "OPTIMODEL_SEMANTIC_CACHE_MODEL", "sentence-transformers/all-MiniLM-L6-v2"
+)
+SEMANTIC_CACHE_THRESHOLD = float(
+    os.environ.get("OPTIMODEL_SEMANTIC_CACHE_THRESHOLD", "0.95")
+)
+SEMANTIC_CACHE_MAX_BYTES = int(
+    os.environ.get("OPTIMODEL_SEMANTIC_CACHE_MAX_BYTES", str(64 * 1024 * 1024))
+)
+SEMANTIC_CACHE_TTL_SECONDS = float(
+    os.environ.get("OPTIMODEL_SEMANTIC_CACHE_TTL_SECONDS", "3600")
+)
+SEMANTIC_CACHE_HNSW_MIN_ENTRIES = int(
+    os.environ.get("OPTIMODEL_SEMANTIC_CACHE_HNSW_MIN_ENTRIES", "2048")
+)
+
+"""
+Coalesce identical queries that are in flight at the same time into one upstream call.
+deterministic only coalesces requests that would get the same answer anyway (temperature
+0 or cacheable, see cacheTTL), all coalesces every identical request, off disables it
+"""
+COALESCE_REQUESTS = os.environ.get(
+    "OPTIMODEL_COALESCE_REQUESTS", "deterministic"
+).lower()
+
+"""
+Batch endpoint: default and max number of items we query at once per batch, and how
+many jobs (and for how long, in seconds) we keep around so they can be resumed
+"""
+BATCH_CONCURRENCY = int(os.environ.get("OPTIMODEL_BATCH_CONCURRENCY", "16"))
+BATCH_MAX_CONCURRENCY = int(os.environ.get("OPTIMODEL_BATCH_MAX_CONCURRENCY", "128"))
+BATCH_JOB_MAX_JOBS = int(os.environ.get("OPTIMODEL_BATCH_JOB_MAX_JOBS", "100"))
+BATCH_JOB_TTL_SECONDS = float(
+    os.environ.get("OPTIMODEL_BATCH_JOB_TTL_SECONDS", str(24 * 60 * 60))
+)
+
+"""
+Batch uploads are read in full before we start responding, anything past this many
+bytes is spooled to a temp file instead of kept in memory
+"""
+BATCH_SPOOL_MAX_MEMORY_BYTES = int(
+    os.environ.get("OPTIMODEL_BATCH_SPOOL_MAX_MEMORY_BYTES", str(8 * 1024 * 1024))
+)
+
+"""
+Streaming: when postQuery guards run on a streamed response. completion checks the full
+output once the stream is done, incremental also checks the output so far every
+STREAM_GUARD_INTERVAL_CHARS characters and stops the stream if a blocking guard fails.
+In completion mode output is held back until the guards pass if any of them blocks.
+Requests can override the mode with streamGuardMode
+"""
+STREAM_GUARD_MODE = os.environ.get(
+    "OPTIMODEL_STREAM_GUARD_MODE", "completion"
+).lower()
+STREAM_GUARD_INTERVAL_CHARS = int(
+    os.environ.get("OPTIMODEL_STREAM_GUARD_INTERVAL_CHARS", "256")
+)
+
+"""
+Shared HTTP clients the proxy routes use to reach the upstream APIs, one connection pool
+per upstream. HTTP/2 is used if h2 is installed (pip install optimodel-server[http2]).
+Max connections (and how many idle ones to keep alive, for how long) per upstream, and
+connect / read timeouts in seconds
+"""
+PROXY_HTTP2 = os.environ.get("OPTIMODEL_PROXY_HTTP2", "true").lower() in [
+    "1",
+    "true",
+    "yes",
+]
+PROXY_MAX_CONNECTIONS = int(os.environ.get("OPTIMODEL_PROXY_MAX_CONNECTIONS", "200"))
+PROXY_MAX_KEEPALIVE_CONNECTIONS = int(
+    os.environ.get("OPTIMODEL_PROXY_MAX_KEEPALIVE_CONNECTIONS", "50")
+)
+PROXY_KEEPALIVE_EXPIRY_SECONDS = float(
+    os.environ.get("OPTIMODEL_PROXY_KEEPALIVE_EXPIRY_SECONDS", "60")
+)
+PROXY_CONNECT_TIMEOUT_SECONDS = float(
+    os.environ.get("OPTIMODEL_PROXY_CONNECT_TIMEOUT_SECONDS", "10")
+)
+PROXY_READ_TIMEOUT_SECONDS = float(
+    os.environ.get("OPTIMODEL_PROXY_READ_TIMEOUT_SECONDS", "600")
+)
+
+"""
+Forward non streaming proxy responses untouched, with the lytix-proxy-payload (usage,
+cost and guard errors, base64 JSON) in the x-lytix-proxy-payload header instead of
+spliced into the body. Requests can override it with the x-lytix-proxy-passthrough header
+"""
+PROXY_PASSTHROUGH = os.environ.get("OPTIMODEL_PROXY_PASSTHROUGH", "false").lower() in [
+    "1",
+    "true",
+    "yes",
+]
+
+"""
+If a proxy route's own upstream (e.g. api.anthropic.com) is rate limited or down, route
+the same model through the planner to another provider that hosts it (e.g. Claude via
+Bedrock), answering in the same wire format. Requests can override it with
+lytix-crossProviderFailover
+"""
+PROXY_CROSS_PROVIDER_FAILOVER = os.environ.get(
+    "OPTIMODEL_PROXY_CROSS_PROVIDER_FAILOVER", "true"
+).lower() in ["1", "true", "yes"]
@@ -1 +1,7 @@
 from .guardClient import GuardClient
+from optimodel_server.Config import config
+
+"""
+Shared instance used by the query endpoint and all proxies, so they share one session
+"""
+guardClientInstance = GuardClient(config.guardServerURL)
@@ -1,51 +1,200 @@
 import aiohttp
 from urllib.parse import urljoin
+import hashlib
 import json
 import logging
 import sys
 from optimodel_types import GuardResponse, ModelMessage, Guards
+from optimodel_server.Config.types import (
+    GUARD_BATCH,
+    GUARD_CLIENT_CACHE_SIZE,
+    GUARD_CLIENT_CACHE_TTL_SECONDS,
+    GUARD_CLIENT_POOL_SIZE,
+    GUARD_CLIENT_TIMEOUT_SECONDS,
+)
 from optimodel_server.OptimodelError import OptimodelError
+from optimodel_server.Utils.TTLCache import TTLCache
 
 logging.basicConfig(stream=sys.stdout, level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
 class GuardClient:
-    def __init__(self, guardServerURL: str):
+    def __init__(
+        self,
+        guardServerURL: str,
+        poolSize: int = GUARD_CLIENT_POOL_SIZE,
+        timeoutSeconds: float = GUARD_CLIENT_TIMEOUT_SECONDS,
+        cacheSize: int = GUARD_CLIENT_CACHE_SIZE,
+        cacheTTLSeconds: float = GUARD_CLIENT_CACHE_TTL_SECONDS,
+    ):
         self.guardServerURL = urljoin(guardServerURL, "optimodel-guard/api/v1/guard")
+        self.guardBatchURL = urljoin(
+            guardServerURL, "optimodel-guard/api/v1/guard/batch"
+        )
+        """
+        Flipped off if the guard server is too old to have the batch endpoint
+        """
+        self.supportsBatch = GUARD_BATCH
+        self.poolSize = poolSize
+        self.timeoutSeconds = timeoutSeconds
+        self.session: aiohttp.ClientSession | None = None
+
+        """
+        Guard responses we've already seen, skips the round trip entirely on a hit
+        """
+        self.cache = (
+            TTLCache(maxSize=cacheSize, ttlSeconds=cacheTTLSeconds)
+            if cacheSize > 0
+            else None
+        )
+
+    async def start(self) -> aiohttp.ClientSession:
+        """
+        Create our long lived session (and its connection pool). Called at app startup,
+        but also lazily in case we're used outside of the app lifecycle
+        """
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.poolSize),
+                timeout=aiohttp.ClientTimeout(total=self.timeoutSeconds),
+                json_serialize=lambda object: json.dumps(
+                    object, separators=(",", ":"), cls=GuardObjectEncoder
+                ),
+            )
+        return self.session
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
 
     async def checkGuard(
         self,
         guards: Guards,
         messages: list[ModelMessage],
         modelOutput: str | None = None,
+        sessionId: str | None = None,
     ) -> GuardResponse:
         """
         Check a single guard given an input
         """
-        # Make our request to our guard server
-        async with aiohttp.ClientSession(
-            json_serialize=lambda object: json.dumps(
-                object, indent=4, cls=GuardObjectEncoder
-            )
-        ) as session:
-            if modelOutput:
-                # Add it to messages with the assistant role
-                messages.append(ModelMessage(role="assistant", content=modelOutput))
+        cacheKey = self._cacheKey(guards, messages, modelOutput)
+        if cacheKey is not None:
+            cached = self.cache.get(cacheKey)
+            if cached is not None:
+                return cached
+
+        session = await self.start()
+        if modelOutput:
+            # Add it to messages with the assistant role. Copy so concurrent guard
+            # checks don't see each others output
+            messages = [*messages, ModelMessage(role="assistant", content=modelOutput)]
+        try:
+            # Make our request to our guard server
+            async with session.post(
+                self.guardServerURL,
+                json={
+                    "guard": guards,
+                    "messages": messages,
+                    "sessionId": sessionId,
+                },
+            ) as response:
+                response_data = await response.json()
+        except Exception as e:
+            logger.error(f"Error checking guard: {e}")
+            raise OptimodelError(f"Error checking guard: {e}")
+
+        if cacheKey is not None and "failure" in response_data:
+            self.cache.set(cacheKey, response_data)
+        return response_data
+
+    async def checkGuards(
+        self,
+        guards: list[Guards],
+        messages: list[ModelMessage],
+        modelOutput: str | None = None,
+        sessionId: str | None = None,
+    ) -> list[GuardResponse] | None:
+        """
+        Check a list of guards in a single request to the batch endpoint. Results are in
+        guard order and stop after the first blocking failure.
+
+        @return None if the guard server doesn't support batching, callers should fall
+            back to checkGuard
+        """
+        if not self.supportsBatch:
+            return None
+
+        """
+        Only send the guards we don't have a cached response for
+        """
+        cacheKeys = [self._cacheKey(guard, messages, modelOutput) for guard in guards]
+        cached = [
+            self.cache.get(cacheKey) if cacheKey is not None else None
+            for cacheKey in cacheKeys
+        ]
+        missing = [index for index, response in enumerate(cached) if response is None]
+
+        fetched = []
+        if missing:
+            session = await self.start()
             try:
                 async with session.post(
-                    self.guardServerURL,
+                    self.guardBatchURL,
                     json={
-                        "guard": guards,
+                        "guards": [guards[index] for index in missing],
                         "messages": messages,
+                        "modelOutput": modelOutput,
+                        "sessionId": sessionId,
                     },
                 ) as response:
-                    print(f"response: {response}")
+                    if response.status in [404, 405]:
+                        logger.warning(
+                            "Guard server does not support batching, falling back to single guard checks"
+                        )
+                        self.supportsBatch = False
+                        return None
                     response_data = await response.json()
-                    return response_data
+                    fetched = response_data["results"]
             except Exception as e:
-                logger.error(f"Error checking guard: {e}")
-                raise OptimodelError(f"Error checking guard: {e}")
+                logger.error(f"Error checking guards: {e}")
+                raise OptimodelError(f"Error checking guards: {e}")
+
+        for index, guardResponse in zip(missing, fetched):
+            cached[index] = guardResponse
+            if cacheKeys[index] is not None:
+                self.cache.set(cacheKeys[index], guardResponse)
+
+        """
+        Put the results back in guard order. The server stops after the first blocking
+        failure, so we do the same
+        """
+        results = []
+        for guard, guardResponse in zip(guards, cached):
+            if guardResponse is None:
+                break
+            results.append(guardResponse)
+            if guardResponse["failure"] is True and guard.blockRequest is True:
+                break
+        return results
+
+    def _cacheKey(
+        self,
+        guards: Guards,
+        messages: list[ModelMessage],
+        modelOutput: str | None,
+    ) -> str | None:
+        if self.cache is None:
+            return None
+        return hashlib.sha256(
+            json.dumps(
+                [guards, messages, modelOutput], sort_keys=True, cls=GuardObjectEncoder
+            ).encode("utf-8")
+        ).hexdigest()
+
+    def stats(self) -> dict | None:
+        return self.cache.stats() if self.cache is not None else None
 
 
 class GuardObjectEncoder(json.JSONEncoder):
@@ -0,0 +1,258 @@
+import asyncio
+import time
+from typing import Any, Dict, List
+
+from optimodel_server.Config import config
+from optimodel_server.Config.types import (
+    ADMISSION_DEFAULT_GENERATION_TOKENS,
+    SAAS_MODE,
+)
+from optimodel_types import ModelMessage
+
+
+class TokenBucket:
+    """
+    Classic token bucket that refills perMinute tokens every minute, and can hold at most
+    a minute's worth. The level can go negative when we under estimated a request, later
+    requests then wait for the debt to be paid off
+    """
+
+    def __init__(self, perMinute: float):
+        self.capacity = perMinute
+        self.refillPerSecond = perMinute / 60
+        self.level = perMinute
+        self.updatedAt = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(
+            self.capacity, self.level + (now - self.updatedAt) * self.refillPerSecond
+        )
+        self.updatedAt = now
+
+    def secondsUntil(self, amount: float, now: float) -> float:
+        """
+        How long until we can take amount, 0 if we can right now
+        """
+        self._refill(now)
+        """
+        A single request bigger than the whole bucket would never fit, let it through
+        once the bucket is full instead
+        """
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0
+        return (amount - self.level) / self.refillPerSecond
+
+    def take(self, amount: float):
+        self.level -= amount
+
+    def adjust(self, delta: float):
+        """
+        Give back (positive) or take more (negative) once we know the real usage
+        """
+        self.level = min(self.capacity, self.level + delta)
+
+    def toDict(self) -> dict:
+        self._refill(time.monotonic())
+        return {"perMinute": self.capacity, "available": self.level}
+
+
+class Limiter:
+    """
+    Limits for a provider or a provider + model, read from the config:
+    rpm: requests per minute
+    tpm: tokens (prompt + generation) per minute
+    maxInFlight: max concurrent requests
+    Any of them can be left out
+    """
+
+    def __init__(self, limits: Dict[str, Any]):
+        self.requests = TokenBucket(limits["rpm"]) if limits.get("rpm") else None
+        self.tokens = TokenBucket(limits["tpm"]) if limits.get("tpm") else None
+        self.maxInFlight = limits.get("maxInFlight")
+        self.inFlight = asyncio.Semaphore(self.maxInFlight) if self.maxInFlight else None
+        self.rejected = 0
+
+    def secondsUntil(self, estimatedTokens: int, now: float) -> float:
+        return max(
+            self.requests.secondsUntil(1, now) if self.requests else 0,
+            self.tokens.secondsUntil(estimatedTokens, now) if self.tokens else 0,
+        )
+
+    def take(self, estimatedTokens: int):
+        if self.requests:
+            self.requests.take(1)
+        if self.tokens:
+            self.tokens.take(estimatedTokens)
+
+    def hasHeadroom(self, estimatedTokens: int) -> bool:
+        if self.inFlight is not None and self.inFlight.locked():
+            return False
+        return self.secondsUntil(estimatedTokens, time.monotonic()) == 0
+
+    def toDict(self) -> dict:
+        return {
+            "requests": self.requests.toDict() if self.requests else None,
+            "tokens": self.tokens.toDict() if self.tokens else None,
+            "maxInFlight": self.maxInFlight,
+            "available": self.inFlight._value if self.inFlight is not None else None,
+            "rejected": self.rejected,
+        }
+
+
+class AdmissionTicket:
+    """
+    Proof we were admitted, release it once the request is done
+    """
+
+    def __init__(self, limiters: List[Limiter], estimatedTokens: int):
+        self.limiters = limiters
+        self.estimatedTokens = estimatedTokens
+        self.released = False
+
+    def release(self, actualTokens: int | None = None):
+        """
+        @param actualTokens: Prompt + generation tokens the provider reported, used to
+            correct our estimate. None keeps the estimate (e.g. the request failed)
+        """
+        if self.released:
+            return
+        self.released = True
+        for limiter in self.limiters:
+            if actualTokens is not None and limiter.tokens is not None:
+                limiter.tokens.adjust(self.estimatedTokens - actualTokens)
+            if limiter.inFlight is not None:
+                limiter.inFlight.release()
+
+
+class AdmissionController:
+    """
+    Keeps us under the upstream rate limits instead of finding out from a storm of 429s.
+    Like the circuit breakers there is one limiter per provider (providerLimits in the
+    config) and one per provider + model (limits on the model entry), a request needs
+    room in both
+
+    @NOTE Limits describe the accounts the server was configured with. In SAAS mode every
+    request brings its own account, so we don't limit anything
+    """
+
+    def __init__(
+        self,
+        providerLimits: Dict[str, Dict[str, Any]],
+        modelToProvider: Dict[str, List[Dict[str, Any]]],
+    ):
+        self.limiters: Dict[str, Limiter] = {}
+        for provider, limits in providerLimits.items():
+            self.limiters[provider] = Limiter(limits)
+        for model, providers in modelToProvider.items():
+            for provider in providers:
+                if provider.get("limits"):
+                    self.limiters[f"{provider['provider']}/{model}"] = Limiter(
+                        provider["limits"]
+                    )
+
+    def _limiters(self, provider: str, model: str) -> List[Limiter]:
+        if SAAS_MODE is not None:
+            return []
+        return [
+            limiter
+            for limiter in [
+                self.limiters.get(provider),
+                self.limiters.get(f"{provider}/{model}"),
+            ]
+            if limiter is not None
+        ]
+
+    def hasHeadroom(self, provider: str, model: str, estimatedTokens: int) -> bool:
+        """
+        Could a request go through right now without waiting
+        """
+        return all(
+            limiter.hasHeadroom(estimatedTokens)
+            for limiter in self._limiters(provider, model)
+        )
+
+    async def admit(
+        self,
+        provider: str,
+        model: str,
+        estimatedTokens: int,
+        maxWaitSeconds: float = 0,
+    ) -> AdmissionTicket | None:
+        """
+        Wait (up to maxWaitSeconds) for a free in flight slot and room in the buckets
+
+        @return A ticket to release when the request is done, or None if we ran out of
+            time and the request should go elsewhere (or be rejected)
+        """
+        limiters = self._limiters(provider, model)
+        deadline = time.monotonic() + maxWaitSeconds
+
+        acquired: List[Limiter] = []
+        try:
+            for limiter in limiters:
+                if limiter.inFlight is None:
+                    continue
+                if not limiter.inFlight.locked():
+                    await limiter.inFlight.acquire()
+                else:
+                    remainingSeconds = deadline - time.monotonic()
+                    if remainingSeconds <= 0:
+                        raise asyncio.TimeoutError()
+                    await asyncio.wait_for(
+                        limiter.inFlight.acquire(), timeout=remainingSeconds
+                    )
+                acquired.append(limiter)
+
+            while True:
+                now = time.monotonic()
+                waitSeconds = max(
+                    [limiter.secondsUntil(estimatedTokens, now) for limiter in limiters]
+                    + [0]
+                )
+                if waitSeconds == 0:
+                    break
+                if now + waitSeconds > deadline:
+                    raise asyncio.TimeoutError()
+                await asyncio.sleep(waitSeconds)
+        except asyncio.TimeoutError:
+            for limiter in acquired:
+                limiter.inFlight.release()
+            for limiter in limiters:
+                limiter.rejected += 1
+            return None
+        except BaseException:
+            for limiter in acquired:
+                limiter.inFlight.release()
+            raise
+
+        for limiter in limiters:
+            limiter.take(estimatedTokens)
+        return AdmissionTicket(limiters, estimatedTokens)
+
+    def snapshot(self) -> dict:
+        return {key: limiter.toDict() for key, limiter in self.limiters.items()}
+
+
+def estimateTokens(messages: List[ModelMessage], maxGenLen: int | None) -> int:
+    """
+    Rough token count for a request before we send it, ~4 characters per token for the
+    prompt plus the most we could generate
+    """
+    characters = 0
+    for message in messages:
+        if isinstance(message.content, str):
+            characters += len(message.content)
+        else:
+            for entry in message.content:
+                if entry.text is not None:
+                    characters += len(entry.text)
+    return characters // 4 + (
+        maxGenLen if maxGenLen is not None else ADMISSION_DEFAULT_GENERATION_TOKENS
+    )
+
+
+admissionController = AdmissionController(
+    providerLimits=config.config.get("providerLimits", {}),
+    modelToProvider=config.modelToProvider,
+)
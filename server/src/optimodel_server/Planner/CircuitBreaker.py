@@ -0,0 +1,296 @@
+import asyncio
+import enum
+import hashlib
+import json
+import threading
+import time
+from typing import Any, List
+
+from optimodel_server.Config.types import (
+    CIRCUIT_COOLDOWN_SECONDS,
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_HALF_OPEN_PROBES,
+    SAAS_MODE,
+)
+from optimodel_server.OptimodelError import OptimodelError
+from optimodel_server.Planner.RoutingTable import PROVIDER_CREDENTIALS
+
+
+class CircuitState(enum.Enum):
+    closed = "closed"
+    open = "open"
+    halfOpen = "halfOpen"
+
+
+class CircuitBreaker:
+    """
+    Classic closed -> open -> half open breaker.
+    closed: everything goes through, failureThreshold consecutive failures opens it
+    open: nothing goes through until coolDownSeconds have passed
+    halfOpen: up to maxProbes requests go through, a success closes it, a failure opens
+        it again for another cool down
+
+    @NOTE Callers must hold the lock, see CircuitBreakerRegistry
+    """
+
+    def __init__(self, failureThreshold: int, coolDownSeconds: float, maxProbes: int):
+        self.failureThreshold = failureThreshold
+        self.coolDownSeconds = coolDownSeconds
+        self.maxProbes = max(1, maxProbes)
+        self.state = CircuitState.closed
+        self.consecutiveFailures = 0
+        self.openedAt = 0.0
+        self.probesInFlight = 0
+        self.lastProbeAt = 0.0
+
+    def isAvailable(self, now: float) -> bool:
+        """
+        Would a request be let through right now (without reserving a probe)
+        """
+        match self.state:
+            case CircuitState.closed:
+                return True
+            case CircuitState.open:
+                return now >= self.openedAt + self.coolDownSeconds
+            case CircuitState.halfOpen:
+                """
+                A probe that never reported back (e.g. cancelled) shouldn't keep the
+                circuit half open forever
+                """
+                return (
+                    self.probesInFlight < self.maxProbes
+                    or now >= self.lastProbeAt + self.coolDownSeconds
+                )
+
+    def tryAcquire(self, now: float) -> bool:
+        """
+        Let a request through if we can, reserving a probe slot when half open
+        """
+        if not self.isAvailable(now):
+            return False
+        if self.state == CircuitState.closed:
+            return True
+        staleProbe = now >= self.lastProbeAt + self.coolDownSeconds
+        if self.state == CircuitState.open or staleProbe:
+            self.state = CircuitState.halfOpen
+            self.probesInFlight = 0
+        self.probesInFlight += 1
+        self.lastProbeAt = now
+        return True
+
+    def release(self):
+        """
+        The request finished without telling us anything about the provider's health
+        """
+        if self.state == CircuitState.halfOpen:
+            self.probesInFlight = max(0, self.probesInFlight - 1)
+
+    def recordSuccess(self):
+        self.state = CircuitState.closed
+        self.consecutiveFailures = 0
+        self.probesInFlight = 0
+
+    def recordFailure(self, now: float):
+        self.consecutiveFailures += 1
+        if (
+            self.state == CircuitState.halfOpen
+            or self.consecutiveFailures >= self.failureThreshold
+        ):
+            self.state = CircuitState.open
+            self.openedAt = now
+            self.probesInFlight = 0
+
+    def toDict(self, now: float) -> dict:
+        return {
+            "state": self.state.value,
+            "consecutiveFailures": self.consecutiveFailures,
+            "secondsUntilProbe": (
+                max(0, self.openedAt + self.coolDownSeconds - now)
+                if self.state == CircuitState.open
+                else None
+            ),
+        }
+
+
+class CircuitBreakerRegistry:
+    """
+    One breaker per provider (is the provider down) and one per provider + model (is the
+    model down on that provider). A request needs both to let it through.
+
+    The provider breaker only counts outages (see isProviderOutage), a single broken
+    model or a rate limit shouldn't take every model on the provider down with it. In
+    SAAS mode both are kept per credential, so one tenant's bad key or rate limit doesn't
+    open the circuit for everyone else.
+
+    A missing breaker is a closed one, breakers are only created on a failure and
+    dropped again on a success, so we only keep state for what's actually failing
+    """
+
+    def __init__(self, failureThreshold: int, coolDownSeconds: float, maxProbes: int):
+        self.failureThreshold = failureThreshold
+        self.coolDownSeconds = coolDownSeconds
+        self.maxProbes = maxProbes
+        self.breakers: dict[str, CircuitBreaker] = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _keys(
+        provider: str, model: str, credentials: List[Any] | None
+    ) -> tuple[str, str]:
+        """
+        @return (provider key, provider + model key)
+        """
+        prefix = provider
+        tenant = tenantKey(provider, credentials)
+        if tenant is not None:
+            prefix = f"{provider}#{tenant}"
+        return prefix, f"{prefix}/{model}"
+
+    def _create(self, key: str) -> CircuitBreaker:
+        breaker = self.breakers.get(key)
+        if breaker is None:
+            breaker = self.breakers[key] = CircuitBreaker(
+                failureThreshold=self.failureThreshold,
+                coolDownSeconds=self.coolDownSeconds,
+                maxProbes=self.maxProbes,
+            )
+        return breaker
+
+    def isAvailable(
+        self, provider: str, model: str, credentials: List[Any] | None = None
+    ) -> bool:
+        now = time.monotonic()
+        with self.lock:
+            return all(
+                self.breakers[key].isAvailable(now)
+                for key in self._keys(provider, model, credentials)
+                if key in self.breakers
+            )
+
+    def tryAcquire(
+        self, provider: str, model: str, credentials: List[Any] | None = None
+    ) -> bool:
+        now = time.monotonic()
+        with self.lock:
+            providerKey, modelKey = self._keys(provider, model, credentials)
+            providerBreaker = self.breakers.get(providerKey)
+            modelBreaker = self.breakers.get(modelKey)
+            if providerBreaker is not None and not providerBreaker.tryAcquire(now):
+                return False
+            if modelBreaker is not None and not modelBreaker.tryAcquire(now):
+                if providerBreaker is not None:
+                    providerBreaker.release()
+                return False
+            return True
+
+    def release(
+        self, provider: str, model: str, credentials: List[Any] | None = None
+    ):
+        with self.lock:
+            for key in self._keys(provider, model, credentials):
+                if key in self.breakers:
+                    self.breakers[key].release()
+
+    def recordSuccess(
+        self, provider: str, model: str, credentials: List[Any] | None = None
+    ):
+        with self.lock:
+            for key in self._keys(provider, model, credentials):
+                self.breakers.pop(key, None)
+
+    def recordFailure(
+        self,
+        provider: str,
+        model: str,
+        credentials: List[Any] | None = None,
+        outage: bool = False,
+    ):
+        """
+        @param outage: The provider itself looks down (see isProviderOutage), also count
+            it against the provider breaker
+        """
+        now = time.monotonic()
+        with self.lock:
+            providerKey, modelKey = self._keys(provider, model, credentials)
+            self._create(modelKey).recordFailure(now)
+            if outage:
+                self._create(providerKey).recordFailure(now)
+            elif providerKey in self.breakers:
+                """
+                A half open provider breaker let this through as a probe
+                """
+                self.breakers[providerKey].release()
+
+    def snapshot(self) -> dict:
+        """
+        Every breaker that isn't closed (or is counting failures)
+        """
+        now = time.monotonic()
+        with self.lock:
+            return {key: breaker.toDict(now) for key, breaker in self.breakers.items()}
+
+
+def tenantKey(provider: str, credentials: List[Any] | None) -> str | None:
+    """
+    In SAAS mode, a short hash of the credential the request uses for the provider
+    """
+    if SAAS_MODE is None or not credentials:
+        return None
+    credentialType = PROVIDER_CREDENTIALS.get(provider)
+    for credential in credentials:
+        if credentialType is not None and isinstance(credential, credentialType):
+            return hashlib.sha256(
+                json.dumps(credential.dict(), sort_keys=True).encode("utf-8")
+            ).hexdigest()[:16]
+    return None
+
+
+def statusCodeOf(e: Exception) -> int | None:
+    statusCode = getattr(e, "status_code", None)
+    if statusCode is None:
+        statusCode = getattr(e, "code", None)
+    if statusCode is None:
+        # botocore puts the status code in the response metadata
+        response = getattr(e, "response", None)
+        if isinstance(response, dict):
+            statusCode = response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    return statusCode if isinstance(statusCode, int) else None
+
+
+def isProviderFailure(e: Exception) -> bool:
+    """
+    If an error from a provider says something about its health. Errors we raise
+    ourselves (e.g. model or JSON mode not supported) and 4xx responses (bad request, bad
+    credentials in SAAS mode) are the caller's problem, so they shouldn't trip a breaker
+    """
+    if isinstance(e, OptimodelError):
+        return False
+
+    statusCode = statusCodeOf(e)
+    if statusCode is not None and 400 <= statusCode < 500:
+        return statusCode in [408, 429]
+    return True
+
+
+def isProviderOutage(e: Exception) -> bool:
+    """
+    If a provider failure says the whole provider is down (5xx, connection errors and
+    timeouts), not just a model or a rate limit. Every SDK names its connection and
+    timeout errors differently, so we go by the name
+    """
+    if isinstance(e, OptimodelError):
+        return False
+    statusCode = statusCodeOf(e)
+    if statusCode is not None:
+        return statusCode >= 500
+    if isinstance(e, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    name = type(e).__name__
+    return "Connection" in name or "Timeout" in name
+
+
+circuitBreakers = CircuitBreakerRegistry(
+    failureThreshold=CIRCUIT_FAILURE_THRESHOLD,
+    coolDownSeconds=CIRCUIT_COOLDOWN_SECONDS,
+    maxProbes=CIRCUIT_HALF_OPEN_PROBES,
+)
@@ -1,125 +1,69 @@
 import logging
+import math
 
 from optimodel_server.Config import config
 from optimodel_server.OptimodelError import OptimodelError
+from optimodel_server.Planner.AdmissionControl import (
+    admissionController,
+    estimateTokens,
+)
+from optimodel_server.Planner.CircuitBreaker import circuitBreakers
+from optimodel_server.Planner.ProviderStats import ProviderStat, providerStats
+from optimodel_server.Planner.RoutingTable import (
+    RoutingTable,
+    averagePrice,
+    credentialMask,
+)
 from optimodel_types import (
-    GeminiCredentials,
-    GroqCredentials,
-    MistralAICredentials,
-    MistralCodeStralCredentials,
     QueryBody,
-    SpeedPriority,
-    TogetherAICredentials,
-    AWSBedrockCredentials,
-    OpenAICredentials,
-    AnthropicCredentials,
     Providers,
+    RoutingObjective,
+)
+from optimodel_server.Config.types import (
+    ROUTING_LATENCY_SLO_MS,
+    ROUTING_OBJECTIVE,
+    SAAS_MODE,
 )
-from optimodel_server.Config.types import SAAS_MODE
 
 
 logger = logging.getLogger(__name__)
 
+try:
+    defaultRoutingObjective = RoutingObjective(ROUTING_OBJECTIVE)
+except ValueError:
+    logger.warning(f"Unknown routing objective {ROUTING_OBJECTIVE}, using static")
+    defaultRoutingObjective = RoutingObjective.static
 
-def getAllAvailableProviders(body: QueryBody):
-    """
-    First extract the model, and get all configs for it
-    """
-    allAvailableProviders = config.modelToProvider.get(body.modelToUse, [])
-
-    """
-    If we've explicitly passed a provider, filter our list to only that provider
-    """
-    logger.info(f"allAvailableProviders: {allAvailableProviders}")
+"""
+Candidates per (model, speedPriority), sorted once from our config
+"""
+routingTable = RoutingTable(config.modelToProvider)
 
-    if body.provider is not None:
-        allAvailableProviders = [
-            provider
-            for provider in allAvailableProviders
-            if provider["provider"] == body.provider.name
-        ]
 
+def getAllAvailableProviders(body: QueryBody) -> list:
     """
-    If we are running in SAAS mode, filter our any that we dont have creds for
+    Get all providers for the model in static order (see RoutingTable). If we've
+    explicitly passed a provider, only that provider, and never any we were asked to
+    exclude. If we are running in SAAS mode, only the ones we have creds for
     """
-
+    mask = None
     if SAAS_MODE is not None:
         if body.credentials is None:
             raise ValueError("No credentials provided")
-        filteredProviders = []
-        for provider in allAvailableProviders:
-            # Make sure we have the creds for this provider
-            if provider["provider"] == "together":
-                credsForProvider = next(
-                    (x for x in body.credentials if type(x) == TogetherAICredentials),
-                    None,
-                )
-                if credsForProvider is not None:
-                    # Cool we have the creds for this provider, its valid 🙌
-                    filteredProviders.append(provider)
-
-            if provider["provider"] == "bedrock":
-                credsForProvider = next(
-                    (x for x in body.credentials if type(x) == AWSBedrockCredentials),
-                    None,
-                )
-                if credsForProvider is not None:
-                    # Cool we have the creds for this provider, its valid 🙌
-                    filteredProviders.append(provider)
-
-            if provider["provider"] == "openai":
-                credsForProvider = next(
-                    (x for x in body.credentials if type(x) == OpenAICredentials),
-                    None,
-                )
-                if credsForProvider is not None:
-                    filteredProviders.append(provider)
-
-            if provider["provider"] == "groq":
-                credsForProvider = next(
-                    (x for x in body.credentials if type(x) == GroqCredentials),
-                    None,
-                )
-                if credsForProvider is not None:
-                    filteredProviders.append(provider)
-
-            if provider["provider"] == "anthropic":
-                credsForProvider = next(
-                    (x for x in body.credentials if type(x) == AnthropicCredentials),
-                    None,
-                )
-                if credsForProvider is not None:
-                    filteredProviders.append(provider)
-
-            if provider["provider"] == "mistralai":
-                credsForProvider = next(
-                    (x for x in body.credentials if type(x) == MistralAICredentials),
-                    None,
-                )
-                if credsForProvider is not None:
-                    filteredProviders.append(provider)
-
-            if provider["provider"] == "mistralcodestral":
-                credsForProvider = next(
-                    (
-                        x
-                        for x in body.credentials
-                        if type(x) == MistralCodeStralCredentials
-                    ),
-                    None,
-                )
-                if credsForProvider is not None:
-                    filteredProviders.append(provider)
-
-            if provider["provider"] == "gemini":
-                credsForProvider = next(
-                    (x for x in body.credentials if type(x) == GeminiCredentials),
-                    None,
-                )
-                if credsForProvider is not None:
-                    filteredProviders.append(provider)
-
-        allAvailableProviders = filteredProviders
+        mask = credentialMask(body.credentials)
+
+    allAvailableProviders = routingTable.candidates(
+        body.modelToUse,
+        body.speedPriority,
+        providerName=body.provider.name if body.provider is not None else None,
+        credentialMask=mask,
+        excludedProviders=(
+            [provider.name for provider in body.excludeProviders]
+            if body.excludeProviders
+            else None
+        ),
+    )
+    logger.info(f"allAvailableProviders: {allAvailableProviders}")
 
     # Bad luck, no providers for the model passed
     if len(allAvailableProviders) == 0:
@@ -136,18 +80,126 @@ def orderProviders(allAvailableProviders: list[Providers], body: QueryBody) -> l
     Heres our gameplan
     - Speed is most important to us, if the user says they want the fastest, always pick the fastest
     - Otherwise default to cost, we'd like to save money as much as we can
+    - If a routing objective is set, reorder by what we've actually observed from each provider
+    - Skip anything whose circuit breaker is open, no point waiting on a provider that is down
+
+    @NOTE The static (speed / cost) order is already baked into getAllAvailableProviders
+    by the routing table, we never sort the list in place
     """
-    if body.speedPriority == SpeedPriority.high:
-        """
-        Find the fastest model
-        """
-        allAvailableProviders.sort(key=lambda x: x["speed"])
-        return allAvailableProviders
-    else:
-        """
-        Find the cheapest model by avg the input/output price
-        """
-        allAvailableProviders.sort(
-            key=lambda x: (x["pricePer1MInput"] + x["pricePer1MOutput"]) / 2
+    orderedProviders = allAvailableProviders
+    routingObjective = body.routingObjective or defaultRoutingObjective
+    if routingObjective != RoutingObjective.static:
+        orderedProviders = orderProvidersAdaptive(
+            allAvailableProviders, body, routingObjective
         )
-        return allAvailableProviders
+
+    availableProviders = [
+        provider
+        for provider in orderedProviders
+        if circuitBreakers.isAvailable(
+            provider["provider"], body.modelToUse, body.credentials
+        )
+    ]
+    if len(availableProviders) == 0:
+        raise OptimodelError(
+            f"All providers for {body.modelToUse} are currently unavailable (circuit open): {[x['provider'] for x in orderedProviders]}"
+        )
+
+    """
+    Prefer providers with room under their rate limits, the rest are only tried (and
+    waited on) if those fail
+    """
+    if admissionController.limiters:
+        estimatedTokens = estimateTokens(body.messages, body.maxGenLen)
+        withHeadroom = []
+        saturated = []
+        for provider in availableProviders:
+            if admissionController.hasHeadroom(
+                provider["provider"], body.modelToUse, estimatedTokens
+            ):
+                withHeadroom.append(provider)
+            else:
+                saturated.append(provider)
+        availableProviders = withHeadroom + saturated
+    return availableProviders
+
+
+def orderProvidersAdaptive(
+    staticOrder: list, body: QueryBody, routingObjective: RoutingObjective
+) -> list:
+    """
+    Reorder the providers we have enough stats for by the routing objective. Providers we
+    don't have enough stats for (cold) keep their slot from the static order, so they
+    still get traffic and warm up
+    """
+    latencySLOSeconds = (
+        body.latencySLOMs if body.latencySLOMs is not None else ROUTING_LATENCY_SLO_MS
+    ) / 1000
+
+    warmProviders = []
+    for provider in staticOrder:
+        stat = providerStats.get(body.modelToUse, provider["provider"])
+        if stat is not None:
+            warmProviders.append((provider, stat))
+
+    if len(warmProviders) == 0:
+        return staticOrder
+
+    warmSorted = iter(
+        sorted(
+            warmProviders,
+            key=lambda x: routingScore(x[0], x[1], routingObjective, latencySLOSeconds),
+        )
+    )
+    warmIds = set(id(provider) for provider, _ in warmProviders)
+    ordered = [
+        next(warmSorted)[0] if id(provider) in warmIds else provider
+        for provider in staticOrder
+    ]
+    logger.info(
+        f"Adaptive ({routingObjective.value}) order: {[x['provider'] for x in ordered]}"
+    )
+    return ordered
+
+
+def routingScore(
+    provider: dict,
+    stat: ProviderStat,
+    routingObjective: RoutingObjective,
+    latencySLOSeconds: float,
+) -> tuple:
+    """
+    Lower is better. Latencies are inflated by the error rate, since a failed attempt
+    costs a whole extra attempt on the next provider
+    """
+    successRate = max(1 - stat.errorRate, 0.05)
+
+    match routingObjective:
+        case RoutingObjective.latency:
+            value = stat.latencySeconds
+        case RoutingObjective.p95Latency:
+            value = stat.p95LatencySeconds()
+        case RoutingObjective.ttft:
+            value = (
+                stat.ttftSeconds if stat.ttftSeconds is not None else stat.latencySeconds
+            )
+        case RoutingObjective.throughput:
+            if stat.tokensPerSecond is None:
+                return (2, math.inf)
+            return (0, -stat.tokensPerSecond * successRate)
+        case RoutingObjective.costUnderSLO:
+            """
+            Cheapest within the SLO first, then whatever is closest to the SLO
+            """
+            p95 = stat.p95LatencySeconds()
+            if p95 is None:
+                return (2, math.inf)
+            if p95 / successRate <= latencySLOSeconds:
+                return (0, averagePrice(provider))
+            return (1, p95 / successRate)
+        case _:
+            value = None
+
+    if value is None:
+        return (2, math.inf)
+    return (0, value / successRate)
@@ -0,0 +1,138 @@
+import math
+import threading
+from collections import deque
+
+from optimodel_server.Config.types import (
+    ROUTING_EWMA_ALPHA,
+    ROUTING_MIN_SAMPLES,
+    ROUTING_WINDOW_SIZE,
+)
+
+
+class ProviderStat:
+    """
+    Rolling stats for a single (model, provider) pair. Averages are exponentially
+    weighted so they track the provider as it degrades/recovers, percentiles come from a
+    window of the most recent latencies
+    """
+
+    def __init__(self, alpha: float, windowSize: int):
+        self.alpha = alpha
+        self.samples = 0
+        self.latencySeconds: float | None = None
+        self.ttftSeconds: float | None = None
+        self.tokensPerSecond: float | None = None
+        self.errorRate = 0.0
+        self.recentLatencies: deque = deque(maxlen=windowSize)
+
+    def _ewma(self, current: float | None, sample: float) -> float:
+        if current is None:
+            return sample
+        return self.alpha * sample + (1 - self.alpha) * current
+
+    def recordSuccess(
+        self,
+        latencySeconds: float,
+        generationTokens: int | None = None,
+        ttftSeconds: float | None = None,
+    ):
+        self.samples += 1
+        self.latencySeconds = self._ewma(self.latencySeconds, latencySeconds)
+        self.recentLatencies.append(latencySeconds)
+        if ttftSeconds is not None:
+            self.ttftSeconds = self._ewma(self.ttftSeconds, ttftSeconds)
+        if generationTokens and latencySeconds > 0:
+            self.tokensPerSecond = self._ewma(
+                self.tokensPerSecond, generationTokens / latencySeconds
+            )
+        self.errorRate = self._ewma(self.errorRate, 0.0)
+
+    def recordFailure(self):
+        self.samples += 1
+        self.errorRate = self._ewma(self.errorRate, 1.0)
+
+    def latencyPercentileSeconds(self, percentile: float) -> float | None:
+        """
+        Nearest rank percentile (0-100) over our recent window
+        """
+        if len(self.recentLatencies) == 0:
+            return None
+        latencies = sorted(self.recentLatencies)
+        rank = math.ceil(percentile / 100 * len(latencies)) - 1
+        return latencies[min(len(latencies) - 1, max(0, rank))]
+
+    def p95LatencySeconds(self) -> float | None:
+        return self.latencyPercentileSeconds(95)
+
+    def toDict(self) -> dict:
+        return {
+            "samples": self.samples,
+            "latencySeconds": self.latencySeconds,
+            "p95LatencySeconds": self.p95LatencySeconds(),
+            "ttftSeconds": self.ttftSeconds,
+            "tokensPerSecond": self.tokensPerSecond,
+            "errorRate": self.errorRate,
+        }
+
+
+class ProviderStats:
+    """
+    Stats for every (model, provider) pair we've sent traffic to, fed by queryModelMain and
+    used by the Planner for adaptive routing
+    """
+
+    def __init__(self, alpha: float, windowSize: int, minSamples: int):
+        self.alpha = alpha
+        self.windowSize = windowSize
+        self.minSamples = minSamples
+        self.stats: dict[tuple[str, str], ProviderStat] = {}
+        self.lock = threading.Lock()
+
+    def _getOrCreate(self, model: str, provider: str) -> ProviderStat:
+        key = (model, provider)
+        stat = self.stats.get(key)
+        if stat is None:
+            stat = self.stats.setdefault(
+                key, ProviderStat(alpha=self.alpha, windowSize=self.windowSize)
+            )
+        return stat
+
+    def recordSuccess(
+        self,
+        model: str,
+        provider: str,
+        latencySeconds: float,
+        generationTokens: int | None = None,
+        ttftSeconds: float | None = None,
+    ):
+        with self.lock:
+            self._getOrCreate(model, provider).recordSuccess(
+                latencySeconds, generationTokens=generationTokens, ttftSeconds=ttftSeconds
+            )
+
+    def recordFailure(self, model: str, provider: str):
+        with self.lock:
+            self._getOrCreate(model, provider).recordFailure()
+
+    def get(self, model: str, provider: str) -> ProviderStat | None:
+        """
+        Stats for the pair, or None if we haven't seen enough traffic to trust them yet
+        """
+        stat = self.stats.get((model, provider))
+        if stat is None or stat.samples < self.minSamples:
+            return None
+        return stat
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                f"{model}/{provider}": stat.toDict()
+                for (model, provider), stat in self.stats.items()
+            }
+
+
+providerStats = ProviderStats(
+    alpha=ROUTING_EWMA_ALPHA,
+    windowSize=ROUTING_WINDOW_SIZE,
+    minSamples=ROUTING_MIN_SAMPLES,
+)
@@ -0,0 +1,126 @@
+from typing import Any, Collection, Dict, List, NamedTuple, Tuple
+
+from optimodel_types import (
+    AnthropicCredentials,
+    AWSBedrockCredentials,
+    GeminiCredentials,
+    GroqCredentials,
+    MistralAICredentials,
+    MistralCodeStralCredentials,
+    OpenAICredentials,
+    SpeedPriority,
+    TogetherAICredentials,
+)
+
+"""
+Credentials each provider (as named in our config) needs in SAAS mode
+"""
+PROVIDER_CREDENTIALS = {
+    "together": TogetherAICredentials,
+    "bedrock": AWSBedrockCredentials,
+    "openai": OpenAICredentials,
+    "groq": GroqCredentials,
+    "anthropic": AnthropicCredentials,
+    "mistralai": MistralAICredentials,
+    "mistralcodestral": MistralCodeStralCredentials,
+    "gemini": GeminiCredentials,
+}
+
+"""
+One bit per credential type, so filtering candidates by the credentials on a request is
+a single AND per candidate
+"""
+CREDENTIAL_BITS = {
+    credentialType: 1 << index
+    for index, credentialType in enumerate(PROVIDER_CREDENTIALS.values())
+}
+
+
+def averagePrice(provider: dict) -> float:
+    return (provider["pricePer1MInput"] + provider["pricePer1MOutput"]) / 2
+
+
+def credentialMask(credentials: List[Any] | None) -> int:
+    """
+    Index the credentials on a request by type, once per request
+    """
+    mask = 0
+    for credential in credentials or []:
+        mask |= CREDENTIAL_BITS.get(type(credential), 0)
+    return mask
+
+
+class RouteCandidate(NamedTuple):
+    provider: Dict[str, Any]
+    providerName: str
+    credentialBit: int
+
+
+class RoutingTable:
+    """
+    Provider candidates for every (model, speedPriority), sorted once when the config is
+    loaded. Tuples are never mutated, so concurrent requests can share them and planning
+    is a dict lookup plus a filter
+    """
+
+    def __init__(self, modelToProvider: Dict[str, List[Dict[str, Any]]]):
+        self.routes: Dict[Tuple[str, SpeedPriority], Tuple[RouteCandidate, ...]] = {}
+        for model, providers in modelToProvider.items():
+            candidates = [
+                RouteCandidate(
+                    provider=provider,
+                    providerName=provider["provider"],
+                    credentialBit=CREDENTIAL_BITS.get(
+                        PROVIDER_CREDENTIALS.get(provider["provider"]), 0
+                    ),
+                )
+                for provider in providers
+            ]
+            """
+            Speed is most important when asked for, otherwise default to cost by
+            averaging the input/output price
+            """
+            self.routes[(model, SpeedPriority.high)] = tuple(
+                sorted(candidates, key=lambda x: x.provider["speed"])
+            )
+            self.routes[(model, SpeedPriority.low)] = tuple(
+                sorted(candidates, key=lambda x: averagePrice(x.provider))
+            )
+
+    def candidates(
+        self,
+        model: str,
+        speedPriority: SpeedPriority | None,
+        providerName: str | None = None,
+        credentialMask: int | None = None,
+        excludedProviders: Collection[str] | None = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Providers for a model in static order
+
+        @param providerName: Only return this provider
+        @param credentialMask: Only return providers whose credentials are in the mask
+            (see credentialMask), None skips the check
+        @param excludedProviders: Never return these providers
+        """
+        routes = self.routes.get(
+            (
+                model,
+                (
+                    SpeedPriority.high
+                    if speedPriority == SpeedPriority.high
+                    else SpeedPriority.low
+                ),
+            ),
+            (),
+        )
+        return [
+            candidate.provider
+            for candidate in routes
+            if (providerName is None or candidate.providerName == providerName)
+            and (credentialMask is None or candidate.credentialBit & credentialMask)
+            and (
+                excludedProviders is None
+                or candidate.providerName not in excludedProviders
+            )
+        ]
@@ -2,3 +2,6 @@ from optimodel_server.Planner.Planner import (
     getAllAvailableProviders,
     orderProviders,
 )
+from optimodel_server.Planner.ProviderStats import providerStats
+from optimodel_server.Planner.CircuitBreaker import circuitBreakers
+from optimodel_server.Planner.AdmissionControl import admissionController
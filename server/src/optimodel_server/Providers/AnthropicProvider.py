@@ -1,5 +1,5 @@
 import os
-from optimodel_server import OptimodelError
+from optimodel_server.OptimodelError import OptimodelError
 
 import anthropic
 
@@ -8,10 +8,12 @@ from optimodel_types import (
     ModelTypes,
 )
 from optimodel_server.Config.types import SAAS_MODE
+from optimodel_server.Providers.ClientRegistry import clientRegistry
 from optimodel_server.Providers.BaseProviderClass import (
     BaseProviderClass,
     QueryResponse,
     QueryParams,
+    QueryResponseChunk,
 )
 
 
@@ -19,11 +21,17 @@ class AnthropicProvider(BaseProviderClass):
     supportSAASMode = True
     supportJSONMode = False
 
+    anthropicClient: anthropic.Anthropic | None = None
+    anthropicAsyncClient: anthropic.AsyncAnthropic | None = None
+
     def __init__(self):
         if os.environ.get("ANTHROPIC_API_KEY", None):
             self.anthropicClient = anthropic.Anthropic(
                 api_key=os.environ.get("ANTHROPIC_API_KEY")
             )
+            self.anthropicAsyncClient = anthropic.AsyncAnthropic(
+                api_key=os.environ.get("ANTHROPIC_API_KEY")
+            )
 
     def validateProvider(self):
         """
@@ -38,12 +46,33 @@ class AnthropicProvider(BaseProviderClass):
         self,
         params: QueryParams,
     ):
-        messages = params["messages"]
-        model = params["model"]
-        temperature = params.get("temperature", None)
-        maxGenLen = params.get("maxGenLen", None)
-        credentials = params.get("credentials", None)
+        request = self._buildRequest(params)
+        client = self._getClient(params.get("credentials", None), asyncClient=False)
+        response = client.messages.create(**request)
+        return self._parseResponse(response)
+
+    async def makeQueryAsync(
+        self,
+        params: QueryParams,
+    ):
+        request = self._buildRequest(params)
+        client = self._getClient(params.get("credentials", None), asyncClient=True)
+        response = await client.messages.create(**request)
+        return self._parseResponse(response)
+
+    async def makeQueryStream(
+        self,
+        params: QueryParams,
+    ):
+        request = self._buildRequest(params)
+        client = self._getClient(params.get("credentials", None), asyncClient=True)
+        stream = await client.messages.create(**request, stream=True)
+        async for event in stream:
+            chunk = self._parseEvent(event)
+            if chunk is not None:
+                yield chunk
 
+    def _getClient(self, credentials, asyncClient: bool):
         if SAAS_MODE is not None:
             if credentials is None:
                 # This should have been filtered out in the planner
@@ -57,12 +86,34 @@ class AnthropicProvider(BaseProviderClass):
                 # This should have been filtered out in the planner
                 raise OptimodelError("Anthropic credentials not found")
 
-            client = anthropic.Anthropic(api_key=anthropicCreds.anthropicApiKey)
-        else:
-            print("here>>13", self.anthropicClient)
-            if self.anthropicClient is None:
-                raise OptimodelError("Anthropic client not initialized")
-            client = self.anthropicClient
+            if asyncClient:
+                return clientRegistry.getClient(
+                    "anthropic",
+                    anthropicCreds,
+                    lambda: anthropic.AsyncAnthropic(
+                        api_key=anthropicCreds.anthropicApiKey
+                    ),
+                    variant="async",
+                )
+            return clientRegistry.getClient(
+                "anthropic",
+                anthropicCreds,
+                lambda: anthropic.Anthropic(api_key=anthropicCreds.anthropicApiKey),
+            )
+
+        client = self.anthropicAsyncClient if asyncClient else self.anthropicClient
+        if client is None:
+            raise OptimodelError("Anthropic client not initialized")
+        return client
+
+    def _buildRequest(self, params: QueryParams) -> dict:
+        """
+        Build the kwargs for messages.create, shared by the sync and async paths
+        """
+        messages = params["messages"]
+        model = params["model"]
+        temperature = params.get("temperature", None)
+        maxGenLen = params.get("maxGenLen", None)
 
         match model:
             case ModelTypes.claude_3_5_sonnet_20240620.name:
@@ -114,13 +165,17 @@ class AnthropicProvider(BaseProviderClass):
                             }
                         )
                 messageToPass.append({"role": message.role, "content": baseContent})
-        response = client.messages.create(
-            model=modelId,
-            system=systemMessage.content if systemMessage else anthropic.NOT_GIVEN,
-            messages=messageToPass,
-            temperature=temperature if temperature is not None else anthropic.NOT_GIVEN,
-            max_tokens=maxGenLen if maxGenLen is not None else 1024,
-        )
+        return {
+            "model": modelId,
+            "system": systemMessage.content if systemMessage else anthropic.NOT_GIVEN,
+            "messages": messageToPass,
+            "temperature": (
+                temperature if temperature is not None else anthropic.NOT_GIVEN
+            ),
+            "max_tokens": maxGenLen if maxGenLen is not None else 1024,
+        }
+
+    def _parseResponse(self, response) -> QueryResponse:
         promptTokenCount = response.usage.input_tokens
         generationTokenCount = response.usage.output_tokens
         modelOutput = response.content[0].text
@@ -129,3 +184,21 @@ class AnthropicProvider(BaseProviderClass):
             promptTokens=promptTokenCount,
             generationTokens=generationTokenCount,
         )
+
+    def _parseEvent(self, event) -> QueryResponseChunk | None:
+        """
+        Input tokens come with message_start, output tokens (and the stop reason) with
+        message_delta
+        """
+        match event.type:
+            case "message_start":
+                return QueryResponseChunk(promptTokens=event.message.usage.input_tokens)
+            case "content_block_delta":
+                if event.delta.type == "text_delta":
+                    return QueryResponseChunk(delta=event.delta.text)
+            case "message_delta":
+                return QueryResponseChunk(
+                    generationTokens=event.usage.output_tokens,
+                    finishReason=event.delta.stop_reason,
+                )
+        return None
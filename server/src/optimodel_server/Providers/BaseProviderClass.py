@@ -1,4 +1,22 @@
-from optimodel_types.providerTypes import QueryParams, QueryResponse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator
+
+from optimodel_server.Config.types import PROVIDER_THREAD_POOL_SIZE
+from optimodel_types.providerTypes import (
+    QueryParams,
+    QueryResponse,
+    QueryResponseChunk,
+)
+
+
+"""
+Shared, bounded pool used by providers that can't make native async calls. Sized via
+OPTIMODEL_PROVIDER_THREAD_POOL_SIZE so a slow upstream can't spawn unbounded threads
+"""
+providerThreadPool = ThreadPoolExecutor(
+    max_workers=PROVIDER_THREAD_POOL_SIZE, thread_name_prefix="optimodel-provider"
+)
 
 
 class BaseProviderClass:
@@ -25,9 +43,39 @@ class BaseProviderClass:
 
     def makeQuery(
         self,
-        queryParams: QueryParams,
+        params: QueryParams,
     ) -> QueryResponse:
         """
         Make a query to the provider given a model
         """
         pass
+
+    async def makeQueryAsync(
+        self,
+        params: QueryParams,
+    ) -> QueryResponse:
+        """
+        Async version of makeQuery, this is what the server calls. Providers with an
+        async SDK should override this, otherwise we fall back to running the blocking
+        makeQuery on our bounded thread pool so we never block the event loop
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            providerThreadPool, lambda: self.makeQuery(params=params)
+        )
+
+    async def makeQueryStream(
+        self,
+        params: QueryParams,
+    ) -> AsyncIterator[QueryResponseChunk]:
+        """
+        Stream the response as it's generated. Providers with a streaming API should
+        override this, the default makes the whole query and yields it as one chunk
+        """
+        response = await self.makeQueryAsync(params=params)
+        yield QueryResponseChunk(
+            delta=response.modelOutput,
+            promptTokens=response.promptTokens,
+            generationTokens=response.generationTokens,
+            finishReason="stop",
+        )
@@ -7,6 +7,7 @@ from optimodel_server.Providers.CommonUtils import containsImageInMessages
 
 from optimodel_types import AWSBedrockCredentials, ModelTypes
 from optimodel_server.Config.types import SAAS_MODE
+from optimodel_server.Providers.ClientRegistry import clientRegistry
 from optimodel_server.Providers.BaseProviderClass import (
     BaseProviderClass,
     QueryResponse,
@@ -15,8 +16,14 @@ from optimodel_server.Providers.BaseProviderClass import (
 
 
 class BedrockProvider(BaseProviderClass):
+    """
+    boto3 has no async client, so makeQueryAsync uses the BaseProviderClass thread
+    pool fallback (boto3 clients are thread safe)
+    """
+
     supportSAASMode = True
     supportJSONMode = False
+    bedrockClient = None
 
     def __init__(self):
         if SAAS_MODE is None:
@@ -81,13 +88,14 @@ class BedrockProvider(BaseProviderClass):
                     "Bedrock credentials not found", provider="bedrock"
                 )
 
-            session = boto3.Session(
-                aws_access_key_id=bedrockCreds.awsAccessKeyId,
-                aws_secret_access_key=bedrockCreds.awsSecretKey,
-                region_name=bedrockCreds.awsRegion,
-            )
-            client = session.client(
-                "bedrock-runtime", region_name=bedrockCreds.awsRegion
+            client = clientRegistry.getClient(
+                "bedrock",
+                bedrockCreds,
+                lambda: boto3.Session(
+                    aws_access_key_id=bedrockCreds.awsAccessKeyId,
+                    aws_secret_access_key=bedrockCreds.awsSecretKey,
+                    region_name=bedrockCreds.awsRegion,
+                ).client("bedrock-runtime", region_name=bedrockCreds.awsRegion),
             )
         else:
             if self.bedrockClient is None:
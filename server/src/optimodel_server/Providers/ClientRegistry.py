@@ -0,0 +1,70 @@
+import hashlib
+import json
+import logging
+from typing import Any, Callable, TypeVar
+
+from pydantic import BaseModel
+
+from optimodel_server.Config.types import (
+    CLIENT_CACHE_MAX_SIZE,
+    CLIENT_CACHE_TTL_SECONDS,
+)
+from optimodel_server.Utils.TTLCache import TTLCache
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class ClientRegistry:
+    """
+    Shared cache of SDK clients used in SAAS mode, so repeat tenants reuse a warm client
+    (and its HTTP connection pool) instead of paying TLS / botocore setup on every request.
+
+    Clients are keyed by provider + a sha256 of the credential object, we never keep the
+    raw credentials around as keys. On eviction (LRU or TTL) the registry drops its only
+    reference to the client, in-flight requests keep theirs and the client (and its
+    connection pool) is torn down once they finish. Python strings can't be zeroed in
+    place, so dropping every reference promptly is the best we can do for the secrets
+    """
+
+    def __init__(self, maxSize: int, ttlSeconds: float | None):
+        self.clients = TTLCache(
+            maxSize=maxSize, ttlSeconds=ttlSeconds, onEvict=self._onEvict
+        )
+
+    def getClient(
+        self,
+        provider: str,
+        credentials: BaseModel,
+        factory: Callable[[], T],
+        variant: str = "sync",
+    ) -> T:
+        """
+        Get a client for the given credentials, creating one with factory if needed
+
+        @param provider: Name of the provider (e.g. openai)
+        @param credentials: The credentials object the client is built from
+        @param factory: Function that builds a new client
+        @param variant: Used to keep e.g. sync and async clients for the same creds apart
+        """
+        key = (provider, variant, self.hashCredentials(credentials))
+        return self.clients.getOrCreate(key, factory)
+
+    @staticmethod
+    def hashCredentials(credentials: BaseModel) -> str:
+        return hashlib.sha256(
+            json.dumps(credentials.dict(), sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    def stats(self) -> dict:
+        return self.clients.stats()
+
+    def _onEvict(self, key: Any, client: Any):
+        logger.info(f"Evicting cached {key[0]} ({key[1]}) client")
+
+
+clientRegistry = ClientRegistry(
+    maxSize=CLIENT_CACHE_MAX_SIZE, ttlSeconds=CLIENT_CACHE_TTL_SECONDS
+)
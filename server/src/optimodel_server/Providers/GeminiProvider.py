@@ -4,10 +4,12 @@ import base64
 from optimodel_server.OptimodelError import OptimodelError
 
 from optimodel_server.Config.types import SAAS_MODE
+from optimodel_server.Providers.ClientRegistry import clientRegistry
 from optimodel_server.Providers.BaseProviderClass import (
     BaseProviderClass,
     QueryResponse,
     QueryParams,
+    QueryResponseChunk,
 )
 from optimodel_types import GeminiCredentials, ModelTypes, OpenAICredentials
 from google.ai import generativelanguage as glm
@@ -19,6 +21,9 @@ class GeminiProvider(BaseProviderClass):
     supportSAASMode = True
     supportJSONMode = True
 
+    geminiClient: glm.GenerativeServiceClient | None = None
+    geminiAsyncClient: glm.GenerativeServiceAsyncClient | None = None
+
     def __init__(self):
         if os.environ.get("GEMINI_API_KEY", None):
             self.geminiClient = glm.GenerativeServiceClient(
@@ -38,13 +43,37 @@ class GeminiProvider(BaseProviderClass):
         self,
         params: QueryParams,
     ):
-        messages = params["messages"]
-        model = params["model"]
-        temperature = params.get("temperature", None)
-        maxGenLen = params.get("maxGenLen", None)
-        credentials = params.get("credentials", None)
-        jsonMode = params.get("jsonMode", False)
+        model, content = self._buildRequest(params)
+        model._client = self._getClient(
+            params.get("credentials", None), asyncClient=False
+        )
+        response = model.generate_content(content)
+        return self._parseResponse(response)
+
+    async def makeQueryAsync(
+        self,
+        params: QueryParams,
+    ):
+        model, content = self._buildRequest(params)
+        model._async_client = self._getClient(
+            params.get("credentials", None), asyncClient=True
+        )
+        response = await model.generate_content_async(content)
+        return self._parseResponse(response)
+
+    async def makeQueryStream(
+        self,
+        params: QueryParams,
+    ):
+        model, content = self._buildRequest(params)
+        model._async_client = self._getClient(
+            params.get("credentials", None), asyncClient=True
+        )
+        stream = await model.generate_content_async(content, stream=True)
+        async for chunk in stream:
+            yield self._parseChunk(chunk)
 
+    def _getClient(self, credentials, asyncClient: bool):
         if SAAS_MODE is not None:
             if credentials is None:
                 # This should have been filtered out in the planner
@@ -60,13 +89,48 @@ class GeminiProvider(BaseProviderClass):
                 # This should have been filtered out in the planner
                 raise OptimodelError("Gemini credentials not found", provider="gemini")
 
-            client = glm.GenerativeServiceClient(
-                client_options={"api_key": geminiCreds.geminiApiKey}
+            if asyncClient:
+                return clientRegistry.getClient(
+                    "gemini",
+                    geminiCreds,
+                    lambda: glm.GenerativeServiceAsyncClient(
+                        client_options={"api_key": geminiCreds.geminiApiKey}
+                    ),
+                    variant="async",
+                )
+            return clientRegistry.getClient(
+                "gemini",
+                geminiCreds,
+                lambda: glm.GenerativeServiceClient(
+                    client_options={"api_key": geminiCreds.geminiApiKey}
+                ),
             )
+
+        if asyncClient:
+            """
+            The grpc asyncio channel needs to be created inside the running loop, so
+            build it lazily on first use rather than in __init__
+            """
+            if self.geminiAsyncClient is None and os.environ.get("GEMINI_API_KEY"):
+                self.geminiAsyncClient = glm.GenerativeServiceAsyncClient(
+                    client_options={"api_key": os.environ.get("GEMINI_API_KEY")}
+                )
+            client = self.geminiAsyncClient
         else:
-            if self.geminiClient is None:
-                raise OptimodelError("Gemini client not initialized", provider="gemini")
             client = self.geminiClient
+        if client is None:
+            raise OptimodelError("Gemini client not initialized", provider="gemini")
+        return client
+
+    def _buildRequest(self, params: QueryParams):
+        """
+        Build the GenerativeModel and content to send, shared by the sync and async paths
+        """
+        messages = params["messages"]
+        model = params["model"]
+        temperature = params.get("temperature", None)
+        maxGenLen = params.get("maxGenLen", None)
+        jsonMode = params.get("jsonMode", False)
 
         match model:
             case ModelTypes.gemini_1_5_pro.name:
@@ -116,7 +180,6 @@ class GeminiProvider(BaseProviderClass):
                 "max_output_tokens": maxGenLen,
             },
         )
-        model._client = client
 
         # inputMessage = ""
         inputMessages: list[str] = []
@@ -184,7 +247,9 @@ class GeminiProvider(BaseProviderClass):
 
         # print(">>>content", content)
 
-        response = model.generate_content(content)
+        return model, content
+
+    def _parseResponse(self, response) -> QueryResponse:
         promptTokenCount = response.usage_metadata.prompt_token_count
         generationTokenCount = response.usage_metadata.candidates_token_count
         modelOutput = response.text
@@ -193,3 +258,24 @@ class GeminiProvider(BaseProviderClass):
             promptTokens=promptTokenCount,
             generationTokens=generationTokenCount,
         )
+
+    def _parseChunk(self, chunk) -> QueryResponseChunk:
+        """
+        Gemini sends the usage so far with every chunk, the last one wins
+        """
+        usage = getattr(chunk, "usage_metadata", None)
+        candidate = chunk.candidates[0] if chunk.candidates else None
+        return QueryResponseChunk(
+            delta=(
+                "".join(part.text for part in candidate.content.parts)
+                if candidate is not None
+                else ""
+            ),
+            promptTokens=usage.prompt_token_count if usage else None,
+            generationTokens=usage.candidates_token_count if usage else None,
+            finishReason=(
+                candidate.finish_reason.name
+                if candidate is not None and candidate.finish_reason
+                else None
+            ),
+        )
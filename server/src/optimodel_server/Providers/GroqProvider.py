@@ -1,6 +1,6 @@
 import os
 
-from groq import NOT_GIVEN, Groq
+from groq import NOT_GIVEN, AsyncGroq, Groq
 from optimodel_server.OptimodelError import OptimodelError
 from optimodel_server.Providers.CommonUtils import containsImageInMessages
 
@@ -10,20 +10,24 @@ from optimodel_types import (
     ModelTypes,
 )
 from optimodel_server.Config.types import SAAS_MODE
+from optimodel_server.Providers.ClientRegistry import clientRegistry
 from optimodel_server.Providers.BaseProviderClass import (
     BaseProviderClass,
     QueryResponse,
     QueryParams,
+    QueryResponseChunk,
 )
 
 
 class GroqProvider(BaseProviderClass):
     supportSAASMode = True
-    groqClient: Groq
+    groqClient: Groq | None = None
+    groqAsyncClient: AsyncGroq | None = None
 
     def __init__(self):
         if os.environ.get("GROQ_API_KEY", None):
             self.groqClient = Groq(api_key=os.environ.get("GROQ_API_KEY"))
+            self.groqAsyncClient = AsyncGroq(api_key=os.environ.get("GROQ_API_KEY"))
 
     def validateProvider(self):
         """
@@ -38,24 +42,31 @@ class GroqProvider(BaseProviderClass):
         self,
         params: QueryParams,
     ):
-        messages = params["messages"]
-        model = params["model"]
-        temperature = params.get("temperature", None)
-        maxGenLen = params.get("maxGenLen", None)
-        credentials = params.get("credentials", None)
-        jsonMode = params.get("jsonMode", False)
+        request = self._buildRequest(params)
+        client = self._getClient(params.get("credentials", None), asyncClient=False)
+        response = client.chat.completions.create(**request)
+        return self._parseResponse(response)
 
-        if jsonMode is True:
-            raise OptimodelError("JSON mode not supported for Groq")
+    async def makeQueryAsync(
+        self,
+        params: QueryParams,
+    ):
+        request = self._buildRequest(params)
+        client = self._getClient(params.get("credentials", None), asyncClient=True)
+        response = await client.chat.completions.create(**request)
+        return self._parseResponse(response)
 
-        """
-        @NOTE Groq does not currently support image types
-        """
-        if containsImageInMessages(messages):
-            raise OptimodelError(
-                "Groq does not currently support image types", provider="groq"
-            )
+    async def makeQueryStream(
+        self,
+        params: QueryParams,
+    ):
+        request = self._buildRequest(params)
+        client = self._getClient(params.get("credentials", None), asyncClient=True)
+        stream = await client.chat.completions.create(**request, stream=True)
+        async for chunk in stream:
+            yield self._parseChunk(chunk)
 
+    def _getClient(self, credentials, asyncClient: bool):
         if SAAS_MODE is not None:
             if credentials is None:
                 # This should have been filtered out in the planner
@@ -69,11 +80,42 @@ class GroqProvider(BaseProviderClass):
                 # This should have been filtered out in the planner
                 raise OptimodelError("Groq credentials not found", provider="groq")
 
-            client = Groq(api_key=groqCreds.groqApiKey)
-        else:
-            if self.groqClient is None:
-                raise OptimodelError("Groq client not initialized", provider="groq")
-            client: Groq = self.groqClient
+            if asyncClient:
+                return clientRegistry.getClient(
+                    "groq",
+                    groqCreds,
+                    lambda: AsyncGroq(api_key=groqCreds.groqApiKey),
+                    variant="async",
+                )
+            return clientRegistry.getClient(
+                "groq", groqCreds, lambda: Groq(api_key=groqCreds.groqApiKey)
+            )
+
+        client = self.groqAsyncClient if asyncClient else self.groqClient
+        if client is None:
+            raise OptimodelError("Groq client not initialized", provider="groq")
+        return client
+
+    def _buildRequest(self, params: QueryParams) -> dict:
+        """
+        Build the kwargs for chat.completions.create, shared by the sync and async paths
+        """
+        messages = params["messages"]
+        model = params["model"]
+        temperature = params.get("temperature", None)
+        maxGenLen = params.get("maxGenLen", None)
+        jsonMode = params.get("jsonMode", False)
+
+        if jsonMode is True:
+            raise OptimodelError("JSON mode not supported for Groq")
+
+        """
+        @NOTE Groq does not currently support image types
+        """
+        if containsImageInMessages(messages):
+            raise OptimodelError(
+                "Groq does not currently support image types", provider="groq"
+            )
 
         match model:
             case ModelTypes.llama_3_8b_instruct.name:
@@ -111,13 +153,14 @@ class GroqProvider(BaseProviderClass):
                         f"No text found for role {message.role}", provider="groq"
                     )
 
-        response = client.chat.completions.create(
-            model=modelId,
-            messages=messagesParsed,
-            temperature=temperature,
-            max_tokens=maxGenLen if maxGenLen else NOT_GIVEN,
-        )
+        return {
+            "model": modelId,
+            "messages": messagesParsed,
+            "temperature": temperature,
+            "max_tokens": maxGenLen if maxGenLen else NOT_GIVEN,
+        }
 
+    def _parseResponse(self, response) -> QueryResponse:
         promptTokenCount = response.usage.prompt_tokens
         generationTokenCount = response.usage.completion_tokens
         modelOutput = response.choices[0].message.content
@@ -126,3 +169,17 @@ class GroqProvider(BaseProviderClass):
             promptTokens=promptTokenCount,
             generationTokens=generationTokenCount,
         )
+
+    def _parseChunk(self, chunk) -> QueryResponseChunk:
+        """
+        Groq reports usage in x_groq on the last chunk
+        """
+        choice = chunk.choices[0] if chunk.choices else None
+        xGroq = getattr(chunk, "x_groq", None)
+        usage = getattr(xGroq, "usage", None) if xGroq is not None else None
+        return QueryResponseChunk(
+            delta=(choice.delta.content or "") if choice is not None else "",
+            promptTokens=usage.prompt_tokens if usage else None,
+            generationTokens=usage.completion_tokens if usage else None,
+            finishReason=choice.finish_reason if choice is not None else None,
+        )
@@ -8,16 +8,19 @@ from optimodel_types import (
     ModelTypes,
 )
 from optimodel_server.Config.types import SAAS_MODE
+from optimodel_server.Providers.ClientRegistry import clientRegistry
 from optimodel_server.Providers.BaseProviderClass import (
     BaseProviderClass,
     QueryResponse,
     QueryParams,
+    QueryResponseChunk,
 )
 
 
 class MistralAIProvider(BaseProviderClass):
     supportSAASMode = True
     supportJSONMode = False
+    mistralClient: Mistral | None = None
 
     def __init__(self):
         if os.environ.get("MISTRAL_API_KEY", None):
@@ -36,24 +39,31 @@ class MistralAIProvider(BaseProviderClass):
         self,
         params: QueryParams,
     ):
-        messages = params["messages"]
-        model = params["model"]
-        temperature = params.get("temperature", None)
-        maxGenLen = params.get("maxGenLen", None)
-        credentials = params.get("credentials", None)
-        jsonMode = params.get("jsonMode", False)
+        request = self._buildRequest(params)
+        client = self._getClient(params.get("credentials", None))
+        response = client.chat.complete(**request)
+        return self._parseResponse(response)
 
-        if jsonMode is True:
-            raise OptimodelError("JSON mode not supported for MistralAI")
+    async def makeQueryAsync(
+        self,
+        params: QueryParams,
+    ):
+        request = self._buildRequest(params)
+        client = self._getClient(params.get("credentials", None))
+        response = await client.chat.complete_async(**request)
+        return self._parseResponse(response)
 
-        """
-        @NOTE Together does not currently support image types
-        """
-        if containsImageInMessages(messages):
-            raise OptimodelError(
-                "MistralAI does not currently support image types", provider="mistralai"
-            )
+    async def makeQueryStream(
+        self,
+        params: QueryParams,
+    ):
+        request = self._buildRequest(params)
+        client = self._getClient(params.get("credentials", None))
+        stream = await client.chat.stream_async(**request)
+        async for event in stream:
+            yield self._parseChunk(event.data)
 
+    def _getClient(self, credentials) -> Mistral:
         if SAAS_MODE is not None:
             if credentials is None:
                 # This should have been filtered out in the planner
@@ -71,13 +81,38 @@ class MistralAIProvider(BaseProviderClass):
                     "MistralAI credentials not found", provider="mistralai"
                 )
 
-            client = Mistral(api_key=mistralCreds.mistralApiKey)
-        else:
-            if self.mistralClient is None:
-                raise OptimodelError(
-                    "MistralAI client not initialized", provider="mistralai"
-                )
-            client = self.mistralClient
+            return clientRegistry.getClient(
+                "mistralai",
+                mistralCreds,
+                lambda: Mistral(api_key=mistralCreds.mistralApiKey),
+            )
+
+        if self.mistralClient is None:
+            raise OptimodelError(
+                "MistralAI client not initialized", provider="mistralai"
+            )
+        return self.mistralClient
+
+    def _buildRequest(self, params: QueryParams) -> dict:
+        """
+        Build the kwargs for chat.complete, shared by the sync and async paths
+        """
+        messages = params["messages"]
+        model = params["model"]
+        temperature = params.get("temperature", None)
+        maxGenLen = params.get("maxGenLen", None)
+        jsonMode = params.get("jsonMode", False)
+
+        if jsonMode is True:
+            raise OptimodelError("JSON mode not supported for MistralAI")
+
+        """
+        @NOTE Together does not currently support image types
+        """
+        if containsImageInMessages(messages):
+            raise OptimodelError(
+                "MistralAI does not currently support image types", provider="mistralai"
+            )
 
         match model:
             case ModelTypes.open_mistral_nemo.name:
@@ -108,12 +143,14 @@ class MistralAIProvider(BaseProviderClass):
                         provider="mistralai",
                     )
 
-        response = client.chat.complete(
-            model=modelId,
-            messages=finalMessages,
-            temperature=temperature,
-            max_tokens=maxGenLen if maxGenLen else None,
-        )
+        return {
+            "model": modelId,
+            "messages": finalMessages,
+            "temperature": temperature,
+            "max_tokens": maxGenLen if maxGenLen else None,
+        }
+
+    def _parseResponse(self, response) -> QueryResponse:
         promptTokenCount = response.usage.prompt_tokens
         generationTokenCount = response.usage.completion_tokens
         modelOutput = response.choices[0].message.content
@@ -122,3 +159,15 @@ class MistralAIProvider(BaseProviderClass):
             promptTokens=promptTokenCount,
             generationTokens=generationTokenCount,
         )
+
+    def _parseChunk(self, chunk) -> QueryResponseChunk:
+        """
+        Mistral reports usage on the last chunk
+        """
+        choice = chunk.choices[0] if chunk.choices else None
+        return QueryResponseChunk(
+            delta=(choice.delta.content or "") if choice is not None else "",
+            promptTokens=chunk.usage.prompt_tokens if chunk.usage else None,
+            generationTokens=chunk.usage.completion_tokens if chunk.usage else None,
+            finishReason=choice.finish_reason if choice is not None else None,
+        )
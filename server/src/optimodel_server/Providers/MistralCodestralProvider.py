@@ -9,16 +9,19 @@ from optimodel_types import (
     ModelTypes,
 )
 from optimodel_server.Config.types import SAAS_MODE
+from optimodel_server.Providers.ClientRegistry import clientRegistry
 from optimodel_server.Providers.BaseProviderClass import (
     BaseProviderClass,
     QueryResponse,
     QueryParams,
+    QueryResponseChunk,
 )
 
 
 class MistralCodestralProvider(BaseProviderClass):
     supportSAASMode = True
     supportJSONMode = False
+    mistralClient: Mistral | None = None
 
     def __init__(self):
         if os.environ.get("MISTRAL_CODESTRAL_API_KEY", None):
@@ -40,25 +43,31 @@ class MistralCodestralProvider(BaseProviderClass):
         self,
         params: QueryParams,
     ):
-        messages = params["messages"]
-        model = params["model"]
-        temperature = params.get("temperature", None)
-        maxGenLen = params.get("maxGenLen", None)
-        credentials = params.get("credentials", None)
-        jsonMode = params.get("jsonMode", False)
+        request = self._buildRequest(params)
+        client = self._getClient(params.get("credentials", None))
+        response = client.chat.complete(**request)
+        return self._parseResponse(response)
 
-        if jsonMode is True:
-            raise OptimodelError("JSON mode not supported for MistralCodestral")
+    async def makeQueryAsync(
+        self,
+        params: QueryParams,
+    ):
+        request = self._buildRequest(params)
+        client = self._getClient(params.get("credentials", None))
+        response = await client.chat.complete_async(**request)
+        return self._parseResponse(response)
 
-        """
-        @NOTE Together does not currently support image types
-        """
-        if containsImageInMessages(messages):
-            raise OptimodelError(
-                "MistralCodestral does not currently support image types",
-                provider="mistralcodestral",
-            )
+    async def makeQueryStream(
+        self,
+        params: QueryParams,
+    ):
+        request = self._buildRequest(params)
+        client = self._getClient(params.get("credentials", None))
+        stream = await client.chat.stream_async(**request)
+        async for event in stream:
+            yield self._parseChunk(event.data)
 
+    def _getClient(self, credentials) -> Mistral:
         if SAAS_MODE is not None:
             if credentials is None:
                 # This should have been filtered out in the planner
@@ -79,17 +88,43 @@ class MistralCodestralProvider(BaseProviderClass):
                     provider="mistralcodestral",
                 )
 
-            client = Mistral(
-                api_key=mistralCodestralCreds.mistralCodeStralApiKey,
-                server_url="https://codestral.mistral.ai",
+            return clientRegistry.getClient(
+                "mistralcodestral",
+                mistralCodestralCreds,
+                lambda: Mistral(
+                    api_key=mistralCodestralCreds.mistralCodeStralApiKey,
+                    server_url="https://codestral.mistral.ai",
+                ),
+            )
+
+        if self.mistralClient is None:
+            raise OptimodelError(
+                "MistralCodestral client not initialized",
+                provider="mistralcodestral",
+            )
+        return self.mistralClient
+
+    def _buildRequest(self, params: QueryParams) -> dict:
+        """
+        Build the kwargs for chat.complete, shared by the sync and async paths
+        """
+        messages = params["messages"]
+        model = params["model"]
+        temperature = params.get("temperature", None)
+        maxGenLen = params.get("maxGenLen", None)
+        jsonMode = params.get("jsonMode", False)
+
+        if jsonMode is True:
+            raise OptimodelError("JSON mode not supported for MistralCodestral")
+
+        """
+        @NOTE Together does not currently support image types
+        """
+        if containsImageInMessages(messages):
+            raise OptimodelError(
+                "MistralCodestral does not currently support image types",
+                provider="mistralcodestral",
             )
-        else:
-            if self.mistralClient is None:
-                raise OptimodelError(
-                    "MistralCodestral client not initialized",
-                    provider="mistralcodestral",
-                )
-            client = self.mistralClient
 
         match model:
             case ModelTypes.codestral_latest.name:
@@ -116,12 +151,14 @@ class MistralCodestralProvider(BaseProviderClass):
                         provider="mistralcodestral",
                     )
 
-        response = client.chat.complete(
-            model=modelId,
-            messages=finalMessages,
-            temperature=temperature,
-            max_tokens=maxGenLen if maxGenLen else None,
-        )
+        return {
+            "model": modelId,
+            "messages": finalMessages,
+            "temperature": temperature,
+            "max_tokens": maxGenLen if maxGenLen else None,
+        }
+
+    def _parseResponse(self, response) -> QueryResponse:
         promptTokenCount = response.usage.prompt_tokens
         generationTokenCount = response.usage.completion_tokens
         modelOutput = response.choices[0].message.content
@@ -130,3 +167,15 @@ class MistralCodestralProvider(BaseProviderClass):
             promptTokens=promptTokenCount,
             generationTokens=generationTokenCount,
         )
+
+    def _parseChunk(self, chunk) -> QueryResponseChunk:
+        """
+        Mistral reports usage on the last chunk
+        """
+        choice = chunk.choices[0] if chunk.choices else None
+        return QueryResponseChunk(
+            delta=(choice.delta.content or "") if choice is not None else "",
+            promptTokens=chunk.usage.prompt_tokens if chunk.usage else None,
+            generationTokens=chunk.usage.completion_tokens if chunk.usage else None,
+            finishReason=choice.finish_reason if choice is not None else None,
+        )
@@ -1,13 +1,15 @@
 import os
 
-from openai import NOT_GIVEN, OpenAI
+from openai import NOT_GIVEN, AsyncOpenAI, OpenAI
 from optimodel_server.OptimodelError import OptimodelError
 
 from optimodel_server.Config.types import SAAS_MODE
+from optimodel_server.Providers.ClientRegistry import clientRegistry
 from optimodel_server.Providers.BaseProviderClass import (
     BaseProviderClass,
     QueryResponse,
     QueryParams,
+    QueryResponseChunk,
 )
 from optimodel_types import ModelTypes, OpenAICredentials
 
@@ -16,9 +18,13 @@ class OpenAIProvider(BaseProviderClass):
     supportSAASMode = True
     supportJSONMode = True
 
+    openAIClient: OpenAI | None = None
+    openAIAsyncClient: AsyncOpenAI | None = None
+
     def __init__(self):
         if os.environ.get("OPEN_AI_KEY", None):
             self.openAIClient = OpenAI(api_key=os.environ.get("OPEN_AI_KEY"))
+            self.openAIAsyncClient = AsyncOpenAI(api_key=os.environ.get("OPEN_AI_KEY"))
 
     def validateProvider(self):
         """
@@ -33,14 +39,33 @@ class OpenAIProvider(BaseProviderClass):
         self,
         params: QueryParams,
     ):
+        request = self._buildRequest(params)
+        client = self._getClient(params.get("credentials", None), asyncClient=False)
+        response = client.chat.completions.create(**request)
+        return self._parseResponse(response)
 
-        messages = params["messages"]
-        model = params["model"]
-        temperature = params.get("temperature", None)
-        maxGenLen = params.get("maxGenLen", None)
-        credentials = params.get("credentials", None)
-        jsonMode = params.get("jsonMode", False)
+    async def makeQueryAsync(
+        self,
+        params: QueryParams,
+    ):
+        request = self._buildRequest(params)
+        client = self._getClient(params.get("credentials", None), asyncClient=True)
+        response = await client.chat.completions.create(**request)
+        return self._parseResponse(response)
 
+    async def makeQueryStream(
+        self,
+        params: QueryParams,
+    ):
+        request = self._buildRequest(params)
+        client = self._getClient(params.get("credentials", None), asyncClient=True)
+        stream = await client.chat.completions.create(
+            **request, stream=True, stream_options={"include_usage": True}
+        )
+        async for chunk in stream:
+            yield self._parseChunk(chunk)
+
+    def _getClient(self, credentials, asyncClient: bool):
         if SAAS_MODE is not None:
             if credentials is None:
                 # This should have been filtered out in the planner
@@ -56,11 +81,31 @@ class OpenAIProvider(BaseProviderClass):
                 # This should have been filtered out in the planner
                 raise OptimodelError("OpenAI credentials not found", provider="openai")
 
-            client = OpenAI(api_key=openAICreds.openAiKey)
-        else:
-            if self.openAIClient is None:
-                raise OptimodelError("OpenAI client not initialized", provider="openai")
-            client = self.openAIClient
+            if asyncClient:
+                return clientRegistry.getClient(
+                    "openai",
+                    openAICreds,
+                    lambda: AsyncOpenAI(api_key=openAICreds.openAiKey),
+                    variant="async",
+                )
+            return clientRegistry.getClient(
+                "openai", openAICreds, lambda: OpenAI(api_key=openAICreds.openAiKey)
+            )
+
+        client = self.openAIAsyncClient if asyncClient else self.openAIClient
+        if client is None:
+            raise OptimodelError("OpenAI client not initialized", provider="openai")
+        return client
+
+    def _buildRequest(self, params: QueryParams) -> dict:
+        """
+        Build the kwargs for chat.completions.create, shared by the sync and async paths
+        """
+        messages = params["messages"]
+        model = params["model"]
+        temperature = params.get("temperature", None)
+        maxGenLen = params.get("maxGenLen", None)
+        jsonMode = params.get("jsonMode", False)
 
         match model:
             case ModelTypes.gpt_4.name:
@@ -123,22 +168,19 @@ class OpenAIProvider(BaseProviderClass):
 
                 messageToPass.append({"role": message.role, "content": baseContent})
 
+        request = {
+            "model": modelId,
+            "messages": messageToPass,
+            **({"temperature": temperature} if temperature is not None else {}),
+            "response_format": {"type": "json_object"} if jsonMode else None,
+        }
         if modelId.startswith("o1"):
-            response = client.chat.completions.create(
-                model=modelId,
-                messages=messageToPass,
-                **({"temperature": temperature} if temperature is not None else {}),
-                max_completion_tokens=maxGenLen if maxGenLen else NOT_GIVEN,
-                response_format={"type": "json_object"} if jsonMode else None,
-            )
+            request["max_completion_tokens"] = maxGenLen if maxGenLen else NOT_GIVEN
         else:
-            response = client.chat.completions.create(
-                model=modelId,
-                messages=messageToPass,
-                **({"temperature": temperature} if temperature is not None else {}),
-                max_tokens=maxGenLen if maxGenLen else NOT_GIVEN,
-                response_format={"type": "json_object"} if jsonMode else None,
-            )
+            request["max_tokens"] = maxGenLen if maxGenLen else NOT_GIVEN
+        return request
+
+    def _parseResponse(self, response) -> QueryResponse:
         promptTokenCount = response.usage.prompt_tokens
         generationTokenCount = response.usage.completion_tokens
         modelOutput = response.choices[0].message.content
@@ -147,3 +189,15 @@ class OpenAIProvider(BaseProviderClass):
             promptTokens=promptTokenCount,
             generationTokens=generationTokenCount,
         )
+
+    def _parseChunk(self, chunk) -> QueryResponseChunk:
+        """
+        With include_usage the last chunk has no choices, only the usage
+        """
+        choice = chunk.choices[0] if chunk.choices else None
+        return QueryResponseChunk(
+            delta=(choice.delta.content or "") if choice is not None else "",
+            promptTokens=chunk.usage.prompt_tokens if chunk.usage else None,
+            generationTokens=chunk.usage.completion_tokens if chunk.usage else None,
+            finishReason=choice.finish_reason if choice is not None else None,
+        )
@@ -1,25 +1,32 @@
 import os
 from optimodel_server.OptimodelError import OptimodelError
 
-from together import Together
+from together import AsyncTogether, Together
 
 from optimodel_server.Providers.CommonUtils import containsImageInMessages
 from optimodel_types import TogetherAICredentials, ModelTypes
 from optimodel_server.Config.types import SAAS_MODE
+from optimodel_server.Providers.ClientRegistry import clientRegistry
 from optimodel_server.Providers.BaseProviderClass import (
     BaseProviderClass,
     QueryResponse,
     QueryParams,
+    QueryResponseChunk,
 )
 
 
 class TogetherProvider(BaseProviderClass):
     supportSAASMode = True
     supportJSONMode = False
+    togetherClient: Together | None = None
+    togetherAsyncClient: AsyncTogether | None = None
 
     def __init__(self):
         if os.environ.get("TOGETHER_API_KEY", None):
             self.togetherClient = Together(api_key=os.environ.get("TOGETHER_API_KEY"))
+            self.togetherAsyncClient = AsyncTogether(
+                api_key=os.environ.get("TOGETHER_API_KEY")
+            )
 
     def validateProvider(self):
         """
@@ -34,24 +41,31 @@ class TogetherProvider(BaseProviderClass):
         self,
         params: QueryParams,
     ):
-        messages = params["messages"]
-        model = params["model"]
-        temperature = params.get("temperature", None)
-        maxGenLen = params.get("maxGenLen", None)
-        credentials = params.get("credentials", None)
-        jsonMode = params.get("jsonMode", False)
+        request = self._buildRequest(params)
+        client = self._getClient(params.get("credentials", None), asyncClient=False)
+        response = client.chat.completions.create(**request)
+        return self._parseResponse(response)
 
-        if jsonMode is True:
-            raise OptimodelError("JSON mode not supported for Together")
+    async def makeQueryAsync(
+        self,
+        params: QueryParams,
+    ):
+        request = self._buildRequest(params)
+        client = self._getClient(params.get("credentials", None), asyncClient=True)
+        response = await client.chat.completions.create(**request)
+        return self._parseResponse(response)
 
-        """
-        @NOTE Together does not currently support image types
-        """
-        if containsImageInMessages(messages):
-            raise OptimodelError(
-                "Together does not currently support image types", provider="together"
-            )
+    async def makeQueryStream(
+        self,
+        params: QueryParams,
+    ):
+        request = self._buildRequest(params)
+        client = self._getClient(params.get("credentials", None), asyncClient=True)
+        stream = await client.chat.completions.create(**request, stream=True)
+        async for chunk in stream:
+            yield self._parseChunk(chunk)
 
+    def _getClient(self, credentials, asyncClient: bool):
         if SAAS_MODE is not None:
             if credentials is None:
                 # This should have been filtered out in the planner
@@ -69,13 +83,44 @@ class TogetherProvider(BaseProviderClass):
                     "Together credentials not found", provider="together"
                 )
 
-            client = Together(api_key=togetherCreds.togetherApiKey)
-        else:
-            if self.togetherClient is None:
-                raise OptimodelError(
-                    "Together client not initialized", provider="together"
+            if asyncClient:
+                return clientRegistry.getClient(
+                    "together",
+                    togetherCreds,
+                    lambda: AsyncTogether(api_key=togetherCreds.togetherApiKey),
+                    variant="async",
                 )
-            client = self.togetherClient
+            return clientRegistry.getClient(
+                "together",
+                togetherCreds,
+                lambda: Together(api_key=togetherCreds.togetherApiKey),
+            )
+
+        client = self.togetherAsyncClient if asyncClient else self.togetherClient
+        if client is None:
+            raise OptimodelError("Together client not initialized", provider="together")
+        return client
+
+    def _buildRequest(self, params: QueryParams) -> dict:
+        """
+        Build the kwargs for chat.completions.create, shared by the sync and async paths
+        """
+        messages = params["messages"]
+        model = params["model"]
+        temperature = params.get("temperature", None)
+        maxGenLen = params.get("maxGenLen", None)
+        jsonMode = params.get("jsonMode", False)
+
+        if jsonMode is True:
+            raise OptimodelError("JSON mode not supported for Together")
+
+        """
+        @NOTE Together does not currently support image types
+        """
+        if containsImageInMessages(messages):
+            raise OptimodelError(
+                "Together does not currently support image types", provider="together"
+            )
 
         match model:
             case ModelTypes.llama_3_8b_instruct.name:
@@ -87,27 +132,34 @@ class TogetherProvider(BaseProviderClass):
                     f"Model {model} not supported", provider="together"
                 )
 
-        messages = []
+        messagesParsed = []
         for message in messages:
             if isinstance(message.content, str):
-                messages.append({"role": message.role, "content": message.content})
+                messagesParsed.append(
+                    {"role": message.role, "content": message.content}
+                )
             else:
                 # Get the text from message.content
                 textForRole = next(
                     (x.text for x in message.content if x.type == "text"), None
                 )
                 if textForRole is not None:
-                    messages.append({"role": message.role, "content": textForRole})
+                    messagesParsed.append(
+                        {"role": message.role, "content": textForRole}
+                    )
                 else:
                     raise OptimodelError(
-                        f"No text found for role {message.role}", provider="groq"
+                        f"No text found for role {message.role}", provider="together"
                     )
-        response = client.chat.completions.create(
-            model=modelId,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=maxGenLen if maxGenLen else None,
-        )
+
+        return {
+            "model": modelId,
+            "messages": messagesParsed,
+            "temperature": temperature,
+            "max_tokens": maxGenLen if maxGenLen else None,
+        }
+
+    def _parseResponse(self, response) -> QueryResponse:
         promptTokenCount = response.usage.prompt_tokens
         generationTokenCount = response.usage.completion_tokens
         modelOutput = response.choices[0].message.content
@@ -116,3 +168,17 @@ class TogetherProvider(BaseProviderClass):
             promptTokens=promptTokenCount,
             generationTokens=generationTokenCount,
         )
+
+    def _parseChunk(self, chunk) -> QueryResponseChunk:
+        """
+        Together reports usage on the last chunk
+        """
+        choice = chunk.choices[0] if chunk.choices else None
+        delta = getattr(choice, "delta", None) if choice is not None else None
+        usage = getattr(chunk, "usage", None)
+        return QueryResponseChunk(
+            delta=(getattr(delta, "content", None) or "") if delta is not None else "",
+            promptTokens=usage.prompt_tokens if usage else None,
+            generationTokens=usage.completion_tokens if usage else None,
+            finishReason=choice.finish_reason if choice is not None else None,
+        )
@@ -0,0 +1,35 @@
+import functools
+
+from optimodel_server.Config import config
+
+_MODEL_NAME_TRANSLATION = str.maketrans({"-": "_", ".": "_"})
+
+
+@functools.lru_cache(maxsize=1024)
+def normalizeModelName(model: str) -> str:
+    """
+    Wire model names (e.g. gpt-4o-mini, gemini-1.5-flash) to our ModelTypes keys
+    (gpt_4o_mini, gemini_1_5_flash). Clients send the same handful of names over and
+    over, so we only compute each one once
+    """
+    return model.lower().translate(_MODEL_NAME_TRANSLATION)
+
+
+def proxyCost(
+    model: str, providerName: str, inputTokens: int | None, outputTokens: int | None
+) -> float | None:
+    if inputTokens is None or outputTokens is None:
+        return None
+    modelData = next(
+        (
+            x
+            for x in config.modelToProvider.get(normalizeModelName(model), [])
+            if x["provider"] == providerName
+        ),
+        None,
+    )
+    if modelData is None:
+        return None
+    return modelData["pricePer1MInput"] * (inputTokens / 1_000_000) + modelData[
+        "pricePer1MOutput"
+    ] * (outputTokens / 1_000_000)
@@ -0,0 +1,737 @@
+import json
+import logging
+import sys
+from typing import Any, Dict, List, Tuple
+
+import httpx
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from optimodel_server.Config.types import (
+    PROXY_CROSS_PROVIDER_FAILOVER,
+    SAAS_MODE,
+    STREAM_GUARD_INTERVAL_CHARS,
+    STREAM_GUARD_MODE,
+)
+from optimodel_server.GuardClient import guardClientInstance
+from optimodel_server.OptimodelError import OptimodelError
+from optimodel_server.Planner.Planner import routingTable
+from optimodel_server.Planner.RoutingTable import credentialMask
+from optimodel_server.Routes import LytixProxyResponse
+from optimodel_server.Routes.Proxy.ModelLookup import normalizeModelName, proxyCost
+from optimodel_server.Routes.Proxy.ProxyResponse import (
+    extractUsage,
+    isPassthrough,
+    proxyResponse,
+)
+from optimodel_server.Routes.Proxy.ProxyStream import (
+    StreamFormat,
+    UpstreamError,
+    guardedProxyStream,
+    openUpstreamStream,
+    translatedStream,
+)
+from optimodel_server.Utils.HTTPClientPool import httpClientPool
+from optimodel_server.Utils.QueryModelMain import (
+    check_post_query_guards,
+    check_pre_query_guards,
+    queryModelMain,
+)
+from optimodel_server.Utils.QueryModelStream import openQueryStream
+from optimodel_server.Utils.StreamingGuardMonitor import StreamingGuardMonitor
+from optimodel_types import (
+    AnthropicCredentials,
+    AWSBedrockCredentials,
+    Credentials,
+    GeminiCredentials,
+    GroqCredentials,
+    Guards,
+    LLamaPromptGuardConfig,
+    LytixRegexConfig,
+    MicrosoftPresidioConfig,
+    MistralAICredentials,
+    MistralCodeStralCredentials,
+    OpenAICredentials,
+    QueryBody,
+    TogetherAICredentials,
+)
+from optimodel_types.providerTypes import GuardError, MakeQueryResponse
+
+
+logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+"""
+Headers that carry provider keys for optimodel, we never forward them upstream as is
+"""
+CREDENTIAL_HEADERS = [
+    "openaikey",
+    "anthropicapikey",
+    "mistralapikey",
+    "groqapikey",
+    "togetherapikey",
+    "geminiapikey",
+    "mistralcodestralapikey",
+    "awsaccesskeyid",
+    "awssecretkey",
+    "awsregion",
+]
+
+"""
+Request headers that are only meant for us (or for the hop to us)
+"""
+DROPPED_REQUEST_HEADERS = [
+    "host",
+    "content-length",
+    "x-lytix-io-event-id",
+    "x-lytix-proxy-passthrough",
+    *CREDENTIAL_HEADERS,
+]
+
+"""
+Upstream response headers that no longer describe the (decoded) body we send back
+"""
+DROPPED_RESPONSE_HEADERS = [
+    "content-encoding",
+    "content-length",
+    "transfer-encoding",
+    "connection",
+]
+
+
+class ProxyAdapter:
+    """
+    Everything that's specific to one wire format (OpenAI, Anthropic, Gemini): how to
+    read the request and response, reach the upstream and answer in the same format.
+    The proxy pipeline itself (guards, fallbacks, routing, usage and cost) lives in
+    proxyPost
+    """
+
+    """
+    Provider name, also the upstream we pool connections for
+    """
+    name: str
+    baseURL: str
+    streamFormat: StreamFormat
+    """
+    Where the usage is in a response body, and its token counts
+    """
+    usageKey: str = "usage"
+    inputTokensKey: str
+    outputTokensKey: str
+    """
+    Models (ModelTypes keys) the upstream serves itself, every other model is routed
+    through queryModelMain. Names containing nativeModelSubstring are served too
+    """
+    nativeModels: frozenset = frozenset()
+    nativeModelSubstring: str | None = None
+    """
+    Client headers we replace with authHeaders
+    """
+    replacedHeaders: List[str] = []
+
+    def servesNatively(self, model: str) -> bool:
+        modelKey = normalizeModelName(model)
+        return modelKey in self.nativeModels or (
+            self.nativeModelSubstring is not None
+            and self.nativeModelSubstring in modelKey
+        )
+
+    def modelFromRequest(self, path: str, body: Dict[str, Any]) -> str | None:
+        return body.get("model")
+
+    def isStream(self, path: str, body: Dict[str, Any]) -> bool:
+        return body.get("stream", False) is True
+
+    def upstreamURL(self, path: str, model: str | None) -> str:
+        return f"{self.baseURL}/{path.removeprefix(self.name + '/')}"
+
+    def upstreamBody(self, body: Dict[str, Any], model: str) -> Dict[str, Any]:
+        return {**body, "model": model}
+
+    def upstreamParams(self, request: Request) -> Dict[str, str] | None:
+        return None
+
+    def prepareStream(
+        self, request: Request, body: Dict[str, Any], params: Dict[str, str] | None
+    ) -> Tuple[Dict[str, Any], Dict[str, str] | None, Dict[str, Any]]:
+        """
+        Adjust a streamed request
+
+        @return (body, params, extra guardedProxyStream arguments)
+        """
+        return body, params, {}
+
+    def arrayFraming(self, request: Request) -> bool:
+        """
+        If streams are written as a JSON array instead of server sent events
+        """
+        return False
+
+    def authHeaders(self, request: Request) -> Dict[str, str]:
+        return {}
+
+    def queryOptions(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Generation options of the request as QueryBody fields (temperature, maxGenLen,
+        jsonMode), for models we route through the planner
+        """
+        return {}
+
+    def parseMessages(self, body: Dict[str, Any]) -> List[dict]:
+        """
+        The request messages as ModelMessage dicts
+        """
+        raise NotImplementedError
+
+    def outputText(self, responseData: Dict[str, Any]) -> str | None:
+        """
+        The assistant text of a (non streamed) upstream response
+        """
+        raise NotImplementedError
+
+    def formatResponse(
+        self, text: str, model: str, inputTokens: int, outputTokens: int
+    ) -> Dict[str, Any]:
+        """
+        A response in this wire format for output we didn't get from the upstream (a
+        routed model or a blocked request)
+        """
+        raise NotImplementedError
+
+
+def create_guard(guard_dict):
+    guard_type = guard_dict.get("guardName")
+    if guard_type == "META_LLAMA_PROMPT_GUARD_86M":
+        return LLamaPromptGuardConfig(**guard_dict)
+    elif guard_type == "LYTIX_REGEX_GUARD":
+        return LytixRegexConfig(**guard_dict)
+    elif guard_type == "MICROSOFT_PRESIDIO_GUARD":
+        return MicrosoftPresidioConfig(**guard_dict)
+    else:
+        raise ValueError(f"Unknown guard type: {guard_type}")
+
+
+def splitGuards(guards: List[dict]) -> Tuple[List[Guards], List[Guards]]:
+    """
+    @return (preQueryGuards, postQueryGuards)
+    """
+    preQueryGuards = []
+    postQueryGuards = []
+    for guard in guards or []:
+        if guard["guardType"] == "preQuery":
+            preQueryGuards.append(create_guard(guard))
+        if guard["guardType"] == "postQuery":
+            postQueryGuards.append(create_guard(guard))
+    return preQueryGuards, postQueryGuards
+
+
+def credentialsFromHeaders(request: Request) -> List[Credentials]:
+    """
+    Based on the headers create our credentials object
+    """
+    credentials: List[Credentials] = []
+    if "openaikey" in request.headers:
+        credentials.append(OpenAICredentials(openAiKey=request.headers["openaikey"]))
+    if "mistralapikey" in request.headers:
+        credentials.append(
+            MistralAICredentials(mistralApiKey=request.headers["mistralapikey"])
+        )
+    if "anthropicapikey" in request.headers:
+        credentials.append(
+            AnthropicCredentials(anthropicApiKey=request.headers["anthropicapikey"])
+        )
+    if "groqapikey" in request.headers:
+        credentials.append(GroqCredentials(groqApiKey=request.headers["groqapikey"]))
+    if "togetherapikey" in request.headers:
+        credentials.append(
+            TogetherAICredentials(togetherApiKey=request.headers["togetherapikey"])
+        )
+    if "geminiapikey" in request.headers:
+        credentials.append(
+            GeminiCredentials(geminiApiKey=request.headers["geminiapikey"])
+        )
+    if "mistralcodestralapikey" in request.headers:
+        credentials.append(
+            MistralCodeStralCredentials(
+                mistralCodeStralApiKey=request.headers["mistralcodestralapikey"]
+            )
+        )
+    if all(
+        header in request.headers
+        for header in ["awsaccesskeyid", "awssecretkey", "awsregion"]
+    ):
+        credentials.append(
+            AWSBedrockCredentials(
+                awsAccessKeyId=request.headers["awsaccesskeyid"],
+                awsSecretKey=request.headers["awssecretkey"],
+                awsRegion=request.headers["awsregion"],
+            )
+        )
+    return credentials
+
+
+def upstreamHeaders(adapter: ProxyAdapter, request: Request) -> Dict[str, str]:
+    dropped = DROPPED_REQUEST_HEADERS + adapter.replacedHeaders
+    headers = {
+        k: str(v) for k, v in request.headers.items() if k.lower() not in dropped
+    }
+    headers.update(adapter.authHeaders(request))
+    return headers
+
+
+def assistantMessage(text: str) -> dict:
+    return {"role": "assistant", "content": [{"type": "text", "text": text}]}
+
+
+def jsonResponseWithPayload(
+    adapter: ProxyAdapter,
+    text: str,
+    model: str,
+    lytixProxyPayload: dict,
+    inputTokens: int,
+    outputTokens: int,
+) -> Response:
+    return Response(
+        content=json.dumps(
+            {
+                "lytix-proxy-payload": lytixProxyPayload,
+                **adapter.formatResponse(text, model, inputTokens, outputTokens),
+            }
+        ),
+        status_code=200,
+        media_type="application/json",
+    )
+
+
+def shouldFailover(e: Exception) -> bool:
+    """
+    If a failed upstream call is worth retrying with another provider
+    """
+    if isinstance(e, UpstreamError):
+        return e.isUnavailable()
+    return isinstance(e, httpx.TransportError)
+
+
+def hasOtherProviders(adapter: ProxyAdapter, request: Request, model: str) -> bool:
+    """
+    If the planner knows a provider other than the adapter's upstream for the model (in
+    SAAS mode, one we have the request's credentials for)
+    """
+    mask = None
+    if SAAS_MODE is not None:
+        mask = credentialMask(credentialsFromHeaders(request))
+    return (
+        len(
+            routingTable.candidates(
+                normalizeModelName(model),
+                None,
+                credentialMask=mask,
+                excludedProviders=[adapter.name],
+            )
+        )
+        > 0
+    )
+
+
+async def proxyPost(adapter: ProxyAdapter, request: Request, path: str):
+    """
+    Proxy a request in the adapter's wire format. Models the upstream serves are
+    forwarded to it (with our guards, usage and cost on top), any other model (or any
+    model with lytix-provider set to another provider) is routed through the planner and
+    answered in the same format, streamed or not.
+
+    If the upstream is rate limited or down we route the same model through the planner
+    to another provider that hosts it (see PROXY_CROSS_PROVIDER_FAILOVER), before moving
+    on to the lytix-fallbackModels in order
+    """
+    # extract the lytix ioeventid if present
+    ioEventId = request.headers.get("x-lytix-io-event-id")
+
+    body = await request.json()
+    model = adapter.modelFromRequest(path, body)
+    if model is None:
+        return JSONResponse(status_code=400, content={"error": "model is required"})
+    stream = adapter.isStream(path, body)
+
+    guards = body.get("lytix-guards") or []
+    fallbackModels = body.get("lytix-fallbackModels") or []
+    streamGuardMode = body.get("lytix-streamGuardMode") or STREAM_GUARD_MODE
+    provider = body.get("lytix-provider")
+    speedPriority = body.get("lytix-speedPriority")
+    crossProviderFailover = body.get("lytix-crossProviderFailover")
+    if crossProviderFailover is None:
+        crossProviderFailover = PROXY_CROSS_PROVIDER_FAILOVER
+    preQueryGuards, postQueryGuards = splitGuards(guards)
+
+    """
+    Anything lytix specific would make the upstream complain
+    """
+    body = {k: v for k, v in body.items() if not k.startswith("lytix-")}
+
+    try:
+        messages = adapter.parseMessages(body)
+    except Exception as e:
+        logger.error(f"Error attempting to extract messages: {e}")
+        messages = []
+
+    routeOptions = {
+        **adapter.queryOptions(body),
+        "provider": provider,
+        "speedPriority": speedPriority,
+    }
+
+    allModelsToTry = [model, *fallbackModels]
+    for index, modelToTry in enumerate(allModelsToTry):
+        logger.info(f"Trying model: {modelToTry}")
+        isLastModel = index == len(allModelsToTry) - 1
+        try:
+            if (
+                provider is not None and provider != adapter.name
+            ) or not adapter.servesNatively(modelToTry):
+                return await routeQuery(
+                    adapter,
+                    request,
+                    messages,
+                    modelToTry,
+                    routeOptions,
+                    guards,
+                    [],
+                    stream,
+                    streamGuardMode,
+                    ioEventId,
+                    isLastModel,
+                )
+
+            """
+            Models we route get their guards checked inside queryModelMain
+            """
+            guardErrors: List[GuardError] = []
+            if preQueryGuards:
+                preQueryResult, shouldReturn = await check_pre_query_guards(
+                    preQueryGuards=preQueryGuards,
+                    guardClientInstance=guardClientInstance,
+                    messages=messages,
+                    providerName=adapter.name,
+                )
+                if shouldReturn:
+                    blockedResponse: MakeQueryResponse = preQueryResult
+                    return jsonResponseWithPayload(
+                        adapter,
+                        blockedResponse["modelResponse"],
+                        modelToTry,
+                        LytixProxyResponse(
+                            messagesV2=messages
+                            + [assistantMessage(blockedResponse["modelResponse"])],
+                            inputTokens=0,
+                            outputTokens=0,
+                            cost=0,
+                            provider=adapter.name,
+                            model=modelToTry,
+                            guardErrors=blockedResponse["guardErrors"],
+                            lytixEventId=ioEventId,
+                        ).dict(),
+                        inputTokens=0,
+                        outputTokens=0,
+                    )
+                guardErrors.extend(preQueryResult)
+
+            failover = (
+                crossProviderFailover
+                and provider is None
+                and hasOtherProviders(adapter, request, modelToTry)
+            )
+            try:
+                return await forwardQuery(
+                    adapter,
+                    request,
+                    path,
+                    body,
+                    messages,
+                    modelToTry,
+                    stream,
+                    postQueryGuards,
+                    guardErrors,
+                    streamGuardMode,
+                    ioEventId,
+                    isLastModel,
+                    failover,
+                )
+            except Exception as e:
+                if not failover or not shouldFailover(e):
+                    raise
+                logger.info(
+                    f"{adapter.name} unavailable for {modelToTry} ({e}), routing to another provider"
+                )
+                """
+                The preQuery guards already passed, only the postQuery ones are left.
+                If rerouting fails too, the client should see the upstream's error
+                rather than ours
+                """
+                try:
+                    return await routeQuery(
+                        adapter,
+                        request,
+                        messages,
+                        modelToTry,
+                        {**routeOptions, "excludeProviders": [adapter.name]},
+                        [
+                            guard
+                            for guard in guards
+                            if guard["guardType"] == "postQuery"
+                        ],
+                        guardErrors,
+                        stream,
+                        streamGuardMode,
+                        ioEventId,
+                        isLastModel=False,
+                    )
+                except Exception as routeError:
+                    logger.error(f"Rerouting {modelToTry} failed: {routeError}")
+                    if isLastModel and isinstance(e, UpstreamError):
+                        return e.toResponse()
+                    raise e
+        except Exception as e:
+            logger.error(f"Error attempting to process {adapter.name} request: {e}")
+
+            """
+            Unless we are out of models, continue
+            """
+            if isLastModel:
+                logger.error(f"No more fallback models to try")
+                if len(fallbackModels) > 0:
+                    raise OptimodelError("No more fallback models to try")
+                else:
+                    raise e
+
+
+async def routeQuery(
+    adapter: ProxyAdapter,
+    request: Request,
+    messages: List[dict],
+    model: str,
+    routeOptions: Dict[str, Any],
+    guards: List[dict],
+    guardErrors: List[GuardError],
+    stream: bool,
+    streamGuardMode: str,
+    ioEventId: str | None,
+    isLastModel: bool,
+):
+    """
+    Query the model through the planner (any provider that hosts it) and answer in the
+    adapter's wire format
+
+    @param routeOptions: Extra QueryBody fields, e.g. provider or excludeProviders
+    @param guardErrors: Errors of guards we already checked
+    """
+    data = QueryBody(
+        messages=messages,
+        modelToUse=normalizeModelName(model),
+        credentials=credentialsFromHeaders(request),
+        guards=guards,
+        stream=stream,
+        streamGuardMode=streamGuardMode,
+        **{k: v for k, v in routeOptions.items() if v is not None},
+    )
+
+    if stream:
+        response = await openQueryStream(data, guardClientInstance)
+    else:
+        response = await queryModelMain(data, guardClientInstance)
+    if isinstance(response, JSONResponse):
+        if not isLastModel:
+            raise OptimodelError(f"Unable to route {model}: {response.body[:500]}")
+        return response
+
+    if stream:
+        arrayFraming = adapter.arrayFraming(request)
+        return StreamingResponse(
+            translatedStream(
+                events=response,
+                streamFormat=adapter.streamFormat,
+                messages=messages,
+                model=model,
+                guardErrors=guardErrors,
+                ioEventId=ioEventId,
+                arrayFraming=arrayFraming,
+            ),
+            media_type="application/json" if arrayFraming else "text/event-stream",
+        )
+
+    responseParsed: MakeQueryResponse = response
+    return jsonResponseWithPayload(
+        adapter,
+        responseParsed["modelResponse"],
+        model,
+        LytixProxyResponse(
+            messagesV2=messages + [assistantMessage(responseParsed["modelResponse"])],
+            inputTokens=responseParsed["promptTokens"],
+            outputTokens=responseParsed["generationTokens"],
+            cost=responseParsed["cost"],
+            provider=responseParsed["provider"],
+            model=model,
+            guardErrors=[*guardErrors, *responseParsed["guardErrors"]],
+            lytixEventId=ioEventId,
+        ).dict(),
+        inputTokens=responseParsed["promptTokens"],
+        outputTokens=responseParsed["generationTokens"],
+    )
+
+
+async def forwardQuery(
+    adapter: ProxyAdapter,
+    request: Request,
+    path: str,
+    body: Dict[str, Any],
+    messages: List[dict],
+    model: str,
+    stream: bool,
+    postQueryGuards: List[Guards],
+    guardErrors: List[GuardError],
+    streamGuardMode: str,
+    ioEventId: str | None,
+    isLastModel: bool,
+    failover: bool = False,
+):
+    """
+    Forward the request to the adapter's own upstream
+
+    @param failover: We can route to another provider if the upstream is unavailable,
+        so raise instead of returning its error even for the last model
+    """
+    client = httpClientPool.get(adapter.name)
+    url = adapter.upstreamURL(path, model)
+    headers = upstreamHeaders(adapter, request)
+    upstreamBody = adapter.upstreamBody(body, model)
+    params = adapter.upstreamParams(request)
+
+    if stream:
+        upstreamBody, params, streamArguments = adapter.prepareStream(
+            request, upstreamBody, params
+        )
+        upstream = await openUpstreamStream(
+            client, url, upstreamBody, headers, params=params
+        )
+        return StreamingResponse(
+            guardedProxyStream(
+                upstream=upstream,
+                streamFormat=adapter.streamFormat,
+                monitor=StreamingGuardMonitor(
+                    postQueryGuards=postQueryGuards,
+                    guardClientInstance=guardClientInstance,
+                    messages=messages,
+                    mode=streamGuardMode,
+                    intervalChars=STREAM_GUARD_INTERVAL_CHARS,
+                ),
+                messages=messages,
+                model=model,
+                providerName=adapter.name,
+                guardErrors=guardErrors,
+                ioEventId=ioEventId,
+                **streamArguments,
+            ),
+            media_type=(
+                "application/json"
+                if streamArguments.get("arrayFraming")
+                else "text/event-stream"
+            ),
+        )
+
+    response = await client.post(url, json=upstreamBody, headers=headers, params=params)
+    if response.status_code != 200:
+        error = UpstreamError(response.status_code, response.content, adapter.name)
+        if not isLastModel or (failover and error.isUnavailable()):
+            raise error
+        """
+        Nothing left to fall back to, let the client see the upstream's error
+        """
+        return Response(
+            content=response.content,
+            status_code=response.status_code,
+            media_type=response.headers.get("content-type", "application/json"),
+        )
+
+    """
+    In passthrough mode the body is forwarded untouched, we only parse it if a guard
+    needs the output
+    """
+    passthrough = isPassthrough(request)
+    output = None
+    if not passthrough or postQueryGuards:
+        output = adapter.outputText(response.json())
+
+    usage = extractUsage(response.content, adapter.usageKey) or {}
+    inputTokens = usage.get(adapter.inputTokensKey)
+    outputTokens = usage.get(adapter.outputTokensKey)
+
+    cost = proxyCost(model, adapter.name, inputTokens, outputTokens)
+    if postQueryGuards and output is not None:
+        postQueryGuardErrors, guardedResponse = await check_post_query_guards(
+            postQueryGuards=postQueryGuards,
+            guardClientInstance=guardClientInstance,
+            messages=messages,
+            modelOutput=output,
+            queryResponse={"modelResponse": output},
+        )
+        guardErrors = guardErrors + postQueryGuardErrors
+
+        """
+        A blocking guard replaces the output with its message, like guardedProxyStream
+        does for streams, the upstream body never reaches the client
+        """
+        if any(error.blockRequest for error in postQueryGuardErrors):
+            blockMessage = guardedResponse["modelResponse"]
+            return jsonResponseWithPayload(
+                adapter,
+                blockMessage,
+                model,
+                LytixProxyResponse(
+                    messagesV2=messages + [assistantMessage(blockMessage)],
+                    inputTokens=inputTokens,
+                    outputTokens=outputTokens,
+                    cost=cost,
+                    provider=adapter.name,
+                    model=model,
+                    guardErrors=guardErrors,
+                    lytixEventId=ioEventId,
+                ).dict(),
+                inputTokens=inputTokens or 0,
+                outputTokens=outputTokens or 0,
+            )
+
+    return proxyResponse(
+        response,
+        LytixProxyResponse(
+            messagesV2=messages
+            + ([assistantMessage(output)] if output is not None else []),
+            inputTokens=inputTokens,
+            outputTokens=outputTokens,
+            cost=cost,
+            provider=adapter.name,
+            model=model,
+            guardErrors=guardErrors or None,
+            lytixEventId=ioEventId,
+        ).dict(),
+        passthrough,
+    )
+
+
+async def proxyGet(adapter: ProxyAdapter, request: Request, path: str):
+    """
+    Blindly forward get requests, dont intercept anything just proxy
+    """
+    response = await httpClientPool.get(adapter.name).get(
+        adapter.upstreamURL(path, None),
+        headers=upstreamHeaders(adapter, request),
+        params=dict(request.query_params),
+    )
+    return Response(
+        content=response.content,
+        status_code=response.status_code,
+        headers={
+            k: v
+            for k, v in response.headers.items()
+            if k.lower() not in DROPPED_RESPONSE_HEADERS
+        },
+    )
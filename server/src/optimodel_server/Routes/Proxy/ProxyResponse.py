@@ -0,0 +1,111 @@
+import base64
+import json
+from typing import Any, Dict
+
+import httpx
+from fastapi import Request, Response
+
+from optimodel_server.Config.types import PROXY_PASSTHROUGH
+
+_decoder = json.JSONDecoder()
+
+"""
+Keys of the payload we send in passthrough mode. messagesV2 is left out, the client
+already has the response and a header has to stay small
+"""
+PASSTHROUGH_PAYLOAD_KEYS = [
+    "inputTokens",
+    "outputTokens",
+    "cost",
+    "provider",
+    "guardErrors",
+    "model",
+    "lytixEventId",
+]
+
+
+def isPassthrough(request: Request) -> bool:
+    """
+    Passthrough is on for the whole server (OPTIMODEL_PROXY_PASSTHROUGH), or per request
+    with the x-lytix-proxy-passthrough header
+    """
+    header = request.headers.get("x-lytix-proxy-passthrough")
+    if header is not None:
+        return header.lower() in ["1", "true", "yes"]
+    return PROXY_PASSTHROUGH
+
+
+def extractUsage(body: bytes, key: str = "usage") -> Dict[str, Any] | None:
+    """
+    Parse only the usage object out of a JSON response body. Every API we proxy puts it
+    at (or near) the end of the body, so we search backwards for the key and decode just
+    the value that follows it.
+
+    A "usage" inside a string value is always escaped (\\"usage\\"), so an unescaped match
+    followed by a colon is a key
+    """
+    needle = f'"{key}"'.encode("utf-8")
+    end = len(body)
+    while True:
+        position = body.rfind(needle, 0, end)
+        if position == -1:
+            return None
+        end = position
+        if position > 0 and body[position - 1 : position] == b"\\":
+            continue
+        tail = body[position + len(needle) :].lstrip()
+        if not tail.startswith(b":"):
+            continue
+        try:
+            value, _ = _decoder.raw_decode(tail[1:].lstrip().decode("utf-8"))
+        except (ValueError, UnicodeDecodeError):
+            continue
+        if isinstance(value, dict):
+            return value
+
+
+def spliceProxyPayload(body: bytes, payload: Dict[str, Any]) -> bytes:
+    """
+    Insert "lytix-proxy-payload" as the first key of a JSON object body without
+    decoding and encoding the rest of it. Bodies that aren't an object are left alone
+    """
+    stripped = body.lstrip()
+    if not stripped.startswith(b"{"):
+        return body
+    rest = stripped[1:]
+    separator = b"" if rest.lstrip().startswith(b"}") else b","
+    return (
+        b'{"lytix-proxy-payload":'
+        + json.dumps(payload).encode("utf-8")
+        + separator
+        + rest
+    )
+
+
+def proxyResponse(
+    upstream: httpx.Response, payload: Dict[str, Any] | None, passthrough: bool
+) -> Response:
+    """
+    Send the upstream body back with our payload: spliced into the body by default, or
+    with the body forwarded untouched and the payload (base64 JSON) in the
+    x-lytix-proxy-payload header in passthrough mode
+    """
+    if passthrough:
+        headers = {}
+        if payload is not None:
+            headers["x-lytix-proxy-payload"] = base64.b64encode(
+                json.dumps(
+                    {key: payload.get(key) for key in PASSTHROUGH_PAYLOAD_KEYS}
+                ).encode("utf-8")
+            ).decode("ascii")
+        return Response(
+            content=upstream.content,
+            status_code=upstream.status_code,
+            headers=headers,
+            media_type=upstream.headers.get("content-type", "application/json"),
+        )
+    return Response(
+        content=spliceProxyPayload(upstream.content, payload),
+        status_code=upstream.status_code,
+        media_type="application/json",
+    )
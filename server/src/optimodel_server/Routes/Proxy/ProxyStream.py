@@ -0,0 +1,616 @@
+import json
+import logging
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+import httpx
+from fastapi import Response
+
+from optimodel_server.OptimodelError import OptimodelError
+from optimodel_server.Routes import LytixProxyResponse
+from optimodel_server.Routes.Proxy.ModelLookup import proxyCost
+from optimodel_server.Utils.StreamingGuardMonitor import StreamingGuardMonitor
+from optimodel_types.providerTypes import GuardError
+
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamError(OptimodelError):
+    """
+    A proxy upstream answered with something other than a 200
+    """
+
+    def __init__(self, statusCode: int, body: bytes, provider: str = None):
+        super().__init__(
+            f"Non-200 response from upstream: {statusCode} {body[:500]}", provider
+        )
+        self.statusCode = statusCode
+        self.body = body
+
+    def toResponse(self) -> Response:
+        """
+        The upstream's error as it was sent to us
+        """
+        return Response(
+            content=self.body,
+            status_code=self.statusCode,
+            media_type="application/json",
+        )
+
+    def isUnavailable(self) -> bool:
+        """
+        Rate limited, overloaded or down, another provider might still serve the model.
+        Other 4xx responses would fail anywhere
+        """
+        return self.statusCode in [408, 429] or self.statusCode >= 500
+
+
+class StreamFormat:
+    """
+    How to read and write the streamed chunks of one upstream API. Each chunk is the
+    JSON payload of one server sent event
+    """
+
+    """
+    Data of the event that marks the end of the stream, if the API sends one
+    """
+    doneSentinel: bytes | None = None
+
+    """
+    Prefix of the ids we make up for streams we write ourselves
+    """
+    idPrefix: str = ""
+
+    def parseChunk(
+        self, chunk: Dict[str, Any]
+    ) -> Tuple[str, int | None, int | None, bool]:
+        """
+        @return (text delta, input tokens, output tokens, whether this chunk ends the
+            response, i.e. has a finish reason or the final usage)
+        """
+        raise NotImplementedError
+
+    def blockedChunks(
+        self,
+        message: str | None,
+        model: str,
+        streamId: str | None = None,
+        contentClosed: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """
+        The chunks we end the stream with when a guard blocks it
+
+        @param contentClosed: We already forwarded a chunk that closes the output (see
+            closesContent), so the message can't be added to it
+        """
+        raise NotImplementedError
+
+    def closesContent(self, chunk: Dict[str, Any]) -> bool:
+        """
+        If this chunk closes the output, for APIs that send output in blocks
+        """
+        return False
+
+    """
+    Writing a stream for output we didn't get from this API (a model routed through
+    queryModelStream), see translatedStream
+    """
+
+    def startChunks(self, model: str, streamId: str) -> List[Dict[str, Any]]:
+        return []
+
+    def deltaChunks(self, text: str, model: str, streamId: str) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def finalChunks(
+        self, model: str, streamId: str, inputTokens: int, outputTokens: int
+    ) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def errorChunk(self, message: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def eventName(self, chunk: Dict[str, Any]) -> str | None:
+        """
+        Name of the event (event: line) to send a chunk with, for APIs that use them
+        """
+        return None
+
+
+class OpenAIStreamFormat(StreamFormat):
+    doneSentinel = b"[DONE]"
+    idPrefix = "chatcmpl-"
+
+    def parseChunk(self, chunk):
+        delta = ""
+        isFinal = False
+        choices = chunk.get("choices") or []
+        for choice in choices:
+            if choice.get("index", 0) != 0:
+                continue
+            delta += (choice.get("delta") or {}).get("content") or ""
+            if choice.get("finish_reason") is not None:
+                isFinal = True
+        usage = chunk.get("usage") or {}
+        if usage and not choices:
+            isFinal = True
+        return (
+            delta,
+            usage.get("prompt_tokens"),
+            usage.get("completion_tokens"),
+            isFinal,
+        )
+
+    def chunk(
+        self, model: str, streamId: str | None, delta: dict, finishReason: str | None
+    ) -> Dict[str, Any]:
+        return {
+            "id": streamId or f"chatcmpl-{uuid.uuid4()}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [
+                {
+                    "index": 0,
+                    "delta": delta,
+                    "logprobs": None,
+                    "finish_reason": finishReason,
+                }
+            ],
+        }
+
+    def blockedChunks(self, message, model, streamId=None, contentClosed=False):
+        return [
+            self.chunk(
+                model,
+                streamId,
+                {"content": message} if message else {},
+                "content_filter",
+            )
+        ]
+
+    def startChunks(self, model, streamId):
+        return [self.chunk(model, streamId, {"role": "assistant", "content": ""}, None)]
+
+    def deltaChunks(self, text, model, streamId):
+        return [self.chunk(model, streamId, {"content": text}, None)]
+
+    def finalChunks(self, model, streamId, inputTokens, outputTokens):
+        return [
+            {
+                **self.chunk(model, streamId, {}, "stop"),
+                "usage": {
+                    "prompt_tokens": inputTokens,
+                    "completion_tokens": outputTokens,
+                    "total_tokens": inputTokens + outputTokens,
+                },
+            }
+        ]
+
+    def errorChunk(self, message):
+        return {"error": {"message": message, "type": "server_error"}}
+
+
+class GeminiStreamFormat(StreamFormat):
+    def parseChunk(self, chunk):
+        delta = ""
+        isFinal = False
+        for candidate in chunk.get("candidates") or []:
+            if candidate.get("index", 0) != 0:
+                continue
+            for part in (candidate.get("content") or {}).get("parts") or []:
+                delta += part.get("text") or ""
+            if candidate.get("finishReason") is not None:
+                isFinal = True
+        usage = chunk.get("usageMetadata") or {}
+        return (
+            delta,
+            usage.get("promptTokenCount"),
+            usage.get("candidatesTokenCount"),
+            isFinal,
+        )
+
+    def chunk(self, parts: list, finishReason: str | None) -> Dict[str, Any]:
+        candidate = {"content": {"role": "model", "parts": parts}, "index": 0}
+        if finishReason is not None:
+            candidate["finishReason"] = finishReason
+        return {"candidates": [candidate]}
+
+    def blockedChunks(self, message, model, streamId=None, contentClosed=False):
+        return [self.chunk([{"text": message}] if message else [], "SAFETY")]
+
+    def deltaChunks(self, text, model, streamId):
+        return [{**self.chunk([{"text": text}], None), "modelVersion": model}]
+
+    def finalChunks(self, model, streamId, inputTokens, outputTokens):
+        return [
+            {
+                **self.chunk([{"text": ""}], "STOP"),
+                "usageMetadata": {
+                    "promptTokenCount": inputTokens,
+                    "candidatesTokenCount": outputTokens,
+                    "totalTokenCount": inputTokens + outputTokens,
+                },
+                "modelVersion": model,
+            }
+        ]
+
+    def errorChunk(self, message):
+        return {"error": {"code": 500, "message": message, "status": "INTERNAL"}}
+
+
+class AnthropicStreamFormat(StreamFormat):
+    """
+    Input tokens come with message_start, output tokens (and the stop reason) with
+    message_delta. Every chunk is sent as the event named after its type
+    """
+
+    idPrefix = "msg_"
+
+    def parseChunk(self, chunk):
+        match chunk.get("type"):
+            case "message_start":
+                usage = (chunk.get("message") or {}).get("usage") or {}
+                return "", usage.get("input_tokens"), usage.get("output_tokens"), False
+            case "content_block_delta":
+                delta = chunk.get("delta") or {}
+                if delta.get("type") == "text_delta":
+                    return delta.get("text") or "", None, None, False
+            case "message_delta":
+                usage = chunk.get("usage") or {}
+                return "", usage.get("input_tokens"), usage.get("output_tokens"), True
+        return "", None, None, False
+
+    def blockedChunks(self, message, model, streamId=None, contentClosed=False):
+        """
+        If the upstream's content_block_stop already went out, a second one (or a delta
+        after it) would break the client's parser, so we only end the message
+        """
+        chunks = []
+        if not contentClosed:
+            if message:
+                chunks.append(
+                    {
+                        "type": "content_block_delta",
+                        "index": 0,
+                        "delta": {"type": "text_delta", "text": message},
+                    }
+                )
+            chunks.append({"type": "content_block_stop", "index": 0})
+        return chunks + [
+            {
+                "type": "message_delta",
+                "delta": {"stop_reason": "refusal", "stop_sequence": None},
+                "usage": {"output_tokens": 0},
+            },
+            {"type": "message_stop"},
+        ]
+
+    def startChunks(self, model, streamId):
+        return [
+            {
+                "type": "message_start",
+                "message": {
+                    "id": streamId,
+                    "type": "message",
+                    "role": "assistant",
+                    "model": model,
+                    "content": [],
+                    "stop_reason": None,
+                    "stop_sequence": None,
+                    "usage": {"input_tokens": 0, "output_tokens": 0},
+                },
+            },
+            {
+                "type": "content_block_start",
+                "index": 0,
+                "content_block": {"type": "text", "text": ""},
+            },
+        ]
+
+    def deltaChunks(self, text, model, streamId):
+        return [
+            {
+                "type": "content_block_delta",
+                "index": 0,
+                "delta": {"type": "text_delta", "text": text},
+            }
+        ]
+
+    def finalChunks(self, model, streamId, inputTokens, outputTokens):
+        """
+        Routed providers only report usage at the end, so message_delta carries the
+        input tokens too
+        """
+        return [
+            {"type": "content_block_stop", "index": 0},
+            {
+                "type": "message_delta",
+                "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                "usage": {"input_tokens": inputTokens, "output_tokens": outputTokens},
+            },
+            {"type": "message_stop"},
+        ]
+
+    def errorChunk(self, message):
+        return {"type": "error", "error": {"type": "api_error", "message": message}}
+
+    def closesContent(self, chunk):
+        return chunk.get("type") == "content_block_stop"
+
+    def eventName(self, chunk):
+        return chunk.get("type")
+
+
+class StreamFramer:
+    """
+    Writes chunks as server sent events (named, for APIs that use event: lines), or as
+    the elements of one JSON array (Gemini without alt=sse)
+    """
+
+    def __init__(self, arrayFraming: bool = False):
+        self.arrayFraming = arrayFraming
+        self.started = False
+
+    def frame(self, data: bytes, eventName: str | None = None) -> bytes:
+        if self.arrayFraming:
+            prefix = b"," if self.started else b"["
+            self.started = True
+            return prefix + data + b"\r\n"
+        if eventName is not None:
+            return b"event: " + eventName.encode("utf-8") + b"\ndata: " + data + b"\n\n"
+        return b"data: " + data + b"\n\n"
+
+    def frameChunk(self, chunk: Dict[str, Any], streamFormat: StreamFormat) -> bytes:
+        return self.frame(json.dumps(chunk).encode("utf-8"), streamFormat.eventName(chunk))
+
+    def end(self, streamFormat: StreamFormat, sawDone: bool) -> bytes:
+        """
+        Close the array, or send the API's done sentinel if it uses one (and the stream
+        it's relaying had it)
+        """
+        if self.arrayFraming:
+            return b"]" if self.started else b"[]"
+        if streamFormat.doneSentinel is not None and sawDone:
+            return self.frame(streamFormat.doneSentinel)
+        return b""
+
+
+async def iterServerSentEvents(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Split a server sent event stream into the data of each event as it arrives
+    """
+    buffer = b""
+    async for chunk in chunks:
+        buffer = (buffer + chunk).replace(b"\r\n", b"\n")
+        *events, buffer = buffer.split(b"\n\n")
+        for event in events:
+            data = b"\n".join(
+                line[5:].lstrip(b" ")
+                for line in event.split(b"\n")
+                if line.startswith(b"data:")
+            )
+            if data:
+                yield data
+    if buffer.strip().startswith(b"data:"):
+        yield buffer.strip()[5:].lstrip(b" ")
+
+
+async def openUpstreamStream(
+    client: httpx.AsyncClient,
+    url: str,
+    body: Dict[str, Any],
+    headers: Dict[str, str],
+    params: Dict[str, str] | None = None,
+) -> httpx.Response:
+    """
+    Start the upstream stream, so a failure can still fall back to the next model
+
+    @raises UpstreamError on a non-200 response
+    """
+    response = await client.send(
+        client.build_request("POST", url, json=body, headers=headers, params=params),
+        stream=True,
+    )
+    if response.status_code != 200:
+        errorBody = await response.aread()
+        await response.aclose()
+        raise UpstreamError(response.status_code, errorBody)
+    return response
+
+
+async def guardedProxyStream(
+    upstream: httpx.Response,
+    streamFormat: StreamFormat,
+    monitor: StreamingGuardMonitor,
+    messages: List[dict],
+    model: str,
+    providerName: str,
+    guardErrors: List[GuardError],
+    ioEventId: str | None = None,
+    dropUsageOnlyChunk: bool = False,
+    arrayFraming: bool = False,
+) -> AsyncIterator[bytes]:
+    """
+    Relay an upstream stream while we read it: accumulate the output text for the
+    postQuery guards (see StreamingGuardMonitor) and pick up token usage.
+
+    Chunks are forwarded as they arrive, except the final ones (finish reason, usage)
+    which we hold back until the upstream is done so we can attach the
+    lytix-proxy-payload (usage, cost, guard errors) to the last of them. If a blocking
+    guard fails in incremental mode we stop reading the upstream and end the stream with
+    a blocked chunk carrying the guard's message and the payload instead.
+
+    @param dropUsageOnlyChunk: We asked for the usage chunk (stream_options) without the
+        client asking for it, don't forward it
+    @param arrayFraming: Write a JSON array (Gemini without alt=sse) instead of events
+    """
+    output = ""
+    inputTokens = None
+    outputTokens = None
+    heldChunks: List[Dict[str, Any]] = []
+    sawDone = False
+    contentClosed = False
+    blocked = None
+    framer = StreamFramer(arrayFraming)
+    frame = framer.frame
+
+    try:
+        async for data in iterServerSentEvents(upstream.aiter_bytes()):
+            if data.strip() == streamFormat.doneSentinel:
+                sawDone = True
+                continue
+            try:
+                chunk = json.loads(data)
+            except json.JSONDecodeError:
+                yield frame(data)
+                continue
+
+            delta, chunkInputTokens, chunkOutputTokens, isFinal = (
+                streamFormat.parseChunk(chunk)
+            )
+            if chunkInputTokens is not None:
+                inputTokens = chunkInputTokens
+            if chunkOutputTokens is not None:
+                outputTokens = chunkOutputTokens
+            if delta:
+                output += delta
+                monitor.feed(output)
+
+            if isFinal or heldChunks:
+                heldChunks.append(chunk)
+            else:
+                yield frame(data, streamFormat.eventName(chunk))
+                contentClosed = contentClosed or streamFormat.closesContent(chunk)
+
+            blocked = monitor.blocked()
+            if blocked is not None:
+                logger.info("Postquery guard blocked the proxied stream")
+                break
+    finally:
+        await upstream.aclose()
+        monitor.close()
+
+    try:
+        blockedGuardErrors, blockingGuard = blocked or await monitor.finish(output)
+        lytixProxyPayload = LytixProxyResponse(
+            messagesV2=messages
+            + [{"role": "assistant", "content": [{"type": "text", "text": output}]}],
+            inputTokens=inputTokens,
+            outputTokens=outputTokens,
+            cost=proxyCost(model, providerName, inputTokens, outputTokens),
+            provider=providerName,
+            model=model,
+            guardErrors=[*guardErrors, *blockedGuardErrors] or None,
+            lytixEventId=ioEventId,
+        ).dict()
+    except Exception as e:
+        """
+        The upstream's chunks already went out, all we can do is end the stream with an
+        error the client's parser understands
+        """
+        logger.error(f"Error finishing proxied stream from {providerName}: {e}")
+        yield framer.frameChunk(streamFormat.errorChunk(str(e)), streamFormat)
+        end = framer.end(streamFormat, True)
+        if end:
+            yield end
+        return
+
+    if blocked is not None:
+        heldChunks = streamFormat.blockedChunks(
+            blockingGuard.blockRequestMessage, model, contentClosed=contentClosed
+        )
+    elif dropUsageOnlyChunk and any(chunk.get("choices") for chunk in heldChunks):
+        heldChunks = [chunk for chunk in heldChunks if chunk.get("choices")]
+    if not heldChunks:
+        heldChunks = [{}]
+
+    heldChunks[-1] = {**heldChunks[-1], "lytix-proxy-payload": lytixProxyPayload}
+    for chunk in heldChunks:
+        yield framer.frameChunk(chunk, streamFormat)
+    end = framer.end(streamFormat, sawDone or blocked is not None)
+    if end:
+        yield end
+
+
+async def translatedStream(
+    events: AsyncIterator[Dict[str, Any]],
+    streamFormat: StreamFormat,
+    messages: List[dict],
+    model: str,
+    guardErrors: List[GuardError],
+    ioEventId: str | None = None,
+    arrayFraming: bool = False,
+) -> AsyncIterator[bytes]:
+    """
+    Write a stream we routed through queryModelStream (any provider that hosts the
+    model) in this API's wire format. The postQuery guards, usage and cost come from the
+    done event, which we turn into the final chunks with the lytix-proxy-payload like
+    guardedProxyStream does
+
+    @param events: From openQueryStream
+    @param guardErrors: Errors of guards we already checked before routing
+    """
+    framer = StreamFramer(arrayFraming)
+    streamId = f"{streamFormat.idPrefix}{uuid.uuid4().hex}"
+    done = None
+
+    for chunk in streamFormat.startChunks(model, streamId):
+        yield framer.frameChunk(chunk, streamFormat)
+    try:
+        async for event in events:
+            match event["type"]:
+                case "delta":
+                    for chunk in streamFormat.deltaChunks(event["delta"], model, streamId):
+                        yield framer.frameChunk(chunk, streamFormat)
+                case "done":
+                    done = event
+                case "error":
+                    """
+                    The provider failed mid stream, we can't fall back anymore
+                    """
+                    yield framer.frameChunk(
+                        streamFormat.errorChunk(event["error"]), streamFormat
+                    )
+                    break
+    finally:
+        await events.aclose()
+
+    if done is not None:
+        inputTokens = done.get("promptTokens") or 0
+        outputTokens = done.get("generationTokens") or 0
+        if done.get("finishReason") == "guard":
+            finalChunks = streamFormat.blockedChunks(
+                done["modelResponse"], model, streamId
+            )
+        else:
+            finalChunks = streamFormat.finalChunks(
+                model, streamId, inputTokens, outputTokens
+            )
+        finalChunks[-1] = {
+            **finalChunks[-1],
+            "lytix-proxy-payload": LytixProxyResponse(
+                messagesV2=messages
+                + [
+                    {
+                        "role": "assistant",
+                        "content": [{"type": "text", "text": done["modelResponse"]}],
+                    }
+                ],
+                inputTokens=inputTokens,
+                outputTokens=outputTokens,
+                cost=done.get("cost"),
+                provider=done.get("provider"),
+                model=model,
+                guardErrors=[*guardErrors, *(done.get("guardErrors") or [])] or None,
+                lytixEventId=ioEventId,
+            ).dict(),
+        }
+        for chunk in finalChunks:
+            yield framer.frameChunk(chunk, streamFormat)
+
+    end = framer.end(streamFormat, done is not None)
+    if end:
+        yield end
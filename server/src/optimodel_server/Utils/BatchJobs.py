@@ -0,0 +1,205 @@
+import asyncio
+import json
+import logging
+import tempfile
+import time
+import uuid
+from typing import IO, AsyncIterator, Dict, Set
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from optimodel_server.Config.types import (
+    BATCH_JOB_MAX_JOBS,
+    BATCH_JOB_TTL_SECONDS,
+    BATCH_SPOOL_MAX_MEMORY_BYTES,
+)
+from optimodel_server.GuardClient import GuardClient
+from optimodel_server.Utils.QueryModelMain import queryModelMain
+from optimodel_server.Utils.TTLCache import TTLCache
+from optimodel_types import QueryBody
+
+
+logger = logging.getLogger(__name__)
+
+
+class BatchJob:
+    """
+    State of a batch job, so a client that got disconnected can resume it. We keep the
+    result line of every item that succeeded, failed items are retried on resume
+    """
+
+    def __init__(self, jobId: str):
+        self.jobId = jobId
+        self.results: Dict[int, str] = {}
+        """
+        Items whose latest attempt failed, a retry that succeeds takes them out
+        """
+        self.failedIndexes: Set[int] = set()
+        self.total: int | None = None
+        self.running = False
+        self.createdAt = time.time()
+        self.updatedAt = self.createdAt
+
+    def record(self, index: int, line: str, success: bool):
+        if success:
+            self.results[index] = line
+            self.failedIndexes.discard(index)
+        else:
+            self.failedIndexes.add(index)
+        self.updatedAt = time.time()
+
+    def toDict(self) -> dict:
+        return {
+            "jobId": self.jobId,
+            "status": (
+                "running"
+                if self.running
+                else (
+                    "completed"
+                    if self.total is not None and len(self.results) == self.total
+                    else "incomplete"
+                )
+            ),
+            "total": self.total,
+            "succeeded": len(self.results),
+            "failed": len(self.failedIndexes),
+            "createdAt": self.createdAt,
+            "updatedAt": self.updatedAt,
+        }
+
+
+class BatchJobStore:
+    """
+    In memory store of recent batch jobs, oldest jobs are dropped first
+    """
+
+    def __init__(self, maxJobs: int, ttlSeconds: float):
+        self.jobs = TTLCache(maxSize=maxJobs, ttlSeconds=ttlSeconds)
+
+    def getOrCreate(self, jobId: str | None) -> BatchJob:
+        jobId = jobId or str(uuid.uuid4())
+        return self.jobs.getOrCreate(jobId, lambda: BatchJob(jobId))
+
+    def get(self, jobId: str) -> BatchJob | None:
+        return self.jobs.get(jobId)
+
+    def stats(self) -> dict:
+        return self.jobs.stats()
+
+
+async def spoolUpload(chunks: AsyncIterator[bytes]) -> IO[bytes]:
+    """
+    Read the whole upload before we respond. StreamingResponse listens for the client
+    disconnecting by calling receive() itself, which drops any body we haven't read yet,
+    so we can't keep reading the request while streaming results back. Large uploads go
+    to a temp file
+    """
+    upload = tempfile.SpooledTemporaryFile(max_size=BATCH_SPOOL_MAX_MEMORY_BYTES)
+    try:
+        async for chunk in chunks:
+            upload.write(chunk)
+    except BaseException:
+        upload.close()
+        raise
+    upload.seek(0)
+    return upload
+
+
+async def runBatch(
+    job: BatchJob,
+    upload: IO[bytes],
+    guardClientInstance: GuardClient,
+    concurrency: int,
+) -> AsyncIterator[str]:
+    """
+    Run every QueryBody in a spooled JSONL upload (see spoolUpload) through
+    queryModelMain, at most concurrency at once, yielding {"index", "response"} or
+    {"index", "error"} NDJSON lines in completion order. index is the position of the
+    item among the non empty lines.
+
+    Items the job already has a result for are replayed instead of queried again. Per
+    provider limits are enforced by queryModelMain (see AdmissionControl)
+
+    @NOTE We mark the job as running once the response starts, and it's only released
+    by us, so a client that goes away before that can't leave the job stuck. Two
+    requests can't run the same job at once
+    """
+    if job.running:
+        upload.close()
+        yield json.dumps({"error": f"Batch job {job.jobId} is running"}) + "\n"
+        return
+    job.running = True
+
+    queue: asyncio.Queue[str | None] = asyncio.Queue()
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = set()
+
+    async def runItem(index: int, rawLine: bytes):
+        success = False
+        try:
+            data = QueryBody(**json.loads(rawLine))
+            response = await queryModelMain(data, guardClientInstance)
+            if isinstance(response, JSONResponse):
+                result = {"index": index, "error": json.loads(response.body)["error"]}
+            else:
+                result = {"index": index, "response": response}
+                success = True
+        except Exception as e:
+            logger.error(f"Error with batch item {index}: {e}")
+            result = {"index": index, "error": f"Invalid item: {e}"}
+        finally:
+            semaphore.release()
+        line = json.dumps(jsonable_encoder(result), separators=(",", ":"))
+        job.record(index, line, success)
+        await queue.put(line)
+
+    async def produce():
+        index = 0
+        try:
+            for rawLine in upload:
+                if not rawLine.strip():
+                    continue
+                if index in job.results:
+                    await queue.put(job.results[index])
+                else:
+                    """
+                    Don't start more items while we're at our concurrency limit
+                    """
+                    await semaphore.acquire()
+                    task = asyncio.create_task(runItem(index, rawLine))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                index += 1
+            if tasks:
+                await asyncio.wait(set(tasks))
+            job.total = index
+        finally:
+            upload.close()
+            await queue.put(None)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            line = await queue.get()
+            if line is None:
+                break
+            yield line + "\n"
+        await producer
+    finally:
+        """
+        If the client went away we stop reading new items, but let the ones in flight
+        finish so their results are there when the job is resumed
+        """
+        producer.cancel()
+        upload.close()
+        if tasks:
+            remaining = asyncio.ensure_future(asyncio.wait(set(tasks)))
+            remaining.add_done_callback(lambda _: setattr(job, "running", False))
+        else:
+            job.running = False
+
+
+batchJobStore = BatchJobStore(
+    maxJobs=BATCH_JOB_MAX_JOBS, ttlSeconds=BATCH_JOB_TTL_SECONDS
+)
@@ -0,0 +1,179 @@
+import logging
+from typing import Dict
+
+import httpx
+
+from optimodel_server.Config.types import (
+    PROXY_CONNECT_TIMEOUT_SECONDS,
+    PROXY_HTTP2,
+    PROXY_KEEPALIVE_EXPIRY_SECONDS,
+    PROXY_MAX_CONNECTIONS,
+    PROXY_MAX_KEEPALIVE_CONNECTIONS,
+    PROXY_READ_TIMEOUT_SECONDS,
+)
+
+"""
+Optional dependency, see the http2 extra (pip install optimodel-server[http2])
+"""
+try:
+    import h2
+except ImportError:
+    h2 = None
+
+
+logger = logging.getLogger(__name__)
+
+"""
+Connection specific headers a client sends us that mustn't be forwarded upstream (and
+that HTTP/2 rejects outright)
+"""
+HOP_BY_HOP_HEADERS = [
+    "connection",
+    "keep-alive",
+    "proxy-connection",
+    "transfer-encoding",
+    "upgrade",
+    "te",
+]
+
+
+class CountedStream(httpx.AsyncByteStream):
+    """
+    Response body that tells its transport when it's done, so we know a request is no
+    longer holding a connection
+    """
+
+    def __init__(self, stream: httpx.AsyncByteStream, onClose):
+        self.stream = stream
+        self.onClose = onClose
+        self.closed = False
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self.stream.aclose()
+        finally:
+            if not self.closed:
+                self.closed = True
+                self.onClose()
+
+
+class CountingTransport(httpx.AsyncBaseTransport):
+    """
+    Wraps the pooled transport of one upstream to keep track of how many requests are
+    in flight (from sending the request until the body is closed)
+    """
+
+    def __init__(self, transport: httpx.AsyncHTTPTransport, maxConnections: int):
+        self.transport = transport
+        self.maxConnections = maxConnections
+        self.requests = 0
+        self.errors = 0
+        self.inFlight = 0
+        self.peakInFlight = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        for header in HOP_BY_HOP_HEADERS:
+            if header in request.headers:
+                del request.headers[header]
+
+        self.requests += 1
+        self.inFlight += 1
+        self.peakInFlight = max(self.peakInFlight, self.inFlight)
+        try:
+            response = await self.transport.handle_async_request(request)
+        except Exception:
+            self.errors += 1
+            self._release()
+            raise
+        response.stream = CountedStream(response.stream, self._release)
+        return response
+
+    def _release(self):
+        self.inFlight -= 1
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "inFlight": self.inFlight,
+            "peakInFlight": self.peakInFlight,
+            "maxConnections": self.maxConnections,
+            "utilization": self.inFlight / self.maxConnections,
+        }
+
+
+class HTTPClientPool:
+    """
+    One long lived httpx.AsyncClient per upstream (e.g. openai, anthropic, gemini), so
+    proxied requests reuse warm connections instead of redoing TCP and TLS every call.
+    Clients are created on first use and closed at app shutdown. Each worker process has
+    its own pool
+    """
+
+    def __init__(
+        self,
+        http2: bool,
+        maxConnections: int,
+        maxKeepaliveConnections: int,
+        keepaliveExpirySeconds: float,
+        connectTimeoutSeconds: float,
+        readTimeoutSeconds: float,
+    ):
+        self.http2 = http2 and h2 is not None
+        if http2 and h2 is None:
+            logger.info(
+                "h2 is not installed, proxying over HTTP/1.1. Install it with pip install optimodel-server[http2]"
+            )
+        self.limits = httpx.Limits(
+            max_connections=maxConnections,
+            max_keepalive_connections=maxKeepaliveConnections,
+            keepalive_expiry=keepaliveExpirySeconds,
+        )
+        self.timeout = httpx.Timeout(
+            readTimeoutSeconds, connect=connectTimeoutSeconds
+        )
+        self.clients: Dict[str, httpx.AsyncClient] = {}
+        self.transports: Dict[str, CountingTransport] = {}
+
+    def get(self, upstream: str) -> httpx.AsyncClient:
+        client = self.clients.get(upstream)
+        if client is None or client.is_closed:
+            transport = CountingTransport(
+                httpx.AsyncHTTPTransport(http2=self.http2, limits=self.limits),
+                maxConnections=self.limits.max_connections,
+            )
+            client = httpx.AsyncClient(transport=transport, timeout=self.timeout)
+            self.clients[upstream] = client
+            self.transports[upstream] = transport
+        return client
+
+    async def close(self):
+        for client in self.clients.values():
+            await client.aclose()
+        self.clients = {}
+
+    def stats(self) -> dict:
+        return {
+            "http2": self.http2,
+            "upstreams": {
+                upstream: transport.stats()
+                for upstream, transport in self.transports.items()
+            },
+        }
+
+
+httpClientPool = HTTPClientPool(
+    http2=PROXY_HTTP2,
+    maxConnections=PROXY_MAX_CONNECTIONS,
+    maxKeepaliveConnections=PROXY_MAX_KEEPALIVE_CONNECTIONS,
+    keepaliveExpirySeconds=PROXY_KEEPALIVE_EXPIRY_SECONDS,
+    connectTimeoutSeconds=PROXY_CONNECT_TIMEOUT_SECONDS,
+    readTimeoutSeconds=PROXY_READ_TIMEOUT_SECONDS,
+)
@@ -1,11 +1,35 @@
+import asyncio
+import copy
+import hashlib
 import json
+import time
 from typing import List, Tuple, Dict, Any
 from fastapi.responses import JSONResponse
 from httpx import QueryParams
-from optimodel_server import GuardClient
-from optimodel_server.Config.types import SAAS_MODE
+from optimodel_server.Cache import responseCache, semanticCache
+from optimodel_server.GuardClient import GuardClient
+from optimodel_server.Config.types import (
+    ADMISSION_MAX_WAIT_MS,
+    COALESCE_REQUESTS,
+    GUARD_CONCURRENT,
+    HEDGE_DEFAULT_DELAY_MS,
+    HEDGE_MAX_IN_FLIGHT,
+    HEDGE_PERCENTILE,
+    SAAS_MODE,
+)
 from optimodel_server.OptimodelError import OptimodelError, OptimodelGuardError
 from optimodel_server.Planner.Planner import getAllAvailableProviders, orderProviders
+from optimodel_server.Planner.AdmissionControl import (
+    admissionController,
+    estimateTokens,
+)
+from optimodel_server.Planner.CircuitBreaker import (
+    circuitBreakers,
+    isProviderFailure,
+    isProviderOutage,
+)
+from optimodel_server.Planner.ProviderStats import providerStats
+from optimodel_server.Utils.SingleFlight import SingleFlight
 from optimodel_types import Guards, ModelMessage, QueryBody
 from optimodel_types.providerTypes import GuardError, MakeQueryResponse, QueryResponse
 import logging
@@ -16,26 +40,106 @@ logging.basicConfig(stream=sys.stdout, level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-async def check_pre_query_guards(
-    preQueryGuards: List[Any],
+async def evaluateGuards(
+    guards: List[Guards],
     guardClientInstance: GuardClient,
     messages: List[ModelMessage],
-    providerName: str,
-) -> Tuple[List[GuardError], bool]:
-    guardErrors = []
-    for guard in preQueryGuards:
-        logger.info(f"Checking preQuery guard {guard.guardName}")
+    modelOutput: str | None = None,
+    failOpen: bool = False,
+    sessionId: str | None = None,
+) -> List[Tuple[Guards, Dict[str, Any]]]:
+    """
+    Check a list of guards, returning (guard, guardResponse) pairs in guard order.
+    Stops at the first failing guard that blocks the request. In concurrent mode every
+    guard is checked at once and the first blocking failure cancels the rest
+
+    @param failOpen: If the guard server errors, treat non-blocking guards as passed
+        instead of raising
+    """
+
+    async def checkSingleGuard(guard: Guards):
+        logger.info(f"Checking {guard.guardType} guard {guard.guardName}")
         try:
-            guardResponse = await guardClientInstance.checkGuard(
-                guards=guard, messages=messages
+            return await guardClientInstance.checkGuard(
+                guards=guard,
+                messages=messages,
+                modelOutput=modelOutput,
+                sessionId=sessionId,
             )
         except Exception as e:
             logger.error(f"Error checking guard: {e}")
-            if guard.blockRequest is True:
+            if failOpen is False or guard.blockRequest is True:
                 raise OptimodelError(f"Error checking guard: {e}")
-            else:
-                guardResponse = {"failure": False}
+            return {"failure": False}
+
+    def isBlocking(guard: Guards, guardResponse: Dict[str, Any]) -> bool:
+        return guardResponse["failure"] is True and guard.blockRequest is True
+
+    """
+    Prefer a single round trip to the batch endpoint when we have more than one guard
+    """
+    if len(guards) > 1:
+        try:
+            batchResults = await guardClientInstance.checkGuards(
+                guards=guards,
+                messages=messages,
+                modelOutput=modelOutput,
+                sessionId=sessionId,
+            )
+        except Exception as e:
+            if failOpen is False or any(guard.blockRequest for guard in guards):
+                raise OptimodelError(f"Error checking guards: {e}")
+            batchResults = [{"failure": False} for _ in guards]
+        if batchResults is not None:
+            return list(zip(guards, batchResults))
+
+    if not GUARD_CONCURRENT or len(guards) <= 1:
+        results = []
+        for guard in guards:
+            guardResponse = await checkSingleGuard(guard)
+            results.append((guard, guardResponse))
+            if isBlocking(guard, guardResponse):
+                break
+        return results
+
+    tasks = [asyncio.create_task(checkSingleGuard(guard)) for guard in guards]
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            if any(
+                isBlocking(guards[tasks.index(task)], task.result()) for task in done
+            ):
+                break
+    finally:
+        for task in pending:
+            task.cancel()
 
+    return [
+        (guard, task.result())
+        for guard, task in zip(guards, tasks)
+        if task.done() and not task.cancelled()
+    ]
+
+
+async def check_pre_query_guards(
+    preQueryGuards: List[Any],
+    guardClientInstance: GuardClient,
+    messages: List[ModelMessage],
+    providerName: str,
+    sessionId: str | None = None,
+) -> Tuple[List[GuardError], bool]:
+    guardErrors = []
+    guardResults = await evaluateGuards(
+        guards=preQueryGuards,
+        guardClientInstance=guardClientInstance,
+        messages=messages,
+        failOpen=True,
+        sessionId=sessionId,
+    )
+    for guard, guardResponse in guardResults:
         if guardResponse["failure"] is True:
             guardErrors.append(
                 GuardError(
@@ -60,149 +164,516 @@ async def check_pre_query_guards(
     return guardErrors, False
 
 
-async def queryModelMain(data: QueryBody, guardClientInstance: GuardClient):
+def computeCost(potentialProvider: Dict[str, Any], response: QueryResponse) -> float | None:
+    """
+    Cost of a response given the pricing for the provider it came from
+    """
+    try:
+        if response.promptTokens > 128_000 and potentialProvider.get(
+            "pricePer1MInputAbove125K"
+        ):
+            inputCost = response.promptTokens * (
+                potentialProvider["pricePer1MInputAbove125K"] / 1_000_000
+            )
+        else:
+            inputCost = response.promptTokens * (
+                potentialProvider["pricePer1MInput"] / 1_000_000
+            )
+        if response.generationTokens > 128_000 and potentialProvider.get(
+            "pricePer1MOutputAbove125K"
+        ):
+            outputCost = response.generationTokens * (
+                potentialProvider["pricePer1MOutputAbove125K"] / 1_000_000
+            )
+        else:
+            outputCost = response.generationTokens * (
+                potentialProvider["pricePer1MOutput"] / 1_000_000
+            )
+        cost = inputCost + outputCost
+        logger.info(f">>>Cost: {cost}, {json.dumps(potentialProvider, indent=2)}")
+        return cost
+    except Exception as e:
+        logger.error(f"Error getting cost: {e}")
+        return None
+
+
+async def attemptProvider(
+    potentialProvider: Dict[str, Any],
+    data: QueryBody,
+    admissionWaitSeconds: float = 0,
+) -> QueryResponse:
+    """
+    Query a single provider, recording the outcome in our stats and circuit breakers
+
+    @param admissionWaitSeconds: How long to wait for the provider to have room under
+        its rate limits before giving up on it
+    @raises OptimodelError if the provider can't be used or the query failed
+    """
+    providerName = potentialProvider["provider"]
+    logger.info(f"Attempting query model {data.modelToUse} with {providerName}...")
+
+    # If we're in SAAS mode, validate we have credentials
+    if SAAS_MODE is not None:
+        if data.credentials is None:
+            raise OptimodelError("No credentials provided")
+
+    ticket = await admissionController.admit(
+        providerName,
+        data.modelToUse,
+        estimateTokens(data.messages, data.maxGenLen),
+        maxWaitSeconds=admissionWaitSeconds,
+    )
+    if ticket is None:
+        raise OptimodelError(
+            "Rate limited, provider has no capacity", provider=providerName
+        )
+
+    actualTokens = None
     try:
-        allAvailableProviders = getAllAvailableProviders(data)
         """
-        Now its time to just pick the best one based on our criteria
+        The circuit may have opened (or its probe slot been taken) since we ordered the
+        providers
         """
-        orderedProviders = orderProviders(allAvailableProviders, data)
+        if not circuitBreakers.tryAcquire(
+            providerName, data.modelToUse, data.credentials
+        ):
+            raise OptimodelError(
+                "Circuit open, skipping provider", provider=providerName
+            )
 
+        try:
+            params: QueryParams = {
+                "messages": data.messages,
+                "model": potentialProvider["name"],
+                "credentials": data.credentials,
+                "maxGenLen": data.maxGenLen,
+                "jsonMode": data.jsonMode,
+                "temperature": data.temperature,
+            }
+            startTime = time.perf_counter()
+            response = await config.providerInstances[providerName].makeQueryAsync(
+                params=params
+            )
+            providerStats.recordSuccess(
+                data.modelToUse,
+                providerName,
+                latencySeconds=time.perf_counter() - startTime,
+                generationTokens=response.generationTokens,
+            )
+            circuitBreakers.recordSuccess(
+                providerName, data.modelToUse, data.credentials
+            )
+            actualTokens = response.promptTokens + response.generationTokens
+        except asyncio.CancelledError:
+            """
+            We lost a hedged race, this says nothing about the provider's health
+            """
+            circuitBreakers.release(providerName, data.modelToUse, data.credentials)
+            raise
+        except Exception as e:
+            if isProviderFailure(e):
+                providerStats.recordFailure(data.modelToUse, providerName)
+                circuitBreakers.recordFailure(
+                    providerName,
+                    data.modelToUse,
+                    data.credentials,
+                    outage=isProviderOutage(e),
+                )
+            else:
+                circuitBreakers.release(providerName, data.modelToUse, data.credentials)
+            logger.error(f"Error making query: {e}")
+            raise OptimodelError(
+                f"Error making query: {e}",
+                provider=providerName,
+            )
+    finally:
         """
-        Extract out any guards from the query if present
+        Correct our token estimate with what the provider actually reported
         """
-        guards = data.guards
-        logger.info(f"Guards: {guards}")
+        ticket.release(actualTokens)
+
+    logger.info(f"Query successful with {providerName}")
+    return response
+
+
+async def buildQueryResponse(
+    providerName: str,
+    response: QueryResponse,
+    cost: float | None,
+    data: QueryBody,
+    guardClientInstance: GuardClient,
+    postQueryGuards: List[Guards],
+    guardErrors: List[GuardError],
+) -> MakeQueryResponse:
+    queryResponse: MakeQueryResponse = {
+        "modelResponse": response.modelOutput,
+        "promptTokens": response.promptTokens,
+        "generationTokens": response.generationTokens,
+        "cost": cost,
+        "provider": providerName,
+        "guardErrors": guardErrors,
+    }
+
+    """
+    Check if we have any guards
+    """
+    if postQueryGuards:
+        postQueryGuardErrors, queryResponse = await check_post_query_guards(
+            postQueryGuards=postQueryGuards,
+            guardClientInstance=guardClientInstance,
+            messages=data.messages,
+            modelOutput=response.modelOutput,
+            queryResponse=queryResponse,
+            sessionId=data.sessionId,
+        )
+        if postQueryGuardErrors:
+            queryResponse["guardErrors"].extend(postQueryGuardErrors)
+
+    return queryResponse
+
+
+def hedgeDelaySeconds(potentialProvider: Dict[str, Any], data: QueryBody) -> float:
+    """
+    How long to give a provider before also trying the next one. An explicit delay on
+    the request wins, then the percentile of the provider's observed latency, then our
+    default while we don't have enough samples
+    """
+    if data.hedgeDelayMs is not None:
+        return data.hedgeDelayMs / 1000
+    stat = providerStats.get(data.modelToUse, potentialProvider["provider"])
+    if stat is not None:
+        latency = stat.latencyPercentileSeconds(
+            data.hedgePercentile
+            if data.hedgePercentile is not None
+            else HEDGE_PERCENTILE
+        )
+        if latency is not None:
+            return latency
+    return HEDGE_DEFAULT_DELAY_MS / 1000
+
+
+async def queryProvidersHedged(
+    orderedProviders: List[Dict[str, Any]],
+    data: QueryBody,
+    errors: List[OptimodelError],
+) -> Tuple[Dict[str, Any], QueryResponse, bool, float] | None:
+    """
+    Race providers in order. We start with the first one and, if it hasn't answered by
+    its hedge delay, also send the request to the next one (at most HEDGE_MAX_IN_FLIGHT
+    at once). A failure starts the next provider right away, without waiting for the
+    hedge delay. The first success wins and everything still in flight is cancelled
+
+    @return (potentialProvider, response, hedged, hedgeCost) for the winner, or None if
+        every provider failed (errors are appended to errors). hedgeCost is what any
+        losers that finished alongside the winner cost us. Losers we cancelled may still
+        be billed by their provider, we have no usage for them so they aren't included
+    """
+    remaining = list(orderedProviders)
+    inFlight: Dict[asyncio.Task, Dict[str, Any]] = {}
+    hedged = False
+    hedgeCost = 0.0
+    hedgeAt = None
+
+    def startNext():
+        nonlocal hedgeAt
+        potentialProvider = remaining.pop(0)
+        task = asyncio.create_task(
+            attemptProvider(
+                potentialProvider,
+                data,
+                admissionWaitSeconds=0 if remaining else ADMISSION_MAX_WAIT_MS / 1000,
+            )
+        )
+        inFlight[task] = potentialProvider
+        hedgeAt = time.perf_counter() + hedgeDelaySeconds(potentialProvider, data)
+
+    try:
+        while remaining or inFlight:
+            if not inFlight:
+                startNext()
+
+            timeout = None
+            if remaining and len(inFlight) < HEDGE_MAX_IN_FLIGHT:
+                timeout = max(0, hedgeAt - time.perf_counter())
+            done, _ = await asyncio.wait(
+                inFlight.keys(), timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+
+            if not done:
+                logger.info(
+                    f"Hedging query model {data.modelToUse} with {remaining[0]['provider']}"
+                )
+                hedged = True
+                startNext()
+                continue
+
+            winner = None
+            failed = False
+            for task in done:
+                potentialProvider = inFlight.pop(task)
+                error = task.exception()
+                if error is not None:
+                    logger.error(
+                        f"Error with provider {potentialProvider['provider']}: {error}"
+                    )
+                    if not isinstance(error, OptimodelError):
+                        error = OptimodelError(
+                            str(error), provider=potentialProvider["provider"]
+                        )
+                    errors.append(error)
+                    failed = True
+                    continue
+                if winner is None:
+                    winner = (potentialProvider, task.result())
+                else:
+                    hedgeCost += computeCost(potentialProvider, task.result()) or 0
+
+            if winner is not None:
+                return winner[0], winner[1], hedged, hedgeCost
+            if failed and inFlight and remaining and len(inFlight) < HEDGE_MAX_IN_FLIGHT:
+                startNext()
+        return None
+    finally:
+        for task in inFlight:
+            task.cancel()
+
+
+"""
+Identical queries in flight at the same time share one upstream call
+"""
+queryCoalescer = SingleFlight()
+
+
+def coalesceKey(data: QueryBody) -> str | None:
+    """
+    Canonical hash of the request, None if it shouldn't be coalesced (see
+    OPTIMODEL_COALESCE_REQUESTS). userId is only used for tracking, so it's left out
+    """
+    if COALESCE_REQUESTS == "off":
+        return None
+    if COALESCE_REQUESTS != "all" and not (
+        data.temperature == 0 or responseCache.ttlSeconds(data) is not None
+    ):
+        return None
+    return hashlib.sha256(
+        json.dumps(
+            data.dict(exclude={"userId"}),
+            sort_keys=True,
+            separators=(",", ":"),
+            default=str,
+        ).encode("utf-8")
+    ).hexdigest()
+
+
+async def queryModelMain(data: QueryBody, guardClientInstance: GuardClient):
+    key = coalesceKey(data)
+    if key is None:
+        return await queryModelUncoalesced(data, guardClientInstance)
+
+    result, shared = await queryCoalescer.do(
+        key, lambda: queryModelUncoalesced(data, guardClientInstance)
+    )
+    if shared and isinstance(result, dict):
+        """
+        Followers get their own copy (with the same guard results), the cost was already
+        reported on the leader
+        """
+        logger.info(f"Coalesced query for {data.modelToUse}")
+        result = copy.deepcopy(result)
+        result["cost"] = 0
+        result["coalesced"] = True
+    return result
+
+
+async def planQuery(
+    data: QueryBody, guardClientInstance: GuardClient
+) -> Tuple[
+    List[Dict[str, Any]], List[Guards], List[GuardError], MakeQueryResponse | None
+]:
+    """
+    Order the providers for a query and check any preQuery guards, shared by the
+    streaming and non streaming paths
+
+    @return (orderedProviders, postQueryGuards, guardErrors, blockedResponse) where
+        blockedResponse is set if a preQuery guard blocked the request
+    """
+    allAvailableProviders = getAllAvailableProviders(data)
+    """
+    Now its time to just pick the best one based on our criteria
+    """
+    orderedProviders = orderProviders(allAvailableProviders, data)
+
+    """
+    Extract out any guards from the query if present
+    """
+    guards = data.guards
+    logger.info(f"Guards: {guards}")
+
+    """
+    If we have any guards, split them up based on pre vs post query
+    """
+    preQueryGuards = []
+    postQueryGuards = []
+    if guards:
+        for guard in guards:
+            if guard.guardType == "preQuery":
+                preQueryGuards.append(guard)
+            if guard.guardType == "postQuery":
+                postQueryGuards.append(guard)
+
+    finalGuardErrors: List[GuardError] = []
+
+    """
+    Check any preQuery guards once up front, they don't depend on the provider
+    """
+    if preQueryGuards:
+        preQueryGuardErrors, should_return = await check_pre_query_guards(
+            preQueryGuards=preQueryGuards,
+            guardClientInstance=guardClientInstance,
+            messages=data.messages,
+            providerName=orderedProviders[0]["provider"],
+            sessionId=data.sessionId,
+        )
+        if should_return:
+            """
+                Weird edge case where we want to return the guard error
+            @TODO: This is horrible code, refactor it
+            """
+            return (
+                orderedProviders,
+                postQueryGuards,
+                finalGuardErrors,
+                preQueryGuardErrors,
+            )
+
+        if preQueryGuardErrors:
+            finalGuardErrors.extend(preQueryGuardErrors)
+
+    return orderedProviders, postQueryGuards, finalGuardErrors, None
+
+
+async def queryModelUncoalesced(data: QueryBody, guardClientInstance: GuardClient):
+    try:
+        orderedProviders, postQueryGuards, finalGuardErrors, blockedResponse = (
+            await planQuery(data, guardClientInstance)
+        )
+        if blockedResponse is not None:
+            return blockedResponse
 
         """
-        If we have any guards, split them up based on pre vs post query
+        Serve identical requests from the response cache if this one is cacheable
         """
-        preQueryGuards = []
-        postQueryGuards = []
-        if guards:
-            for guard in guards:
-                if guard.guardType == "preQuery":
-                    preQueryGuards.append(guard)
-                if guard.guardType == "postQuery":
-                    postQueryGuards.append(guard)
+        cacheTTLSeconds = responseCache.ttlSeconds(data)
+        cacheKey = None
+        if cacheTTLSeconds is not None:
+            cacheKey = responseCache.buildKey(data)
+            cached = await responseCache.get(cacheKey)
+            if cached is not None:
+                cachedProvider, response = cached
+                logger.info(f"Response cache hit for {data.modelToUse}")
+                queryResponse = await buildQueryResponse(
+                    providerName=cachedProvider,
+                    response=response,
+                    cost=0,
+                    data=data,
+                    guardClientInstance=guardClientInstance,
+                    postQueryGuards=postQueryGuards,
+                    guardErrors=finalGuardErrors,
+                )
+                queryResponse["cacheHit"] = True
+                return queryResponse
 
         """
-        Now attempt the query with each provider in order
+        Then fall back to prompts that are similar enough, if the semantic cache is on
         """
-        errors = []
-        finalGuardErrors: List[GuardError] = []
-        for potentialProvider in orderedProviders:
+        semanticKey = None
+        semanticTTLSeconds = semanticCache.ttlSeconds(data)
+        if semanticTTLSeconds is not None:
             try:
-                providerName = potentialProvider["provider"]
+                semanticHit, semanticKey = await semanticCache.lookup(data)
+            except Exception as e:
+                logger.error(f"Error reading semantic cache: {e}")
+                semanticHit = None
+            if semanticHit is not None:
+                cachedProvider, response, similarity = semanticHit
                 logger.info(
-                    f"Attempting query model {data.modelToUse} with {providerName}..."
+                    f"Semantic cache hit for {data.modelToUse} (similarity {similarity:.3f})"
                 )
+                queryResponse = await buildQueryResponse(
+                    providerName=cachedProvider,
+                    response=response,
+                    cost=0,
+                    data=data,
+                    guardClientInstance=guardClientInstance,
+                    postQueryGuards=postQueryGuards,
+                    guardErrors=finalGuardErrors,
+                )
+                queryResponse["cacheHit"] = True
+                queryResponse["cacheSimilarity"] = similarity
+                return queryResponse
 
-                # If we're in SAAS mode, validate we have credentials
-                if SAAS_MODE is not None:
-                    if data.credentials is None:
-                        raise OptimodelError("No credentials provided")
-
-                """
-                Check if we have any guards
-                """
-                if preQueryGuards:
-                    preQueryGuardErrors, should_return = await check_pre_query_guards(
-                        preQueryGuards=preQueryGuards,
-                        guardClientInstance=guardClientInstance,
-                        messages=data.messages,
-                        providerName=providerName,
-                    )
-                    if should_return:
-                        """
-                            Weird edge case where we want to return the guard error
-                        @TODO: This is horrible code, refactor it
-                        """
-                        return preQueryGuardErrors
-
-                    if preQueryGuardErrors:
-                        finalGuardErrors.extend(preQueryGuardErrors)
-
-                maxGenLen = data.maxGenLen
-
-                try:
-                    params: QueryParams = {
-                        "messages": data.messages,
-                        "model": potentialProvider["name"],
-                        "credentials": data.credentials,
-                        "maxGenLen": maxGenLen,
-                        "jsonMode": data.jsonMode,
-                        "temperature": data.temperature,
-                    }
-                    response = config.providerInstances[providerName].makeQuery(
-                        params=params
-                    )
-                except Exception as e:
-                    logger.error(f"Error making query: {e}")
-                    raise OptimodelError(
-                        f"Error making query: {e}",
-                        provider=providerName,
-                    )
+        async def respond(
+            potentialProvider: Dict[str, Any], response: QueryResponse
+        ) -> MakeQueryResponse:
+            if cacheKey is not None:
+                await responseCache.set(
+                    cacheKey, potentialProvider["provider"], response, cacheTTLSeconds
+                )
+            if semanticKey is not None:
+                semanticCache.set(
+                    semanticKey,
+                    potentialProvider["provider"],
+                    response,
+                    semanticTTLSeconds,
+                )
+            queryResponse = await buildQueryResponse(
+                providerName=potentialProvider["provider"],
+                response=response,
+                cost=computeCost(potentialProvider, response),
+                data=data,
+                guardClientInstance=guardClientInstance,
+                postQueryGuards=postQueryGuards,
+                guardErrors=finalGuardErrors,
+            )
+            if cacheKey is not None or semanticKey is not None:
+                queryResponse["cacheHit"] = False
+            return queryResponse
 
-                if response:
-                    logger.info(f"Query successful with {providerName}")
-                    try:
-                        if response.promptTokens > 128_000 and potentialProvider.get(
-                            "pricePer1MInputAbove125K"
-                        ):
-                            inputCost = response.promptTokens * (
-                                potentialProvider["pricePer1MInputAbove125K"]
-                                / 1_000_000
-                            )
-                        else:
-                            inputCost = response.promptTokens * (
-                                potentialProvider["pricePer1MInput"] / 1_000_000
-                            )
-                        if (
-                            response.generationTokens > 128_000
-                            and potentialProvider.get("pricePer1MOutputAbove125K")
-                        ):
-                            outputCost = response.generationTokens * (
-                                potentialProvider["pricePer1MOutputAbove125K"]
-                                / 1_000_000
-                            )
-                        else:
-                            outputCost = response.generationTokens * (
-                                potentialProvider["pricePer1MOutput"] / 1_000_000
-                            )
-                        cost = inputCost + outputCost
-                        logger.info(
-                            f">>>Cost: {cost}, {json.dumps(potentialProvider, indent=2)}"
-                        )
-                    except Exception as e:
-                        logger.error(f"Error getting cost: {e}")
-                        cost = None
-                    queryResponse: MakeQueryResponse = {
-                        "modelResponse": response.modelOutput,
-                        "promptTokens": response.promptTokens,
-                        "generationTokens": response.generationTokens,
-                        "cost": cost,
-                        "provider": providerName,
-                        "guardErrors": finalGuardErrors,
-                    }
+        errors = []
 
-                    """
-                    Check if we have any guards
-                    """
-                    if postQueryGuards:
-                        postQueryGuardErrors, queryResponse = (
-                            await check_post_query_guards(
-                                postQueryGuards=postQueryGuards,
-                                guardClientInstance=guardClientInstance,
-                                messages=data.messages,
-                                modelOutput=response.modelOutput,
-                                queryResponse=queryResponse,
-                            )
-                        )
-                        if postQueryGuardErrors:
-                            queryResponse["guardErrors"].extend(postQueryGuardErrors)
+        """
+        Hedged requests race providers instead of trying them one after another
+        """
+        if data.hedge is True and len(orderedProviders) > 1:
+            result = await queryProvidersHedged(orderedProviders, data, errors)
+            if result is not None:
+                potentialProvider, response, hedged, hedgeCost = result
+                queryResponse = await respond(potentialProvider, response)
+                queryResponse["hedged"] = hedged
+                queryResponse["hedgeCost"] = hedgeCost
+                return queryResponse
+            orderedProviders = []
 
-                    return queryResponse
+        """
+        Now attempt the query with each provider in order
+        """
+        for index, potentialProvider in enumerate(orderedProviders):
+            providerName = potentialProvider["provider"]
+            try:
+                """
+                Skip straight past providers without room under their rate limits, only
+                wait for one if it's our last option
+                """
+                response = await attemptProvider(
+                    potentialProvider,
+                    data,
+                    admissionWaitSeconds=(
+                        ADMISSION_MAX_WAIT_MS / 1000
+                        if index == len(orderedProviders) - 1
+                        else 0
+                    ),
+                )
+                return await respond(potentialProvider, response)
             except Exception as e:
                 logger.error(f"Error with provider {providerName}: {e}")
                 if isinstance(e, OptimodelError):
@@ -237,15 +708,17 @@ async def check_post_query_guards(
     messages: List[ModelMessage],
     modelOutput: str,
     queryResponse: MakeQueryResponse,
+    sessionId: str | None = None,
 ) -> Tuple[List[GuardError], MakeQueryResponse]:
     guardErrors = []
-    for guard in postQueryGuards:
-        logger.info(f"Checking postQuery guard {guard.guardName}")
-        guardResponse = await guardClientInstance.checkGuard(
-            guards=guard,
-            messages=messages,
-            modelOutput=modelOutput,
-        )
+    guardResults = await evaluateGuards(
+        guards=postQueryGuards,
+        guardClientInstance=guardClientInstance,
+        messages=messages,
+        modelOutput=modelOutput,
+        sessionId=sessionId,
+    )
+    for guard, guardResponse in guardResults:
         if guardResponse["failure"] is True:
             guardErrors.append(
                 GuardError(
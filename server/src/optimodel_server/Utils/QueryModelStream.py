@@ -0,0 +1,390 @@
+import asyncio
+import json
+import logging
+import sys
+import time
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from optimodel_server.Cache import responseCache
+from optimodel_server.Config import config
+from optimodel_server.Config.types import (
+    ADMISSION_MAX_WAIT_MS,
+    SAAS_MODE,
+    STREAM_GUARD_INTERVAL_CHARS,
+    STREAM_GUARD_MODE,
+)
+from optimodel_server.GuardClient import GuardClient
+from optimodel_server.OptimodelError import OptimodelError
+from optimodel_server.Planner.AdmissionControl import (
+    admissionController,
+    estimateTokens,
+)
+from optimodel_server.Planner.CircuitBreaker import (
+    circuitBreakers,
+    isProviderFailure,
+    isProviderOutage,
+)
+from optimodel_server.Planner.ProviderStats import providerStats
+from optimodel_server.Utils.QueryModelMain import computeCost, planQuery
+from optimodel_server.Utils.StreamingGuardMonitor import StreamingGuardMonitor
+from optimodel_types import QueryBody
+from optimodel_types.providerTypes import (
+    MakeQueryResponse,
+    QueryParams,
+    QueryResponse,
+    QueryResponseChunk,
+)
+
+logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def serverSentEvent(event: Dict[str, Any]) -> str:
+    return f"data: {json.dumps(jsonable_encoder(event), separators=(',', ':'))}\n\n"
+
+
+async def streamProvider(
+    potentialProvider: Dict[str, Any],
+    data: QueryBody,
+    admissionWaitSeconds: float = 0,
+) -> AsyncIterator[QueryResponseChunk]:
+    """
+    Streaming version of attemptProvider, records the outcome (including time to first
+    token) in our stats and circuit breakers once the stream is done
+
+    @raises OptimodelError if the provider can't be used or the stream failed
+    """
+    providerName = potentialProvider["provider"]
+    logger.info(f"Attempting stream model {data.modelToUse} with {providerName}...")
+
+    # If we're in SAAS mode, validate we have credentials
+    if SAAS_MODE is not None:
+        if data.credentials is None:
+            raise OptimodelError("No credentials provided")
+
+    ticket = await admissionController.admit(
+        providerName,
+        data.modelToUse,
+        estimateTokens(data.messages, data.maxGenLen),
+        maxWaitSeconds=admissionWaitSeconds,
+    )
+    if ticket is None:
+        raise OptimodelError(
+            "Rate limited, provider has no capacity", provider=providerName
+        )
+
+    actualTokens = None
+    try:
+        if not circuitBreakers.tryAcquire(
+            providerName, data.modelToUse, data.credentials
+        ):
+            raise OptimodelError(
+                "Circuit open, skipping provider", provider=providerName
+            )
+
+        promptTokens = 0
+        generationTokens = 0
+        ttftSeconds = None
+        try:
+            params: QueryParams = {
+                "messages": data.messages,
+                "model": potentialProvider["name"],
+                "credentials": data.credentials,
+                "maxGenLen": data.maxGenLen,
+                "jsonMode": data.jsonMode,
+                "temperature": data.temperature,
+            }
+            startTime = time.perf_counter()
+            async for chunk in config.providerInstances[providerName].makeQueryStream(
+                params=params
+            ):
+                if chunk.promptTokens is not None:
+                    promptTokens = chunk.promptTokens
+                if chunk.generationTokens is not None:
+                    generationTokens = chunk.generationTokens
+                if ttftSeconds is None and chunk.delta:
+                    ttftSeconds = time.perf_counter() - startTime
+                yield chunk
+        except (asyncio.CancelledError, GeneratorExit):
+            """
+            The client went away or a guard stopped the stream, this says nothing about
+            the provider's health
+            """
+            circuitBreakers.release(providerName, data.modelToUse, data.credentials)
+            raise
+        except Exception as e:
+            if isProviderFailure(e):
+                providerStats.recordFailure(data.modelToUse, providerName)
+                circuitBreakers.recordFailure(
+                    providerName,
+                    data.modelToUse,
+                    data.credentials,
+                    outage=isProviderOutage(e),
+                )
+            else:
+                circuitBreakers.release(providerName, data.modelToUse, data.credentials)
+            logger.error(f"Error streaming query: {e}")
+            raise OptimodelError(
+                f"Error streaming query: {e}",
+                provider=providerName,
+            )
+
+        providerStats.recordSuccess(
+            data.modelToUse,
+            providerName,
+            latencySeconds=time.perf_counter() - startTime,
+            generationTokens=generationTokens,
+            ttftSeconds=ttftSeconds,
+        )
+        circuitBreakers.recordSuccess(providerName, data.modelToUse, data.credentials)
+        actualTokens = promptTokens + generationTokens
+    finally:
+        ticket.release(actualTokens)
+
+
+async def openStream(
+    orderedProviders: List[Dict[str, Any]],
+    data: QueryBody,
+    errors: List[OptimodelError],
+) -> Tuple[Dict[str, Any], AsyncIterator[QueryResponseChunk], QueryResponseChunk | None] | None:
+    """
+    Try providers in order until one starts streaming. Until the first chunk arrives we
+    can still fall back to the next provider, after that we're committed
+
+    @return (potentialProvider, stream, firstChunk) or None if every provider failed
+    """
+    for index, potentialProvider in enumerate(orderedProviders):
+        stream = streamProvider(
+            potentialProvider,
+            data,
+            admissionWaitSeconds=(
+                ADMISSION_MAX_WAIT_MS / 1000 if index == len(orderedProviders) - 1 else 0
+            ),
+        )
+        try:
+            return potentialProvider, stream, await stream.__anext__()
+        except StopAsyncIteration:
+            return potentialProvider, stream, None
+        except Exception as e:
+            logger.error(f"Error with provider {potentialProvider['provider']}: {e}")
+            if isinstance(e, OptimodelError):
+                errors.append(e)
+    return None
+
+
+async def queryModelStream(data: QueryBody, guardClientInstance: GuardClient):
+    """
+    Streaming version of queryModelMain. Responds with server sent events, each one a
+    JSON object:
+    {"type": "delta", "delta": str} for every piece of output
+    {"type": "done", ...MakeQueryResponse, "finishReason": str} once the stream is done,
+        with usage, cost and guard results
+    {"type": "error", "error": str} if the provider (or a postQuery guard) failed mid stream
+
+    With blocking postQuery guards in completion mode the output is held back and sent as
+    a single delta once the guards pass (see StreamingGuardMonitor.withholdsOutput).
+
+    Hedging and request coalescing don't apply to streams. Errors before the stream starts
+    are returned as a 503 like queryModelMain
+    """
+    events = await openQueryStream(data, guardClientInstance)
+    if isinstance(events, JSONResponse):
+        return events
+    return StreamingResponse(
+        (serverSentEvent(event) async for event in events),
+        media_type="text/event-stream",
+    )
+
+
+async def openQueryStream(
+    data: QueryBody, guardClientInstance: GuardClient
+) -> AsyncIterator[Dict[str, Any]] | JSONResponse:
+    """
+    Plan the query and start streaming it. Shared by queryModelStream and the proxy
+    routes, which write the same events in their own wire format
+
+    @return the events (see queryModelStream) or a 503 JSONResponse if we couldn't
+        start a stream
+    """
+    try:
+        orderedProviders, postQueryGuards, guardErrors, blockedResponse = (
+            await planQuery(data, guardClientInstance)
+        )
+        if blockedResponse is not None:
+            return singleEvent(
+                {"type": "done", **blockedResponse, "finishReason": "guard"}
+            )
+
+        monitor = StreamingGuardMonitor(
+            postQueryGuards=postQueryGuards,
+            guardClientInstance=guardClientInstance,
+            messages=data.messages,
+            mode=data.streamGuardMode or STREAM_GUARD_MODE,
+            intervalChars=STREAM_GUARD_INTERVAL_CHARS,
+            sessionId=data.sessionId,
+        )
+
+        cacheTTLSeconds = responseCache.ttlSeconds(data)
+        cacheKey = None
+        if cacheTTLSeconds is not None:
+            cacheKey = responseCache.buildKey(data)
+            cached = await responseCache.get(cacheKey)
+            if cached is not None:
+                cachedProvider, response = cached
+                logger.info(f"Response cache hit for {data.modelToUse}")
+                return streamCached(cachedProvider, response, guardErrors, monitor)
+
+        errors = []
+        opened = await openStream(orderedProviders, data, errors)
+        if opened is None:
+            error_messages = [str(e) for e in errors]
+            raise OptimodelError(f"No available provider. Got errors: {error_messages}")
+    except Exception as e:
+        logger.error(f"Error getting all available providers: {e}")
+        if isinstance(e, OptimodelError):
+            return JSONResponse(status_code=503, content={"error": str(e)})
+        else:
+            return JSONResponse(
+                status_code=503,
+                content={
+                    "error": f"Unhandled error. Contact support@lytix.co for help."
+                },
+            )
+
+    potentialProvider, stream, firstChunk = opened
+
+    async def streamEvents():
+        modelOutput = ""
+        promptTokens = 0
+        generationTokens = 0
+        finishReason = None
+        blocked = None
+        try:
+            chunk = firstChunk
+            while chunk is not None:
+                if chunk.promptTokens is not None:
+                    promptTokens = chunk.promptTokens
+                if chunk.generationTokens is not None:
+                    generationTokens = chunk.generationTokens
+                if chunk.finishReason is not None:
+                    finishReason = chunk.finishReason
+                if chunk.delta:
+                    modelOutput += chunk.delta
+                    if not monitor.withholdsOutput:
+                        yield {"type": "delta", "delta": chunk.delta}
+                    monitor.feed(modelOutput)
+
+                blocked = monitor.blocked()
+                if blocked is not None:
+                    logger.info("Postquery guard blocked the stream")
+                    finishReason = "guard"
+                    break
+
+                try:
+                    chunk = await stream.__anext__()
+                except StopAsyncIteration:
+                    chunk = None
+        except Exception as e:
+            logger.error(f"Error streaming from {potentialProvider['provider']}: {e}")
+            yield {"type": "error", "error": str(e)}
+            return
+        finally:
+            await stream.aclose()
+            monitor.close()
+
+        try:
+            postGuardErrors, blockingGuard = blocked or await monitor.finish(
+                modelOutput
+            )
+            if blockingGuard is not None:
+                finishReason = "guard"
+            elif cacheKey is not None:
+                """
+                Only cache output every postQuery guard let through
+                """
+                await responseCache.set(
+                    cacheKey,
+                    potentialProvider["provider"],
+                    QueryResponse(
+                        modelOutput=modelOutput,
+                        promptTokens=promptTokens,
+                        generationTokens=generationTokens,
+                    ),
+                    cacheTTLSeconds,
+                )
+        except Exception as e:
+            """
+            The headers are already sent, so we can only report it as an event
+            """
+            logger.error(
+                f"Error finishing stream from {potentialProvider['provider']}: {e}"
+            )
+            yield {"type": "error", "error": str(e)}
+            return
+
+        if blockingGuard is None and monitor.withholdsOutput and modelOutput:
+            yield {"type": "delta", "delta": modelOutput}
+
+        queryResponse: MakeQueryResponse = {
+            "modelResponse": (
+                (blockingGuard.blockRequestMessage or "")
+                if blockingGuard is not None
+                else modelOutput
+            ),
+            "promptTokens": promptTokens,
+            "generationTokens": generationTokens,
+            "cost": computeCost(
+                potentialProvider,
+                QueryResponse(
+                    modelOutput=modelOutput,
+                    promptTokens=promptTokens,
+                    generationTokens=generationTokens,
+                ),
+            ),
+            "provider": potentialProvider["provider"],
+            "guardErrors": [*guardErrors, *postGuardErrors],
+        }
+        if cacheKey is not None:
+            queryResponse["cacheHit"] = False
+        yield {"type": "done", **queryResponse, "finishReason": finishReason}
+
+    return streamEvents()
+
+
+async def singleEvent(event: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    yield event
+
+
+async def streamCached(
+    providerName: str,
+    response: QueryResponse,
+    guardErrors: list,
+    monitor: StreamingGuardMonitor,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    A cached response is streamed as a single delta
+    """
+    postGuardErrors, blockingGuard = await monitor.finish(response.modelOutput)
+    if blockingGuard is None:
+        yield {"type": "delta", "delta": response.modelOutput}
+    queryResponse: MakeQueryResponse = {
+        "modelResponse": (
+            (blockingGuard.blockRequestMessage or "")
+            if blockingGuard is not None
+            else response.modelOutput
+        ),
+        "promptTokens": response.promptTokens,
+        "generationTokens": response.generationTokens,
+        "cost": 0,
+        "provider": providerName,
+        "guardErrors": [*guardErrors, *postGuardErrors],
+        "cacheHit": True,
+    }
+    yield {
+        "type": "done",
+        **queryResponse,
+        "finishReason": "guard" if blockingGuard is not None else "stop",
+    }
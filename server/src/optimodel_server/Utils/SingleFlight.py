@@ -0,0 +1,52 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one. The first caller (the leader)
+    runs the work, everyone who asks for the same key while it's in flight (followers)
+    waits for and shares its result. Nothing is kept once the call finishes, that's the
+    response cache's job
+
+    The work runs in its own task, so a caller that goes away (e.g. client disconnect)
+    doesn't cancel it for everyone else
+    """
+
+    def __init__(self):
+        self.inFlight: Dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(
+        self, key: Hashable, fn: Callable[[], Awaitable[Any]]
+    ) -> Tuple[Any, bool]:
+        """
+        @return (result, shared) where shared is True if we got another caller's result
+        """
+        task = self.inFlight.get(key)
+        shared = task is not None
+        if task is None:
+            self.leaders += 1
+            task = asyncio.create_task(fn())
+            self.inFlight[key] = task
+            task.add_done_callback(lambda _: self._forget(key, task))
+        else:
+            self.followers += 1
+        return await asyncio.shield(task), shared
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self.inFlight.get(key) is task:
+            del self.inFlight[key]
+        if not task.cancelled():
+            """
+            Mark the exception as retrieved in case every caller went away
+            """
+            task.exception()
+
+    def stats(self) -> dict:
+        return {
+            "inFlight": len(self.inFlight),
+            "leaders": self.leaders,
+            "followers": self.followers,
+        }
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+from typing import List, Literal, Tuple
+
+from optimodel_server.GuardClient import GuardClient
+from optimodel_server.Utils.QueryModelMain import evaluateGuards
+from optimodel_types import Guards, ModelMessage
+from optimodel_types.providerTypes import GuardError
+
+
+logger = logging.getLogger(__name__)
+
+
+class StreamingGuardMonitor:
+    """
+    Runs postQuery guards over a streamed response.
+
+    completion: guards only see the full output once the stream is done
+    incremental: every intervalChars of new output we also check the output so far in the
+        background (one check at a time, the stream never waits on it). A blocking
+        failure stops the stream at the next chunk, output sent before then has already
+        reached the client
+    """
+
+    def __init__(
+        self,
+        postQueryGuards: List[Guards],
+        guardClientInstance: GuardClient,
+        messages: List[ModelMessage],
+        mode: Literal["completion", "incremental"],
+        intervalChars: int,
+        sessionId: str | None = None,
+    ):
+        self.postQueryGuards = postQueryGuards
+        self.guardClientInstance = guardClientInstance
+        self.messages = messages
+        self.mode = mode
+        self.intervalChars = intervalChars
+        self.sessionId = sessionId
+        self.checkedChars = 0
+        self.check: asyncio.Task | None = None
+        self.blockingResult: Tuple[List[GuardError], Guards] | None = None
+
+    @property
+    def withholdsOutput(self) -> bool:
+        """
+        In completion mode a blocking guard only runs once the stream is done, so the
+        output has to be held back until then or there'd be nothing left to block
+        """
+        return self.mode == "completion" and any(
+            guard.blockRequest for guard in self.postQueryGuards
+        )
+
+    def feed(self, outputSoFar: str):
+        """
+        Called with the full output so far after every chunk
+        """
+        if self.mode != "incremental" or not self.postQueryGuards:
+            return
+        self._collectCheck()
+        if (
+            self.check is None
+            and len(outputSoFar) - self.checkedChars >= self.intervalChars
+        ):
+            self.checkedChars = len(outputSoFar)
+            self.check = asyncio.create_task(self._evaluate(outputSoFar))
+
+    def blocked(self) -> Tuple[List[GuardError], Guards] | None:
+        """
+        (guardErrors, blockingGuard) if a background check failed a blocking guard
+        """
+        self._collectCheck()
+        return self.blockingResult
+
+    async def finish(self, output: str) -> Tuple[List[GuardError], Guards | None]:
+        """
+        Check the full output once the stream is done
+
+        @return (guardErrors, blockingGuard)
+        """
+        self.close()
+        if self.blockingResult is not None:
+            return self.blockingResult
+        if not self.postQueryGuards:
+            return [], None
+        return await self._evaluate(output)
+
+    def close(self):
+        if self.check is not None and not self.check.done():
+            self.check.cancel()
+        self.check = None
+
+    def _collectCheck(self):
+        if self.check is None or not self.check.done():
+            return
+        check, self.check = self.check, None
+        if check.cancelled():
+            return
+        if check.exception() is not None:
+            logger.error(f"Error checking streamed output: {check.exception()}")
+            return
+        guardErrors, blockingGuard = check.result()
+        if blockingGuard is not None:
+            self.blockingResult = (guardErrors, blockingGuard)
+
+    async def _evaluate(self, output: str) -> Tuple[List[GuardError], Guards | None]:
+        guardResults = await evaluateGuards(
+            guards=self.postQueryGuards,
+            guardClientInstance=self.guardClientInstance,
+            messages=self.messages,
+            modelOutput=output,
+            sessionId=self.sessionId,
+        )
+        guardErrors = []
+        for guard, guardResponse in guardResults:
+            if guardResponse["failure"] is True:
+                guardErrors.append(
+                    GuardError(
+                        guardName=guard.guardName,
+                        failure=True,
+                        metadata=guardResponse["metadata"],
+                        blockRequest=guard.blockRequest,
+                    )
+                )
+                if guard.blockRequest is True:
+                    return guardErrors, guard
+        return guardErrors, None
@@ -0,0 +1,128 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+class TTLCache:
+    """
+    Small thread safe LRU cache with an optional per-entry TTL
+
+    @param maxSize: Max number of entries before we start evicting the least recently used
+    @param ttlSeconds: Default time to live for an entry, None means entries never expire
+    @param onEvict: Optional callback invoked with (key, value) whenever an entry is evicted,
+        expired or explicitly removed
+    """
+
+    def __init__(
+        self,
+        maxSize: int,
+        ttlSeconds: float | None = None,
+        onEvict: Callable[[Hashable, Any], None] | None = None,
+    ):
+        self.maxSize = maxSize
+        self.ttlSeconds = ttlSeconds
+        self.onEvict = onEvict
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[Hashable, tuple[Any, float | None]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        evicted = None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expiresAt = entry
+            if expiresAt is not None and expiresAt <= time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                evicted = (key, value)
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+        self._evicted([evicted])
+        return default
+
+    def set(self, key: Hashable, value: Any, ttlSeconds: float | None = None):
+        ttl = ttlSeconds if ttlSeconds is not None else self.ttlSeconds
+        expiresAt = time.monotonic() + ttl if ttl is not None else None
+        evicted = []
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None and previous[0] is not value:
+                evicted.append((key, previous[0]))
+            self._entries[key] = (value, expiresAt)
+            while len(self._entries) > self.maxSize:
+                oldKey, (oldValue, _) = self._entries.popitem(last=False)
+                evicted.append((oldKey, oldValue))
+        self._evicted(evicted)
+
+    def getOrCreate(
+        self, key: Hashable, factory: Callable[[], Any], ttlSeconds: float | None = None
+    ) -> Any:
+        """
+        Return the cached value for key, creating (and caching) it with factory on a miss.
+        If another thread raced us and cached a value first, theirs wins and ours is dropped
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        created = factory()
+        ttl = ttlSeconds if ttlSeconds is not None else self.ttlSeconds
+        evicted = []
+        with self._lock:
+            now = time.monotonic()
+            entry = self._entries.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > now):
+                self._entries.move_to_end(key)
+                return entry[0]
+            self._entries[key] = (created, now + ttl if ttl is not None else None)
+            self._entries.move_to_end(key)
+            if entry is not None:
+                evicted.append((key, entry[0]))
+            while len(self._entries) > self.maxSize:
+                oldKey, (oldValue, _) = self._entries.popitem(last=False)
+                evicted.append((oldKey, oldValue))
+        self._evicted(evicted)
+        return created
+
+    def pop(self, key: Hashable) -> Any:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        self._evicted([(key, entry[0])])
+        return entry[0]
+
+    def clear(self):
+        with self._lock:
+            evicted = [(key, value) for key, (value, _) in self._entries.items()]
+            self._entries.clear()
+        self._evicted(evicted)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "maxSize": self.maxSize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _evicted(self, evicted: list):
+        """
+        Callbacks are run outside of the lock so they can do slow work (e.g. closing clients)
+        """
+        for key, value in evicted:
+            self.evictions += 1
+            if self.onEvict is not None:
+                self.onEvict(key, value)
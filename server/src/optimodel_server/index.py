@@ -1,15 +1,29 @@
 from typing import List
 from fastapi import FastAPI, Request
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 
-from optimodel_server.GuardClient import GuardClient
+from optimodel_server.Cache import responseCache, semanticCache
+from optimodel_server.GuardClient import guardClientInstance
 from optimodel_server.OptimodelError import OptimodelError, OptimodelGuardError
 from optimodel_server.Config import config
-from optimodel_server.Planner import getAllAvailableProviders, orderProviders
-from optimodel_server.Utils.QueryModelMain import queryModelMain
+from optimodel_server.Planner import (
+    admissionController,
+    circuitBreakers,
+    getAllAvailableProviders,
+    orderProviders,
+    providerStats,
+)
+from optimodel_server.Utils.QueryModelMain import queryCoalescer, queryModelMain
+from optimodel_server.Utils.QueryModelStream import queryModelStream
 from optimodel_types import QueryBody
-from optimodel_server.Config.types import SAAS_MODE
+from optimodel_server.Config.types import (
+    BATCH_CONCURRENCY,
+    BATCH_MAX_CONCURRENCY,
+    SAAS_MODE,
+)
+from optimodel_server.Utils.BatchJobs import batchJobStore, runBatch, spoolUpload
+from optimodel_server.Utils.HTTPClientPool import httpClientPool
 from optimodel_types.providerTypes import (
     MakeQueryResponse,
     QueryParams,
@@ -42,12 +56,17 @@ app.include_router(geminiRouter, prefix="/proxy/v1/gemini", tags=["proxy"])
 
 baseURL = "/optimodel/api/v1"
 
-guardClientInstance = GuardClient(config.guardServerURL)
-
 
 @app.on_event("startup")
 async def startup_event():
     logger.info(f"🌐 Starting Optimodel Server...")
+    await guardClientInstance.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await guardClientInstance.close()
+    await httpClientPool.close()
 
 
 @app.exception_handler(RequestValidationError)
@@ -62,12 +81,47 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
 async def read_root(data: QueryBody):
     """
     Now its time to decide what model to use, first lets get a list of available
-    providers
+    providers. Set stream to get the output back as server sent events
     """
+    if data.stream:
+        return await queryModelStream(data, guardClientInstance)
     response = await queryModelMain(data, guardClientInstance)
     return response
 
 
+@app.post(f"{baseURL}/batch")
+async def batchQuery(
+    request: Request, jobId: str | None = None, concurrency: int | None = None
+):
+    """
+    Run a JSONL body of QueryBody items, streaming NDJSON results back as they finish.
+    Pass the jobId from the x-optimodel-batch-job-id header (and the same body) to resume
+    a job, items that already succeeded are replayed instead of queried again
+    """
+    job = batchJobStore.getOrCreate(jobId)
+    if job.running:
+        return JSONResponse(
+            status_code=409, content={"error": f"Batch job {job.jobId} is running"}
+        )
+    concurrency = min(max(1, concurrency or BATCH_CONCURRENCY), BATCH_MAX_CONCURRENCY)
+    upload = await spoolUpload(request.stream())
+    return StreamingResponse(
+        runBatch(job, upload, guardClientInstance, concurrency),
+        media_type="application/x-ndjson",
+        headers={"x-optimodel-batch-job-id": job.jobId},
+    )
+
+
+@app.get(f"{baseURL}/batch/{{jobId}}")
+async def getBatchJob(jobId: str):
+    job = batchJobStore.get(jobId)
+    if job is None:
+        return JSONResponse(
+            status_code=404, content={"error": f"Batch job {jobId} not found"}
+        )
+    return job.toDict()
+
+
 @app.get(f"{baseURL}/list-models")
 async def listModels():
     return {"models": config.modelToProvider}
@@ -75,4 +129,15 @@ async def listModels():
 
 @app.get(f"{baseURL}/health")
 async def getHealth():
-    return {"status": "ok"}
+    return {
+        "status": "ok",
+        "guardClientCache": guardClientInstance.stats(),
+        "providerStats": providerStats.snapshot(),
+        "circuitBreakers": circuitBreakers.snapshot(),
+        "admissionControl": admissionController.snapshot(),
+        "responseCache": responseCache.stats(),
+        "semanticCache": semanticCache.stats(),
+        "coalescedQueries": queryCoalescer.stats(),
+        "batchJobs": batchJobStore.stats(),
+        "httpClientPool": httpClientPool.stats(),
+    }
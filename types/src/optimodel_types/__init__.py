@@ -78,6 +78,25 @@ class SpeedPriority(enum.Enum):
     high = "high"
 
 
+class RoutingObjective(enum.Enum):
+    """
+    How to order providers for a model.
+    static: by the speed/price in our config (see SpeedPriority)
+    latency: lowest average (EWMA) latency we've observed
+    p95Latency: lowest p95 latency over our recent window
+    ttft: lowest average time to first token
+    throughput: highest average generated tokens per second
+    costUnderSLO: cheapest provider whose p95 latency is within latencySLOMs
+    """
+
+    static = "static"
+    latency = "latency"
+    p95Latency = "p95Latency"
+    ttft = "ttft"
+    throughput = "throughput"
+    costUnderSLO = "costUnderSLO"
+
+
 class ModelImageMessageSource(BaseModel):
     type: str
     mediaType: str
@@ -164,10 +183,35 @@ class LLamaPromptGuardConfig(GuardQueryBase):
     jailbreakThreshold: float | None = None
     injectionThreshold: float | None = None
 
+    """
+    If set, score each message over overlapping windows of the model's max length (instead
+    of truncating everything past it) and take the max score per label
+    """
+    chunking: bool = False
+    chunkOverlap: int | None = None
+
+    """
+    Only score messages we haven't already scored in this session (needs a sessionId),
+    previously scored messages reuse their scores. Implies chunking
+    """
+    onlyNewMessages: bool = False
+
+
+class LytixRegexPattern(BaseModel):
+    name: str
+    regex: str
+    ignoreCase: bool = False
+
 
 class LytixRegexConfig(GuardQueryBase):
     guardName: Literal["LYTIX_REGEX_GUARD"]
-    regex: str
+    regex: str | None = None
+
+    """
+    Check several named patterns in a single pass over the text, every pattern that
+    matches is returned in the metadata
+    """
+    patterns: list[LytixRegexPattern] | None = None
 
 
 class MicrosoftPresidioConfig(GuardQueryBase):
@@ -191,6 +235,50 @@ class QueryBody(BaseModel):
     """
     provider: Providers | None = None
 
+    """
+    Optionally skip these providers, e.g. one that just rate limited us
+    """
+    excludeProviders: list[Providers] | None = None
+
+    """
+    Optionally order providers by what we've observed from recent traffic instead of our
+    static config, defaults to OPTIMODEL_ROUTING_OBJECTIVE on the server.
+    latencySLOMs is only used by the costUnderSLO objective
+    """
+    routingObjective: RoutingObjective | None = None
+    latencySLOMs: int | None = None
+
+    """
+    Optionally hedge the request for tail latency. If a provider hasn't answered within
+    hedgeDelayMs (or, if not set, the hedgePercentile of its observed latency) we also
+    send the request to the next provider, the first to answer wins
+    """
+    hedge: bool | None = None
+    hedgeDelayMs: int | None = None
+    hedgePercentile: float | None = None
+
+    """
+    Optionally cache the response for this many seconds, identical requests within that
+    time are answered from the cache
+    """
+    cacheTTL: int | None = None
+
+    """
+    Set to False to skip the semantic cache (similar, not just identical, prompts) for
+    this request
+    """
+    semanticCache: bool | None = None
+
+    """
+    Optionally stream the response back as server sent events. streamGuardMode sets when
+    postQuery guards run: completion checks the full output before the final event (and
+    holds the output back until then if any of them blocks), incremental also checks the
+    output so far as it streams and stops the stream on a blocking failure, but output
+    sent before that check can't be withheld
+    """
+    stream: bool | None = None
+    streamGuardMode: Literal["completion", "incremental"] | None = None
+
     """
     Optionally set a list of guards to check 
     """
@@ -214,6 +302,7 @@ class GuardBody(BaseModel):
     messages: list[ModelMessage]
     modelOutput: str | None = None
     guard: Guards
+    sessionId: str | None = None
 
 
 class GuardResponse(BaseModel):
@@ -230,3 +319,35 @@ class GuardResponse(BaseModel):
     Metadata associated with the failure
     """
     metadata: Dict[str, Any] | None = {}
+
+
+class GuardBatchBody(BaseModel):
+    """
+    Check several guards (pre and/or post query) against a single message payload
+    """
+
+    messages: list[ModelMessage]
+    modelOutput: str | None = None
+    guards: list[Guards]
+    sessionId: str | None = None
+
+
+class GuardWarmupBody(BaseModel):
+    """
+    Load (and run once) the given guards on the guard server, or all of them if none are
+    passed
+    """
+
+    guards: list[str] | None = None
+
+
+class GuardBatchResponse(BaseModel):
+    """
+    Response from the batch guard endpoint
+    """
+
+    """
+    One result per guard, in the same order as the request. We stop after the first
+    failing guard that blocks the request, so this can be shorter than the guards passed
+    """
+    results: list[GuardResponse]
@@ -17,6 +17,30 @@ class QueryResponse:
     generationTokens: int
 
 
+class QueryResponseChunk:
+    """
+    A piece of a streamed response from the provider. Token usage is only set on the
+    chunk(s) that carry it, usually the last one
+    """
+
+    def __init__(
+        self,
+        delta: str = "",
+        promptTokens: int | None = None,
+        generationTokens: int | None = None,
+        finishReason: str | None = None,
+    ):
+        self.delta = delta
+        self.promptTokens = promptTokens
+        self.generationTokens = generationTokens
+        self.finishReason = finishReason
+
+    delta: str
+    promptTokens: int | None
+    generationTokens: int | None
+    finishReason: str | None
+
+
 class GuardError(TypedDict):
     guardName: str
     failure: bool
@@ -24,11 +48,7 @@ class GuardError(TypedDict):
     blockRequest: bool
 
 
-class MakeQueryResponse(TypedDict):
-    """
-    Response from a query to the provider
-    """
-
+class MakeQueryResponseBase(TypedDict):
     modelResponse: str
     promptTokens: int
     generationTokens: int
@@ -37,6 +57,37 @@ class MakeQueryResponse(TypedDict):
     guardErrors: List[GuardError]
 
 
+class MakeQueryResponse(MakeQueryResponseBase, total=False):
+    """
+    Response from a query to the provider
+    """
+
+    """
+    Only set for hedged requests. hedged is whether we actually raced a second provider,
+    hedgeCost is the cost of any losing requests that finished before we could cancel
+    them (already not included in cost)
+    """
+    hedged: bool
+    hedgeCost: float
+
+    """
+    Set when the response was served from the response cache (cost is 0)
+    """
+    cacheHit: bool
+
+    """
+    Set when the response came from the semantic cache, how similar (0-1) the cached
+    prompt was
+    """
+    cacheSimilarity: float
+
+    """
+    Set when we shared the result of an identical request that was already in flight,
+    the cost is only reported on that request (cost is 0 here)
+    """
+    coalesced: bool
+
+
 class QueryParams(TypedDict, total=False):
     messages: List[ModelMessage]
     model: ModelTypes